@@ -0,0 +1,40 @@
+import time
+
+TAX_INTERVAL_SECONDS = 86400  # 24 hours
+TAX_KEEP_RATE = 0.97  # 3% of the bank balance is burned every period
+
+
+def taxed_balance(bank_balance: int, periods: int) -> int:
+    """Bank balance after `periods` whole tax periods.
+
+    Compounded in one step and truncated once, like the old daily sweep
+    (`int(bank * 0.97 ** days_passed)`), so the numbers match it exactly.
+    """
+    if bank_balance <= 0 or periods <= 0:
+        return bank_balance
+    return int(bank_balance * (TAX_KEEP_RATE ** periods))
+
+
+def apply_bank_tax(wallet: dict, now=None) -> bool:
+    """Charges any tax owed since `last_taxed`. Returns True if the wallet changed."""
+    if now is None:
+        now = int(time.time())
+    last_taxed = wallet.get("last_taxed", 0)
+    periods = (now - last_taxed) // TAX_INTERVAL_SECONDS
+    if periods <= 0:
+        return False
+
+    bank_balance = wallet.get("bank", 0)
+    if bank_balance > 0:
+        wallet["bank"] = taxed_balance(bank_balance, periods)
+
+    # Move the last taxed time to the end of the last full period
+    wallet["last_taxed"] = last_taxed + (periods * TAX_INTERVAL_SECONDS)
+    return True
+
+
+def next_tax_at(wallet: dict):
+    """When the next read will charge tax (None if nothing would change)."""
+    if wallet.get("bank", 0) <= 0:
+        return None
+    return wallet.get("last_taxed", 0) + TAX_INTERVAL_SECONDS
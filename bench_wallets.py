@@ -0,0 +1,290 @@
+"""Benchmarks for wallet operations, commands and background loops.
+
+Runs the real AllCommands cog against a local Replit DB stand-in server
+(with optional simulated latency per request) and a minimal fake Discord
+context, seeded with N synthetic wallets.
+
+    python bench_wallets.py --sizes 1000 10000 100000 --latency 0.002 \
+        --output bench_results.json
+
+Results are written as JSON so runs from different commits can be diffed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+from replit_db_server import ReplitDBServer
+
+# --- Local Replit DB ---
+# The bot talks to the stand-in over real HTTP (see replit_db_server.py),
+# so connection pooling and request counts are measured as they would be.
+
+
+async def start_db(latency: float) -> ReplitDBServer:
+    server = ReplitDBServer(latency)
+    os.environ["REPLIT_DB_URL"] = await server.start()
+    os.environ["WALLET_BACKEND"] = "replit"
+    return server
+
+
+# --- Minimal Discord stand-ins ---
+
+
+class FakeUser:
+
+    def __init__(self, user_id: int, guild=None):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.nick = None
+        self.bot = False
+        self.guild = guild
+        self.roles = []
+        self._roles = []
+        self.mention = f"<@{user_id}>"
+
+    def get_role(self, role_id):
+        return None
+
+    async def edit(self, **fields):
+        self.nick = fields.get("nick", self.nick)
+
+    async def add_roles(self, *roles):
+        self.roles.extend(roles)
+
+    async def send(self, *args, **kwargs):
+        pass
+
+
+class FakeGuild:
+
+    def __init__(self, guild_id: int = 1):
+        self.id = guild_id
+        self.members = {}
+        self.chunked = True  # every member is cached (the default mode)
+
+    def get_role(self, role_id):
+        # Every shop role exists, so !buy gets as far as add_roles
+        return types.SimpleNamespace(id=role_id)
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+
+class FakeBot:
+
+    def __init__(self, guild: FakeGuild):
+        self.guilds = [guild]
+        self.users = []
+        self.user = FakeUser(0)
+        self.latency = 0.05
+        self.command_prefix = "!"
+
+    def get_user(self, user_id):
+        return None
+
+    def get_channel(self, channel_id):
+        return None
+
+    def get_guild(self, guild_id):
+        return next((g for g in self.guilds if g.id == guild_id), None)
+
+    async def fetch_user(self, user_id):
+        return FakeUser(user_id)
+
+    def is_ready(self):
+        return True
+
+    def is_closed(self):
+        return False
+
+
+class FakeContext:
+    """Just enough of commands.Context for the cog's command bodies."""
+
+    def __init__(self, author: FakeUser, guild: FakeGuild):
+        self.author = author
+        self.guild = guild
+        self.channel = types.SimpleNamespace(id=1)
+        self.prefix = "!"
+        self.sent = 0
+
+    async def send(self, *args, **kwargs):
+        self.sent += 1
+        return types.SimpleNamespace(id=random.getrandbits(63),
+                                     add_reaction=_noop)
+
+
+async def _noop(*args, **kwargs):
+    pass
+
+
+# --- Benchmark ---
+
+
+def seed_wallets(db: ReplitDBServer, count: int, now: int):
+    from wallet_codec import WALLET_FIELDS, encode_wallet
+    from wallet_store import ReplitWalletStore
+
+    db.data.clear()
+    rng = random.Random(count)
+    for user_id in range(1, count + 1):
+        wallet = {name: rng.randint(0, 50) for name in WALLET_FIELDS}
+        # Enough for most users to buy the cheaper shop roles
+        wallet["cookie"] = rng.randint(0, 500)
+        wallet["bank"] = rng.randint(0, 5000)
+        wallet["last_taxed"] = now - rng.randint(0, 3 * 86400)
+        if user_id % 100 == 0:
+            wallet["nick_emoji"] = "☕"
+            wallet["nick_expires"] = now - 1
+        # Write straight into the server (seeding is not part of the benchmark)
+        db.data[str(user_id)] = ReplitWalletStore.encode_value(encode_wallet(wallet))
+
+
+def summarize(samples: list, calls: int) -> dict:
+    samples_ms = sorted(sample * 1000 for sample in samples)
+    return {
+        "iterations": len(samples_ms),
+        "mean_ms": round(statistics.fmean(samples_ms), 4),
+        "p50_ms": round(samples_ms[len(samples_ms) // 2], 4),
+        "p95_ms": round(samples_ms[int(len(samples_ms) * 0.95) - 1], 4),
+        "backend_calls_per_op": round(calls / len(samples_ms), 3),
+    }
+
+
+async def timed(db: ReplitDBServer, coro_factory, iterations: int) -> dict:
+    samples = []
+    calls_before = db.requests
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await coro_factory()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples, db.requests - calls_before)
+
+
+async def run_size(db: ReplitDBServer, size: int, iterations: int) -> dict:
+    now = int(time.time())
+    seed_wallets(db, size, now)
+
+    import bot_commands
+    import ledger
+
+    # A fresh ledger per run, so nothing is "recovered" from the last one
+    ledger.LEDGER_DIR = tempfile.mkdtemp(prefix="bench-ledger-")
+
+    guild = FakeGuild()
+    bot = FakeBot(guild)
+    cog = bot_commands.AllCommands(bot)
+
+    rng = random.Random(size)
+
+    def random_ctx():
+        user_id = rng.randint(1, size)
+        member = guild.members.get(user_id) or FakeUser(user_id, guild)
+        guild.members[user_id] = member
+        return FakeContext(member, guild)
+
+    def random_member():
+        return random_ctx().author
+
+    result = {"commands": {}, "loops": {}}
+
+    start_calls = db.requests
+    start = time.perf_counter()
+    await cog.cog_load()
+    # cog_load started the background loops; they are timed explicitly below
+    for loop in (cog.tax_loop, cog.temp_nick_task, cog.flush_loop,
+                 cog.drop_sweep_loop, cog.ledger_snapshot_loop):
+        loop.cancel()
+    await cog._load_nick_index()
+    result["loops"]["startup"] = summarize([time.perf_counter() - start],
+                                           db.requests - start_calls)
+
+    commands = {
+        "balance": lambda: cog.balance.callback(cog, random_ctx()),
+        "bank": lambda: cog.bank.callback(cog, random_ctx()),
+        "check_status": lambda: cog.check_status.callback(cog, random_ctx()),
+        "daily": lambda: cog.daily.callback(cog, random_ctx()),
+        "slots": lambda: cog.slots.callback(cog, random_ctx()),
+        "dice": lambda: cog.dice.callback(cog, random_ctx(), 1),
+        "deposit": lambda: cog.deposit.callback(cog, random_ctx(), 10),
+        "withdraw": lambda: cog.withdraw.callback(cog, random_ctx(), 5),
+        "give": lambda: cog.give.callback(cog, random_ctx(), random_member(), 1),
+        "steal": lambda: cog.steal.callback(cog, random_ctx(), random_member(), 1),
+        "leaderboard": lambda: cog.leaderboard.callback(cog, random_ctx(), 10),
+        "shop": lambda: cog.shop.callback(cog, random_ctx()),
+        "buy_item": lambda: cog.buy.callback(cog, random_ctx(), item_key="coffee"),
+        "buy_role": lambda: cog.buy.callback(cog, random_ctx(), item_key="bronze"),
+        "sell": lambda: cog.sell.callback(cog, random_ctx(), "coffee", 1),
+        "use": lambda: cog.use.callback(cog, random_ctx(), "coffee"),
+        "award": lambda: cog.award.callback(cog, random_ctx(), random_member(), 5,
+                                            "cookie"),
+        "economy": lambda: cog.economy.callback(cog, random_ctx()),
+        "daily_cooldown_check": lambda: cog.daily_cooldown.reserve(
+            str(rng.randint(1, size))),
+    }
+    for name, factory in commands.items():
+        result["commands"][name] = await timed(db, factory, iterations)
+
+    result["loops"]["flush"] = await timed(db, lambda: cog.flush_loop.coro(cog), 1)
+    result["loops"]["temp_nick_task"] = await timed(
+        db, lambda: cog.temp_nick_task.coro(cog), 1)
+    result["loops"]["tax_loop"] = await timed(db, lambda: cog.tax_loop.coro(cog), 1)
+
+    await cog.cog_unload()
+    shutil.rmtree(ledger.LEDGER_DIR, ignore_errors=True)
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL,
+                                       text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args):
+    report = {
+        "meta": {
+            "commit": git_revision(),
+            "latency_s": args.latency,
+            "iterations": args.iterations,
+            "python": sys.version.split()[0],
+            "timestamp": int(time.time()),
+        },
+        "results": {},
+    }
+    db = await start_db(args.latency)
+    try:
+        for size in args.sizes:
+            print(f"Benchmarking {size} users...")
+            report["results"][str(size)] = await run_size(db, size, args.iterations)
+    finally:
+        await db.stop()
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1000, 10000, 100000])
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="simulated seconds per Replit DB request")
+    parser.add_argument("--iterations", type=int, default=200,
+                        help="runs per command")
+    parser.add_argument("--output", default="bench_results.json")
+    asyncio.run(main(parser.parse_args()))
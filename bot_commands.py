@@ -1,17 +1,56 @@
 import discord
-import json
+import asyncio
+import logging
+import os
 import random
 import math
 import time
 from discord.ext import commands, tasks
 from typing import Optional
-from replit import db
 
 # Import all our config and helper functions
-from bot_config import (get_wallet, CURRENCIES, CURRENCY_EMOJIS, item_shop,
-                        shop_items, CURRENCY_VALUES, TEMPORARY_ITEMS)
-
-TAX_INTERVAL_SECONDS = 86400  # 24 hours
+from bot_config import CURRENCIES, CURRENCY_EMOJIS, CURRENCY_VALUES
+from wallet_store import (WALLET_FLUSH_SECONDS, make_backend, make_wallet_store,
+                          run_blocking)
+from expiry_index import NICK_EXPIRY_KEY, ExpiryIndex
+from bank_tax import TAX_INTERVAL_SECONDS, apply_bank_tax, next_tax_at
+from tax_engine import TaxEngine
+from leaderboard_index import LeaderboardIndex
+from economy_stats import COLUMNS, EconomySnapshot
+from name_resolver import NameResolver
+from drop_registry import DROPS_KEY, DropRegistry
+from drop_scheduler import DropScheduler
+from cooldowns import PersistentCooldown, persistent_cooldown
+import metrics
+from metrics import InstrumentedBackend, timed_loop
+from sweeps import Sweep
+from shop_catalog import ShopCatalog
+from role_index import ROLE_CACHE_SIZE, RoleEmojiIndex
+from nick_reverter import RETRY, NickReverter, RevertJob
+from member_cache import LOW_MEMORY_MODE, LazyMember, MemberResolver
+from shared_state import make_shared_state
+from ledger import LEDGER_ENABLED, LEDGER_SNAPSHOT_SECONDS, Ledger
+from view_cache import VIEW_CACHE_SIZE, ViewCache
+import sharding
+
+# Set TAX_COMPACTION=0 to skip the daily tax write-back pass
+TAX_COMPACTION_ENABLED = os.environ.get('TAX_COMPACTION', '1') == '1'
+
+DAILY_COOLDOWN_SECONDS = 86400  # 24 hours
+# Sharded: other processes' wallet writes reach the leaderboard this often
+# (one process scans the wallets and publishes them, see below)
+LEADERBOARD_REFRESH_SECONDS = int(os.environ.get('LEADERBOARD_REFRESH_SECONDS', 300))
+LEADERBOARD_REFRESH_KEY = "leaderboard:refresh"
+LEADERBOARD_BALANCES_KEY = "leaderboard:balances"
+# A nickname revert that keeps failing is tried again after this long
+NICK_REVERT_RETRY_SECONDS = int(os.environ.get('NICK_REVERT_RETRY_SECONDS', 300))
+
+# One logger per subsystem so levels can be set separately (see logging_setup.py)
+log = logging.getLogger("bot")
+tax_log = logging.getLogger("bot.tax")
+nick_log = logging.getLogger("bot.nick")
+drop_log = logging.getLogger("bot.drops")
+storage_log = logging.getLogger("bot.storage")
 
 
 # This is a "Cog" - a class that holds a group of commands
@@ -19,152 +58,398 @@ class AllCommands(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self.active_drops = set()
-        self.admin_drops = {}
 
-        self.tax_loop.start()
+        # Drop claims, cooldowns and wallet locks that every shard process
+        # agrees on (see shared_state.py and sharding.py)
+        self.sharded = sharding.is_sharded()
+        self.shared = make_shared_state()
+        shared = self.shared if self.sharded else None
+
+        # All wallet reads/writes go through this cache (see wallet_store.py);
+        # backend calls are counted per command for /metrics
+        self.store = make_wallet_store(InstrumentedBackend(make_backend()), shared)
+
+        # Every balance change is also appended to the ledger (see ledger.py).
+        # Its sequence numbers are per process, so it is off when sharded.
+        self.ledger = Ledger() if LEDGER_ENABLED and not self.sharded else None
+        if self.ledger is not None:
+            self.store.change_hooks.append(self.ledger.record_changes)
+        self._register_gauges()
+
+        # Open cookie drops (random and admin), persisted to the backend
+        # (each process keeps its own guilds' drops; claims go through `shared`)
+        self.drops = DropRegistry(self.store.backend,
+                                  DROPS_KEY + sharding.process_tag(), shared=shared)
+        self.drop_scheduler = DropScheduler()
+
+        # !daily cooldown, saved as wallet["daily_next"] so restarts keep it
+        self.daily_cooldown = PersistentCooldown(self.store, "daily_next",
+                                                 DAILY_COOLDOWN_SECONDS,
+                                                 shared=shared)
+        # Bank tax is charged on read instead of by a full-table sweep
+        self.store.read_hooks.append(apply_bank_tax)
+
+        # Pending temporary nicknames, ordered by expiry (see expiry_index.py)
+        # (nicknames are per guild, so each process has its own index)
+        self.nick_index = ExpiryIndex(self.store.backend,
+                                      NICK_EXPIRY_KEY + sharding.process_tag())
+        self.nick_index_loaded = False
+        self.nick_index_lock = asyncio.Lock()
+        self.nick_sweep_resumed = False
+
+        # Sorted net worth of every user, kept up to date on each wallet write
+        self.leaderboard_index = LeaderboardIndex()
+        self.store.write_hooks.append(self.leaderboard_index.update)
+        # Sharded: when the balances last published by a refresh were taken
+        self.balances_published_at = 0
+        # Every wallet's balances as columns, for !economy and /economy
+        self.economy_snapshot = EconomySnapshot()
+        self.store.write_hooks.append(self.economy_snapshot.update)
+
+        # Rendered !bank / !balance / !check_status views, dropped on every
+        # write to the user's wallet. Sharded: other processes' writes would
+        # not drop them, so it is off
+        self.view_cache = ViewCache(0 if self.sharded else VIEW_CACHE_SIZE)
+        self.store.write_hooks.append(self.view_cache.wallet_changed)
+
+        # Shop lookups and pre-rendered !shop pages (see shop_catalog.py)
+        self.catalog = ShopCatalog()
+        # Shop role -> nickname emoji, and nickname prefix tables
+        # (without the member cache there is no on_member_update to clear
+        # a cached emoji, so it is worked out every time)
+        self.role_index = RoleEmojiIndex(self.catalog,
+                                         0 if LOW_MEMORY_MODE else ROLE_CACHE_SIZE)
+
+        # Members for commands and nickname tasks (see member_cache.py)
+        self.member_resolver = MemberResolver(bot)
+        # Expired nicknames are reverted in bulk, grouped by guild
+        self.nick_reverter = NickReverter(bot, self._reverted_nick,
+                                          self.member_resolver.get)
+
+        # User ID -> name lookups and the last rendered leaderboard
+        self.name_resolver = NameResolver(bot)
+        self.leaderboard_embed_cache = None  # (top entries, embed)
+
+    async def cog_load(self):
+        token = metrics.current_scope.set("startup")
+        try:
+            # Changes a crash kept from reaching the backend
+            if self.ledger is not None:
+                await self.ledger.recover(self.store)
+
+            # Drops created before a restart/reload can still be claimed
+            await self.drops.load()
+            drop_log.info("Restored %d open cookie drop(s).", len(self.drops))
+
+            # Build the leaderboard index once; after this it is updated in place
+            wallets = [item async for item in self.store.iter_wallets()]
+            self.leaderboard_index.rebuild(wallets)
+            log.info("Leaderboard index built (%d users).", len(self.leaderboard_index))
+            self.economy_snapshot.rebuild(wallets)
+        finally:
+            metrics.current_scope.reset(token)
+
+        # Only now: a loop writing wallets during recovery could be overwritten
+        self._start_loops()
+
+    def _start_loops(self):
+        # Sharded: tax is still charged on every read, but the write-back
+        # pass would need a cross-process lock per idle wallet, so it is off
+        if TAX_COMPACTION_ENABLED and not self.sharded:
+            self.tax_loop.start()
+        if self.sharded:
+            self.leaderboard_refresh_loop.start()
         self.temp_nick_task.start()
+        self.flush_loop.start()
+        self.drop_sweep_loop.start()
+        if self.ledger is not None:
+            self.ledger_snapshot_loop.start()
 
     # [مهم] يجب أن تكون async لكي تتمكن من إيقاف المهام الخلفية بشكل صحيح
     async def cog_unload(self):
         self.tax_loop.cancel()
         self.temp_nick_task.cancel()
-        print("Tax and Nickname loops cancelled.")
+        self.flush_loop.cancel()
+        self.drop_sweep_loop.cancel()
+        self.leaderboard_refresh_loop.cancel()
+        self.ledger_snapshot_loop.cancel()
+        log.info("Tax and Nickname loops cancelled.")
+
+        for name in self._gauge_names:
+            metrics.REGISTRY.remove(name)
+
+        # Write any cached changes before the cog goes away
+        flushed = await self.store.flush()
+        storage_log.info("Flushed %d wallet(s) to storage.", flushed)
+        await self.store.close()
+        await self.shared.close()
+        if self.ledger is not None:
+            # Nothing may append once the mapped segment is closed
+            self.store.change_hooks.remove(self.ledger.record_changes)
+            self.ledger.close()
+
+    # --- [NEW] Metrics (see metrics.py, served at /metrics) ---
+    async def cog_before_invoke(self, ctx):
+        metrics.command_started(ctx)
+
+    async def cog_after_invoke(self, ctx):
+        metrics.command_finished(ctx)
+
+    def _register_gauges(self):
+        gauges = {
+            "bot_wallet_cache_size": ("Wallets held in the cache.",
+                                      lambda: len(self.store._cache), "gauge"),
+            "bot_wallet_cache_dirty": ("Wallets waiting for the next flush.",
+                                       lambda: self.store.dirty_count, "gauge"),
+            "bot_wallet_cache_hits_total": ("Wallet reads served from the cache.",
+                                            lambda: self.store.hits, "counter"),
+            "bot_wallet_cache_misses_total": ("Wallet reads that went to the backend.",
+                                              lambda: self.store.misses, "counter"),
+            "bot_open_drops": ("Unclaimed cookie drops.",
+                               lambda: len(self.drops), "gauge"),
+            "bot_pending_nick_expiries": ("Temporary nicknames waiting to expire.",
+                                          lambda: len(self.nick_index), "gauge"),
+            "bot_member_lru_size": ("Fetched members held in the member LRU.",
+                                    lambda: len(self.member_resolver), "gauge"),
+            "bot_member_lru_hits_total": ("Member lookups served from the LRU.",
+                                          lambda: self.member_resolver.hits, "counter"),
+            "bot_member_fetches_total": ("Members fetched from the Discord API.",
+                                         lambda: self.member_resolver.fetches, "counter"),
+            "bot_view_cache_hits_total": ("Read-only views served from the view cache.",
+                                          lambda: self.view_cache.hits, "counter"),
+            "bot_view_cache_misses_total": ("Read-only views rendered from the wallet.",
+                                            lambda: self.view_cache.misses, "counter"),
+            "bot_view_cache_hit_ratio": ("Share of read-only views served from the cache.",
+                                         lambda: self.view_cache.hit_ratio, "gauge"),
+        }
+        for name, (help_text, read, kind) in gauges.items():
+            metrics.REGISTRY.gauge(name, help_text, read, kind)
+        self._gauge_names = list(gauges)
+
+    # --- [NEW] Write-back flush loop for the wallet cache ---
+    @tasks.loop(seconds=WALLET_FLUSH_SECONDS)
+    @timed_loop("flush")
+    async def flush_loop(self):
+        try:
+            await self.store.flush()
+        except Exception:
+            storage_log.exception("Error flushing wallets to storage")
+        if self.ledger is not None:
+            await run_blocking(self.ledger.sync)
+
+    # --- [NEW] Wallet snapshots for the ledger (see ledger.py) ---
+    @tasks.loop(seconds=LEDGER_SNAPSHOT_SECONDS)
+    @timed_loop("ledger_snapshot")
+    async def ledger_snapshot_loop(self):
+        try:
+            await self.store.flush()
+            await self.ledger.snapshot(self.store)
+        except Exception:
+            storage_log.exception("Error writing ledger snapshot")
+
+    # --- [NEW] Expire old cookie drops ---
+    @tasks.loop(minutes=1)
+    @timed_loop("drop_sweep")
+    async def drop_sweep_loop(self):
+        expired = await self.drops.sweep()
+        for message_id, drop in expired.items():
+            channel = self.bot.get_channel(drop["channel_id"])
+            if channel is None:
+                continue
+            try:
+                message = channel.get_partial_message(message_id)
+                await message.edit(content="This cookie went stale... 🍂")
+            except discord.HTTPException:
+                pass  # Message deleted or no permission, nothing to tidy up
+
+    # --- [NEW] Sharded: pick up wallet changes made by other processes ---
+    # A full scan costs about one backend request per wallet, so only one
+    # process per interval (whoever claims it first) scans. It publishes
+    # every balance in shared state; the others rebuild from that.
+    @tasks.loop(seconds=LEADERBOARD_REFRESH_SECONDS)
+    @timed_loop("leaderboard_refresh")
+    async def leaderboard_refresh_loop(self):
+        if await self.shared.add(LEADERBOARD_REFRESH_KEY, sharding.process_tag(),
+                                 ttl=LEADERBOARD_REFRESH_SECONDS):
+            wallets = [item async for item in self.store.iter_wallets()]
+            published = {
+                "at": time.time(),
+                "columns": COLUMNS,
+                "rows": [[user_id, *(wallet.get(name, 0) for name in COLUMNS)]
+                         for user_id, wallet in wallets],
+            }
+            await self.shared.set(LEADERBOARD_BALANCES_KEY, published,
+                                  ttl=3 * LEADERBOARD_REFRESH_SECONDS)
+        else:
+            published = await self.shared.get(LEADERBOARD_BALANCES_KEY)
+            if published is None or published["at"] <= self.balances_published_at:
+                return  # nothing newer than what we have
+            wallets = [(user_id, dict(zip(published["columns"], values)))
+                       for user_id, *values in published["rows"]]
+
+        self.balances_published_at = published["at"]
+        self.leaderboard_index.rebuild(wallets)
+        self.economy_snapshot.rebuild(wallets)
+
+    @leaderboard_refresh_loop.before_loop
+    async def before_leaderboard_refresh(self):
+        # cog_load just built it
+        await asyncio.sleep(LEADERBOARD_REFRESH_SECONDS)
 
     @commands.Cog.listener()
     async def on_ready(self):
-        print("Tax and Nickname loops initialized in background.")
-
-    # --- [NEW] Automatic Tax Loop (Runs every 24 hours) ---
+        log.info("Tax and Nickname loops initialized in background.")
+
+    # --- [NEW] Bank Tax Compaction (Runs every 24 hours, optional) ---
+    # Tax is charged lazily whenever a wallet is read (see bank_tax.py), so
+    # this pass only exists to write the new balances of idle users back to
+    # storage. It can be turned off with TAX_COMPACTION=0.
+    # Runs as a paged sweep (see tax_engine.py): each page is taxed in one
+    # vectorised pass and only the changed wallets are written back, as one
+    # batch; resumable after a restart.
     @tasks.loop(seconds=TAX_INTERVAL_SECONDS)  # 86400 seconds = 24 hours
+    @timed_loop("tax")
     async def tax_loop(self):
-        print("Starting bank tax calculation for all users...")
-        current_time = int(time.time())
-        taxed_users_count = 0
-
-        # Iterate over all user IDs in the database
-        all_user_ids = list(db.keys())
-
-        for user_id in all_user_ids:
-            if user_id.isdigit():
-                try:
-                    # Get wallet (it only ensures structure now, not taxing)
-                    wallet = get_wallet(user_id)
-
-                    # Check if enough time has passed since last tax
-                    last_taxed = wallet.get("last_taxed", 0)
-                    time_since_tax = current_time - last_taxed
-
-                    if time_since_tax >= TAX_INTERVAL_SECONDS:
-                        bank_balance = wallet.get("bank", 0)
-                        days_passed = time_since_tax // TAX_INTERVAL_SECONDS
-
-                        if bank_balance > 0:
-                            # Apply 3% tax for each day passed (compounding)
-                            # (0.97 ** days_passed) = (1 - 0.03) ^ days
-                            taxed_balance = bank_balance * (0.97**days_passed)
-
-                            # Calculate loss for logging (optional, but recommended)
-                            loss = bank_balance - int(taxed_balance)
-
-                            wallet["bank"] = int(
-                                taxed_balance)  # Store as integer
-                            print(
-                                f"Taxed user {user_id} for {days_passed} day(s). Loss: {loss}"
-                            )
-                            taxed_users_count += 1
-
-                        # Update the last taxed time to the end of the last full period
-                        wallet["last_taxed"] = last_taxed + (
-                            days_passed * TAX_INTERVAL_SECONDS)
-
-                        # Save the updated wallet back to DB
-                        db[user_id] = wallet
-
-                except Exception as e:
-                    print(f"Error processing tax for user {user_id}: {e}")
+        tax_log.info("Starting bank tax compaction...")
+        engine = TaxEngine(self.store)
+        try:
+            stats = await engine.run()
+        except Exception:
+            # The checkpoint is kept, so the next run picks up from here
+            tax_log.exception("Tax compaction stopped early",
+                              extra={"checked": engine.stats["checked"]})
+            return
 
-        print(f"Finished taxing. Total users taxed: {taxed_users_count}")
+        # One summary line instead of one line per wallet
+        tax_log.info("Finished tax compaction.", extra=stats)
 
     # --- [NEW] Background task for temporary nickname reversion ---
-    @tasks.loop(minutes=5)  # Check every 5 minutes
+    # Only users in the expiry index are looked at, so a run with nothing
+    # due costs nothing no matter how many wallets exist. Due users are
+    # handed to a sweep, so a restart halfway through doesn't lose them.
+    @tasks.loop(minutes=1)  # Check every minute (cheap thanks to the index)
+    @timed_loop("temp_nick")
     async def temp_nick_task(self):
-        print("Starting temporary nickname check...")
         current_time = int(time.time())
+        due = self.nick_index.due(current_time)
+        due_user_ids = list(due)
+        # The first run also finishes any sweep cut short by a restart
+        if not due_user_ids and self.nick_sweep_resumed:
+            return
+        self.nick_sweep_resumed = True
+
+        if due_user_ids:
+            nick_log.info("Reverting %d temporary nickname(s)...",
+                          len(due_user_ids))
+
+        async def revert_page(user_ids):
+            await self._revert_nicknames(user_ids, current_time)
+
+        async def forget_due():
+            # Only once the sweep checkpoint holds them: a crash before
+            # this point leaves them in the index for the next run
+            await self.nick_index.remove(due)
+
+        await Sweep(self.store.backend, "temp_nick" + sharding.process_tag()).run(
+            revert_page, keys=due_user_ids, on_saved=forget_due)
+
+    async def _revert_nicknames(self, user_ids, current_time: int):
+        # One batched read for the whole page
+        wallets = await self.store.get_many(user_ids)
+        jobs = []
+        for user_id in user_ids:
+            wallet = wallets[user_id]
+
+            # Check for expiration data
+            expires = wallet.get('nick_expires', 0)
+            emoji = wallet.get('nick_emoji', None)
+
+            if emoji and expires > 0 and current_time >= expires:
+                # Nickname has expired, revert it! Older wallets don't
+                # have nick_guild; the reverter then searches every guild.
+                guild_ids = wallet.get('nick_guild')
+                if guild_ids and not isinstance(guild_ids, list):
+                    guild_ids = [guild_ids]
+                jobs.append(RevertJob(user_id, emoji, expires, guild_ids or None))
+        if not jobs:
+            return
+
+        searched = {job for job in jobs if job.guild_ids is None}
+        await self.nick_reverter.run(jobs)
 
-        # Iterate over ALL database keys (looking for users)
-        for user_id in list(db.keys()):
-            if user_id.isdigit():
-                try:
-                    wallet = get_wallet(user_id)
-
-                    # Check for expiration data
-                    expires = wallet.get('nick_expires', 0)
-                    emoji = wallet.get('nick_emoji', None)
-
-                    if emoji and expires > 0 and current_time >= expires:
-                        # Nickname has expired, revert it!
-
-                        member = None
-                        # We must iterate all guilds to find the member
-                        for guild in self.bot.guilds:
-                            member = guild.get_member(int(user_id))
-                            if member:
-                                break
-
-                        if member:
-                            current_nick = member.nick if member.nick else member.name
-
-                            # Check if the expected temporary emoji is still the prefix
-                            expected_prefix = emoji
-
-                            if current_nick and current_nick.startswith(
-                                    expected_prefix):
-                                new_nick = current_nick.lstrip(
-                                    expected_prefix).lstrip()
-
-                                # Find the permanent role emoji if present to prepend it back
-                                permanent_prefix = self._get_permanent_emoji_prefix(
-                                    member)
-                                new_nick = permanent_prefix + new_nick
-
-                                try:
-                                    # Discord requires non-empty string for nick change
-                                    await member.edit(
-                                        nick=new_nick if new_nick else None)
-                                    print(
-                                        f"Reverted temporary nickname for {member.name}."
-                                    )
-                                except discord.Forbidden:
-                                    print(
-                                        f"Forbidden: Could not revert nick for {member.name}."
-                                    )
-                                except Exception as e:
-                                    print(
-                                        f"Error reverting nick for {member.name}: {e}"
-                                    )
-
-                        # 2. Clear the expiration data from DB regardless
+        for job in jobs:
+            try:
+                if job.status == RETRY:
+                    # Keep the DB fields and try again later, without
+                    # searching every guild again
+                    if job in searched and job.guild_ids:
+                        async with self.store.transaction(job.user_id) as txn:
+                            wallet = txn[job.user_id]
+                            if wallet.get('nick_expires') == job.expires:
+                                wallet['nick_guild'] = (job.guild_ids[0]
+                                                        if len(job.guild_ids) == 1
+                                                        else job.guild_ids)
+                    await self.nick_index.schedule(
+                        job.user_id, current_time + NICK_REVERT_RETRY_SECONDS)
+                    continue
+                # Clear the expiration data from DB
+                # (re-read under the lock: the edits above awaited)
+                async with self.store.transaction(job.user_id) as txn:
+                    wallet = txn[job.user_id]
+                    if wallet.get('nick_expires') == job.expires:
                         wallet.pop('nick_expires', None)
                         wallet.pop('nick_emoji', None)
-                        db[user_id] = wallet
+                        wallet.pop('nick_guild', None)
+            except Exception:
+                nick_log.exception("Error in nick revert loop for %s", job.user_id)
+
+    def _reverted_nick(self, member: discord.Member, emoji: str):
+        """Nickname without the temporary emoji; False if it isn't there."""
+        current_nick = member.nick if member.nick else member.name
+
+        # Check if the expected temporary emoji is still the prefix
+        if not current_nick or not current_nick.startswith(emoji):
+            return False
+        new_nick = current_nick[len(emoji):].lstrip()
 
-                except Exception as e:
-                    print(f"Error in nick revert loop for {user_id}: {e}")
+        # Find the permanent role emoji if present to prepend it back
+        new_nick = self._get_permanent_emoji_prefix(member) + new_nick
+        # Discord requires non-empty string for nick change
+        return new_nick if new_nick else None
+
+    @temp_nick_task.before_loop
+    async def before_temp_nick_task(self):
+        await self._load_nick_index()
+
+    async def _load_nick_index(self):
+        """Loads the expiry index, building it once from old wallets if missing."""
+        async with self.nick_index_lock:
+            if self.nick_index_loaded:
+                return
+            if await self.nick_index.load():
+                nick_log.info("Loaded %d pending nickname expiries.", len(self.nick_index))
+            else:
+                # One-time migration: wallets written before the index existed
+                entries = {}
+                async for user_id, wallet in self.store.iter_wallets():
+                    if wallet.get('nick_emoji') and wallet.get('nick_expires', 0) > 0:
+                        entries[user_id] = wallet['nick_expires']
+                await self.nick_index.rebuild(entries)
+                nick_log.info("Built nickname expiry index (%d entries).", len(entries))
+            self.nick_index_loaded = True
 
     # Helper method to get the permanent emoji prefix
     def _get_permanent_emoji_prefix(self, member: discord.Member) -> str:
+        # Highest-priority shop role the member has (see role_index.py)
+        self.catalog.refresh()
+        self.role_index.refresh()
+        emoji = self.role_index.permanent_emoji(member)
+        return emoji + " " if emoji else ""
 
-        # Check Gold, Silver, Bronze roles in order for simplicity
-        # NOTE: Using int() on role_id ensures compatibility if stored as str
-        if member.get_role(int(shop_items['gold']['role_id'])):
-            return shop_items['gold']['emoji'] + " "
-        if member.get_role(int(shop_items['silver']['role_id'])):
-            return shop_items['silver']['emoji'] + " "
-        if member.get_role(int(shop_items['bronze']['role_id'])):
-            return shop_items['bronze']['emoji'] + " "
-
-        return ""
+    async def _refund(self, user_id: str, field: str, amount: int):
+        """Gives back what a command took when its Discord call failed."""
+        async with self.store.transaction(user_id) as txn:
+            txn[user_id][field] = txn[user_id].get(field, 0) + amount
 
     # Helper method to apply Nickname
     async def _apply_nickname_prefix(self,
@@ -173,34 +458,13 @@ class AllCommands(commands.Cog):
                                      is_permanent: bool = False):
         current_nick = member.nick if member.nick else member.name
 
-        cleaned_nick = current_nick
-
-        # Remove permanent prefix if found
-        for key, details in shop_items.items():
-            perm_emoji = details.get('emoji', '')
-            if perm_emoji and cleaned_nick.startswith(perm_emoji):
-                cleaned_nick = cleaned_nick.lstrip(perm_emoji).lstrip()
-                break
-
-        # Remove temporary prefix if found
-        for item_key, item_details in TEMPORARY_ITEMS.items():
-            temp_emoji = item_details['emoji']
-            if cleaned_nick.startswith(temp_emoji + " "):
-                cleaned_nick = cleaned_nick.lstrip(temp_emoji + " ").lstrip()
-                break
+        # Remove the permanent prefix, then the temporary one, if found
+        perm_prefix = self._get_permanent_emoji_prefix(member)
+        cleaned_nick = self.role_index.strip_prefixes(current_nick)
 
         if not cleaned_nick or cleaned_nick.isspace():
             cleaned_nick = member.name
 
-        perm_prefix = ""
-        # Re-get permanent prefix by checking roles again (safer if roles changed)
-        for key, details in shop_items.items():
-            role_id = int(details['role_id'])
-            role = member.guild.get_role(role_id)
-            if role and role in member.roles:
-                perm_prefix = details.get('emoji', '') + " "
-                break
-
         if is_permanent:
             final_nick = emoji + " " + cleaned_nick
         else:
@@ -219,9 +483,17 @@ class AllCommands(commands.Cog):
         except discord.Forbidden:
             return False
         except Exception as e:
-            print(f"Error applying nickname for {member.name}: {e}")
+            nick_log.warning("Error applying nickname for %s: %s", member.name, e)
             return False
 
+    # Roles changed: the member's permanent emoji may have too
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member,
+                               after: discord.Member):
+        if before._roles != after._roles:
+            self.role_index.invalidate(after)
+            self.member_resolver.forget(after.guild.id, after.id)
+
     # --- [NEW] Listener for Random Cookie Drops ---
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
@@ -230,72 +502,69 @@ class AllCommands(commands.Cog):
         if message.content.startswith(self.bot.command_prefix):
             return
 
-        chance = random.randint(1, 100)
-
-        if chance == 1:
+        # Random roll + per-channel/per-guild limits (see drop_scheduler.py)
+        guild_id = message.guild.id if message.guild else 0
+        if self.drop_scheduler.should_drop(guild_id, message.channel.id,
+                                           len(self.drops)):
             try:
                 drop_msg = await message.channel.send(
                     "A wild cookie appeared! 🍪\nReact with 🍪 to claim it!")
                 await drop_msg.add_reaction("🍪")
-                self.active_drops.add(drop_msg.id)
-                print(f"Cookie dropped! Message ID: {drop_msg.id}")
+                await self.drops.add(drop_msg.id, message.channel.id, 1)
+                drop_log.debug("Cookie dropped! Message ID: %s", drop_msg.id)
             except discord.Forbidden:
-                print(
-                    f"Error: Bot missing permissions in channel {message.channel.id}"
-                )
-            except Exception as e:
-                print(f"Error during cookie drop: {e}")
+                drop_log.warning("Error: Bot missing permissions in channel %s",
+                                 message.channel.id)
+            except Exception:
+                drop_log.exception("Error during cookie drop")
 
     # --- [NEW] Listener for Reaction Claims (Modified to handle Admin Drop) ---
+    # Uses the raw event so claims work even when the drop message is not
+    # in the message cache (old messages, or after a restart).
     @commands.Cog.listener()
-    async def on_reaction_add(self, reaction: discord.Reaction,
-                              user: discord.Member):
-        if user.bot:
+    async def on_raw_reaction_add(self,
+                                  payload: discord.RawReactionActionEvent):
+        if str(payload.emoji) != "🍪":
             return
-        if str(reaction.emoji) != "🍪":
+        if payload.message_id not in self.drops:
             return
+        # Listeners run in their own task, so this only labels the claim
+        metrics.current_scope.set("event:drop_claim")
 
-        message_id = reaction.message.id
-        claimed_amount = 0
+        user = payload.member or self.bot.get_user(payload.user_id)
+        if user is None or user.bot:
+            return
 
-        if message_id in self.active_drops:
-            claimed_amount = 1
-            try:
-                self.active_drops.remove(message_id)
-            except KeyError:
-                return
-        elif message_id in self.admin_drops:
-            try:
-                claimed_amount = self.admin_drops.pop(message_id)
-            except KeyError:
-                return
+        drop = await self.drops.claim(payload.message_id)
+        if drop is None:
+            return
+        claimed_amount = drop["amount"]
 
-        if claimed_amount > 0:
-            user_id = str(user.id)
-            wallet = get_wallet(user_id)
-            wallet["cookie"] += claimed_amount
-            db[user_id] = wallet
+        user_id = str(user.id)
+        async with self.store.transaction(user_id) as txn:
+            txn[user_id]["cookie"] += claimed_amount
 
+        channel = self.bot.get_channel(payload.channel_id)
+        if channel is not None:
             try:
-                await reaction.message.clear_reactions()
-                await reaction.message.edit(
+                message = channel.get_partial_message(payload.message_id)
+                await message.clear_reactions()
+                await message.edit(
                     content=f"**{user.name}** claimed **{claimed_amount}** 🍪!")
             except discord.Forbidden:
-                print("Could not edit drop message (missing permissions).")
+                drop_log.warning("Could not edit drop message (missing permissions).")
+            except discord.HTTPException as e:
+                drop_log.warning("Could not edit drop message: %s", e)
 
-            try:
-                await user.send(
-                    f"You successfully claimed **{claimed_amount}** 🍪 from a drop!"
-                )
-            except discord.Forbidden:
-                print(f"Could not send DM to {user.name} (DMs disabled).")
-
-            print(
-                f"Cookie claimed by {user.name} (ID: {user_id}), Amount: {claimed_amount}"
+        try:
+            await user.send(
+                f"You successfully claimed **{claimed_amount}** 🍪 from a drop!"
             )
-            return
+        except discord.Forbidden:
+            drop_log.debug("Could not send DM to %s (DMs disabled).", user.name)
 
-        return
+        drop_log.debug("Cookie claimed by %s (ID: %s), Amount: %d", user.name,
+                       user_id, claimed_amount)
 
     # --- (Bot's Original Commands) ---
     @commands.command()
@@ -306,16 +575,15 @@ class AllCommands(commands.Cog):
     # --- [NEW] Gambling & Income Commands ---
 
     @commands.command()
-    @commands.cooldown(1, 86400, commands.BucketType.user)
+    @persistent_cooldown('daily_cooldown')  # 24h, stored in the wallet
     async def daily(self, ctx):
         """Claims your daily salary (1-5 cookies)."""
         user_id = str(ctx.author.id)
-        wallet = get_wallet(user_id)
-
         reward = random.randint(1, 5)
 
-        wallet["cookie"] += reward
-        db[user_id] = wallet
+        async with self.store.transaction(user_id) as txn:
+            wallet = txn[user_id]
+            wallet["cookie"] += reward
 
         await ctx.send(
             f"You collected your daily salary of **{reward}** 🍪! Your new balance is `{wallet['cookie']}` cookies."
@@ -325,74 +593,65 @@ class AllCommands(commands.Cog):
     async def slots(self, ctx):
         """Spin the slot machine for 1 cookie!"""
         user_id = str(ctx.author.id)
-        wallet = get_wallet(user_id)
 
-        if wallet.get("cookie", 0) < 1:
-            await ctx.send(f"You need at least 1 🍪 to play the slots!")
-            return
+        async with self.store.transaction(user_id) as txn:
+            wallet = txn[user_id]
 
-        wallet["cookie"] -= 1
+            if wallet.get("cookie", 0) < 1:
+                result_msg = "You need at least 1 🍪 to play the slots!"
+            else:
+                wallet["cookie"] -= 1
 
-        emojis = ["🥔", "🥛", "☕", "🍵", "🍪", "💰"]
-        roll = [random.choice(emojis) for _ in range(3)]
+                emojis = ["🥔", "🥛", "☕", "🍵", "🍪", "💰"]
+                roll = [random.choice(emojis) for _ in range(3)]
 
-        result_msg = f"You spin the slots... and get:\n\n**[ {roll[0]} | {roll[1]} | {roll[2]} ]**\n\n"
+                result_msg = f"You spin the slots... and get:\n\n**[ {roll[0]} | {roll[1]} | {roll[2]} ]**\n\n"
 
-        if roll[0] == roll[1] == roll[2]:
-            if roll[0] == "💰":
-                winnings = 100
-            else:
-                winnings = 50
-            wallet["cookie"] += winnings
-            result_msg += f"**JACKPOT!** You win `{winnings}` cookies! 🥳"
+                if roll[0] == roll[1] == roll[2]:
+                    if roll[0] == "💰":
+                        winnings = 100
+                    else:
+                        winnings = 50
+                    wallet["cookie"] += winnings
+                    result_msg += f"**JACKPOT!** You win `{winnings}` cookies! 🥳"
 
-        elif roll[0] == roll[1] or roll[1] == roll[2] or roll[0] == roll[2]:
-            winnings = 5
-            wallet["cookie"] += winnings
-            result_msg += f"You win `{winnings}` cookies! 🎉"
+                elif roll[0] == roll[1] or roll[1] == roll[2] or roll[0] == roll[2]:
+                    winnings = 5
+                    wallet["cookie"] += winnings
+                    result_msg += f"You win `{winnings}` cookies! 🎉"
 
-        else:
-            result_msg += "You lost. 😢 Better luck next time!"
+                else:
+                    result_msg += "You lost. 😢 Better luck next time!"
 
-        db[user_id] = wallet
         await ctx.send(result_msg)
 
     @commands.command()
     async def dice(self, ctx, amount: int):
         """Roll the dice for a 50/50 chance to double your cookie bet."""
         user_id = str(ctx.author.id)
-        wallet = get_wallet(user_id)
 
         if amount <= 0:
             await ctx.send("You must bet at least 1 cookie.")
             return
 
-        current_cookies = wallet.get("cookie", 0)
+        async with self.store.transaction(user_id) as txn:
+            wallet = txn[user_id]
+            current_cookies = wallet.get("cookie", 0)
 
-        if current_cookies < amount:
-            await ctx.send(
-                f"You don't have enough cookies! You only have `{current_cookies}` 🍪."
-            )
-            return
+            if current_cookies < amount:
+                reply = f"You don't have enough cookies! You only have `{current_cookies}` 🍪."
+            elif random.choice(["win", "loss"]) == "win":
+                wallet["cookie"] += amount
+                reply = f"🎲 You rolled... **WIN!**\nYou won `{amount}` cookies! 🍪 You now have `{wallet['cookie']}` cookies."
+            else:
+                wallet["cookie"] -= amount
+                reply = f"🎲 You rolled... **LOSE!**\nYou lost `{amount}` cookies. 😢 You now have `{wallet['cookie']}` cookies."
 
-        roll = random.choice(["win", "loss"])
-
-        if roll == "win":
-            wallet["cookie"] += amount
-            db[user_id] = wallet
-            await ctx.send(
-                f"🎲 You rolled... **WIN!**\nYou won `{amount}` cookies! 🍪 You now have `{wallet['cookie']}` cookies."
-            )
-        else:
-            wallet["cookie"] -= amount
-            db[user_id] = wallet
-            await ctx.send(
-                f"🎲 You rolled... **LOSE!**\nYou lost `{amount}` cookies. 😢 You now have `{wallet['cookie']}` cookies."
-            )
+        await ctx.send(reply)
 
     # --- [NEW] Give/Transfer Command ---
     @commands.command()
-    async def give(self, ctx, member: discord.Member, amount: int):
+    async def give(self, ctx, member: LazyMember, amount: int):
         """Transfers your own cookies to another user."""
         item_name = "cookie"
         giver_id = str(ctx.author.id)
@@ -406,31 +665,26 @@ class AllCommands(commands.Cog):
             await ctx.send("You must give at least 1 cookie.")
             return
 
-        giver_wallet = get_wallet(giver_id)
-        current_cookies = giver_wallet.get(item_name, 0)
-
-        if current_cookies < amount:
-            await ctx.send(
-                f"You don't have enough cookies! You only have `{current_cookies}` 🍪."
-            )
-            return
-
-        receiver_wallet = get_wallet(receiver_id)
-
         try:
-            giver_wallet[item_name] -= amount
-            receiver_wallet[item_name] += amount
-            db[giver_id] = giver_wallet
-            db[receiver_id] = receiver_wallet
+            # Both wallets are locked, so the check and the transfer are atomic
+            async with self.store.transaction(giver_id, receiver_id) as txn:
+                current_cookies = txn[giver_id].get(item_name, 0)
+
+                if current_cookies < amount:
+                    reply = f"You don't have enough cookies! You only have `{current_cookies}` 🍪."
+                else:
+                    txn[giver_id][item_name] -= amount
+                    txn[receiver_id][item_name] += amount
+                    reply = f"✅ You gave {amount} 🍪 to {member.mention}!"
 
-            await ctx.send(f"✅ You gave {amount} 🍪 to {member.mention}!")
+            await ctx.send(reply)
 
         except Exception as e:
             await ctx.send(f"An error occurred during the transfer: {e}")
 
     # --- [NEW] Steal Command ---
     @commands.command()
-    async def steal(self, ctx, member: discord.Member, amount: int):
+    async def steal(self, ctx, member: LazyMember, amount: int):
         """Try to steal cookies from another user (30% success)."""
         user_id = str(ctx.author.id)
         victim_id = str(member.id)
@@ -443,81 +697,67 @@ class AllCommands(commands.Cog):
             await ctx.send("You must try to steal at least 1 cookie.")
             return
 
-        stealer_wallet = get_wallet(user_id)
-        victim_wallet = get_wallet(victim_id)
-
-        if stealer_wallet.get("cookie", 0) < amount:
-            await ctx.send(
-                f"You need at least `{amount}` 🍪 to attempt this (to cover the penalty if you fail)."
-            )
-            return
-
-        if victim_wallet.get("cookie", 0) < amount:
-            await ctx.send(f"That user doesn't have `{amount}` 🍪 to steal.")
-            return
+        async with self.store.transaction(user_id, victim_id) as txn:
+            stealer_wallet = txn[user_id]
+            victim_wallet = txn[victim_id]
 
-        success_chance = random.randint(1, 100)
+            if stealer_wallet.get("cookie", 0) < amount:
+                reply = f"You need at least `{amount}` 🍪 to attempt this (to cover the penalty if you fail)."
 
-        if success_chance <= 30:
-            stealer_wallet["cookie"] += amount
-            victim_wallet["cookie"] -= amount
+            elif victim_wallet.get("cookie", 0) < amount:
+                reply = f"That user doesn't have `{amount}` 🍪 to steal."
 
-            db[user_id] = stealer_wallet
-            db[victim_id] = victim_wallet
+            elif random.randint(1, 100) <= 30:
+                stealer_wallet["cookie"] += amount
+                victim_wallet["cookie"] -= amount
+                reply = f"💰 **Success!** You stole `{amount}` 🍪 from {member.mention}!"
 
-            await ctx.send(
-                f"💰 **Success!** You stole `{amount}` 🍪 from {member.mention}!"
-            )
-
-        else:
-            stealer_wallet["cookie"] -= amount
-            db[user_id] = stealer_wallet
+            else:
+                stealer_wallet["cookie"] -= amount
+                reply = f"👮 **Failed!** You were caught trying to steal `{amount}` 🍪 from {member.mention}!\nYou paid a penalty of `{amount}` 🍪."
 
-            await ctx.send(
-                f"👮 **Failed!** You were caught trying to steal `{amount}` 🍪 from {member.mention}!\nYou paid a penalty of `{amount}` 🍪."
-            )
+        await ctx.send(reply)
 
     # --- [NEW] Bank Commands ---
 
     @commands.command()
-    async def bank(self, ctx, member: Optional[discord.Member] = None):
+    async def bank(self, ctx, member: Optional[LazyMember] = None):
         """Shows your bank balance (in hand vs. stored)."""
         if member is None:
             member = ctx.author
+        user_id = str(member.id)
 
-        wallet = get_wallet(str(member.id))
-
-        embed = discord.Embed(title=f"🏦 {member.name}'s Bank Account",
-                              color=discord.Color.blue())
-        embed.add_field(name="In Hand ✋",
-                        value=f"`{wallet.get('cookie', 0)}` 🍪",
-                        inline=True)
-        embed.add_field(name="In Bank 🏦",
-                        value=f"`{wallet.get('bank', 0)}` 🍪",
-                        inline=True)
-
-        embed.set_footer(
-            text=
-            "Bank deposits have a 3% fee. Stored money is taxed 3% every 24h.")
+        # Rendered once per wallet version (see view_cache.py)
+        embed = self.view_cache.get(user_id, ("bank", member.name))
+        if embed is None:
+            wallet = await self.store.get_wallet(user_id)
+
+            embed = discord.Embed(title=f"🏦 {member.name}'s Bank Account",
+                                  color=discord.Color.blue())
+            embed.add_field(name="In Hand ✋",
+                            value=f"`{wallet.get('cookie', 0)}` 🍪",
+                            inline=True)
+            embed.add_field(name="In Bank 🏦",
+                            value=f"`{wallet.get('bank', 0)}` 🍪",
+                            inline=True)
+
+            embed.set_footer(
+                text=
+                "Bank deposits have a 3% fee. Stored money is taxed 3% every 24h.")
+            self.view_cache.put(user_id, ("bank", member.name), embed,
+                                next_tax_at(wallet))
         await ctx.send(embed=embed)
 
     @commands.command()
     async def deposit(self, ctx, amount: int):
         """Deposits cookies into your bank (3% fee)."""
         user_id = str(ctx.author.id)
-        wallet = get_wallet(user_id)
 
         # --- Checks ---
         if amount <= 0:
             await ctx.send("You must deposit at least 1 cookie.")
             return
 
-        if wallet.get("cookie", 0) < amount:
-            await ctx.send(
-                f"You don't have enough cookies in hand. You only have `{wallet.get('cookie', 0)}` 🍪."
-            )
-            return
-
         # --- Calculate Fee (3% rounded up, min 1) ---
         # "مقربة لاقرب رقم صحيح لا يساوي الصفر"
         fee = max(1, math.ceil(amount * 0.03))
@@ -530,99 +770,115 @@ class AllCommands(commands.Cog):
             return
 
         # --- Process Transaction ---
-        wallet["cookie"] -= amount
-        wallet["bank"] += amount_deposited
-        db[user_id] = wallet
+        async with self.store.transaction(user_id) as txn:
+            wallet = txn[user_id]
 
-        await ctx.send(
-            f"✅ Deposited `{amount_deposited}` 🍪 into your bank. (A fee of `{fee}` 🍪 was paid)."
-        )
+            if wallet.get("cookie", 0) < amount:
+                reply = f"You don't have enough cookies in hand. You only have `{wallet.get('cookie', 0)}` 🍪."
+            else:
+                wallet["cookie"] -= amount
+                wallet["bank"] += amount_deposited
+                reply = f"✅ Deposited `{amount_deposited}` 🍪 into your bank. (A fee of `{fee}` 🍪 was paid)."
+
+        await ctx.send(reply)
 
     @commands.command()
     async def withdraw(self, ctx, amount: int):
         """Withdraws cookies from your bank (no fee)."""
         user_id = str(ctx.author.id)
-        wallet = get_wallet(user_id)
 
         # --- Checks ---
         if amount <= 0:
             await ctx.send("You must withdraw at least 1 cookie.")
             return
 
-        if wallet.get("bank", 0) < amount:
-            await ctx.send(
-                f"You don't have that much in your bank. You only have `{wallet.get('bank', 0)}` 🍪."
-            )
-            return
-
         # --- Process Transaction ---
-        wallet["bank"] -= amount
-        wallet["cookie"] += amount
-        db[user_id] = wallet
+        async with self.store.transaction(user_id) as txn:
+            wallet = txn[user_id]
 
-        await ctx.send(f"✅ Withdrew `{amount}` 🍪 from your bank.")
+            if wallet.get("bank", 0) < amount:
+                reply = f"You don't have that much in your bank. You only have `{wallet.get('bank', 0)}` 🍪."
+            else:
+                wallet["bank"] -= amount
+                wallet["cookie"] += amount
+                reply = f"✅ Withdrew `{amount}` 🍪 from your bank."
+
+        await ctx.send(reply)
 
     # --- [NEW] Item Use Commands (Added) ---
 
     @commands.command()
+    @commands.guild_only()
     async def use(self, ctx, item_key: str):
         """!use {item_name} - Uses 5 items to get a temporary emoji next to your name for 24h."""
-        item_key = item_key.lower().strip()
         user_id = str(ctx.author.id)
 
-        if item_key not in TEMPORARY_ITEMS:
+        self.catalog.refresh()
+        entry = self.catalog.find(item_key, "temporary")
+        if entry is None:
             await ctx.send("That item is not usable for a temporary nickname.")
             return
 
-        item_details = TEMPORARY_ITEMS[item_key]
-        cost = item_details['cost']
-        emoji = item_details['emoji']
+        item_key = entry.key
+        cost = entry.price
+        emoji = entry.emoji
+
+        # Make sure the index is ready before adding to it
+        await self._load_nick_index()
 
-        wallet = get_wallet(user_id)
-        current_items = wallet.get(item_key, 0)
+        # --- Process Use ---
+
+        # 1. Deduct items (no Discord calls while the wallet is locked)
+        async with self.store.transaction(user_id) as txn:
+            wallet = txn[user_id]
+            current_items = wallet.get(item_key, 0)
+            if current_items >= cost:
+                wallet[item_key] -= cost
 
         if current_items < cost:
-            item_emoji = CURRENCY_EMOJIS.get(item_key, '🎁')
             await ctx.send(
-                f"You need `{cost}` {item_emoji} {item_key.title()} to use this effect, but you only have `{current_items}`."
+                f"You need `{cost}` {entry.currency_emoji} {entry.name} to use this effect, but you only have `{current_items}`."
             )
             return
 
-        # --- Process Use ---
-
-        # 1. Deduct items
-        wallet[item_key] -= cost
+        # 2. Apply Nickname Change
+        if not await self._apply_nickname_prefix(ctx.author,
+                                                 emoji,
+                                                 is_permanent=False):
+            # Give the items back if the nickname change fails
+            await self._refund(user_id, item_key, cost)
+            await ctx.send(
+                "⚠️ Failed to change your nickname. Please check my role permissions and position, or that your nickname isn't too long."
+            )
+            return
 
-        # 2. Calculate Expiry
+        # 3. Calculate Expiry and Save Data
         expiry_time = int(time.time()) + (24 * 3600)  # 24 hours in seconds
-
-        # 3. Apply Nickname Change and Save Data
-        if await self._apply_nickname_prefix(ctx.author,
-                                             emoji,
-                                             is_permanent=False):
+        async with self.store.transaction(user_id) as txn:
+            wallet = txn[user_id]
             wallet['nick_emoji'] = emoji
             wallet['nick_expires'] = expiry_time
-            db[user_id] = wallet
+            # The nickname was changed in this guild only
+            wallet['nick_guild'] = ctx.guild.id
+        await self.nick_index.schedule(user_id, expiry_time)
 
-            await ctx.send(
-                f"✅ Used `{cost}` {item_details['emoji']} {item_key.title()}. Your name now has the {emoji} emoji for 24 hours!"
-            )
-        else:
-            # Revert deduction if nickname change fails
-            wallet[item_key] += cost
-            db[user_id] = wallet
-            await ctx.send(
-                "⚠️ Failed to change your nickname. Please check my role permissions and position, or that your nickname isn't too long."
-            )
+        await ctx.send(
+            f"✅ Used `{cost}` {emoji} {entry.name}. Your name now has the {emoji} emoji for 24 hours!"
+        )
 
     @commands.command(name="check_status", aliases=['status'])
     async def check_status(self, ctx):
         """Checks how long until your temporary item emoji expires."""
         user_id = str(ctx.author.id)
-        wallet = get_wallet(user_id)
-
-        expires = wallet.get('nick_expires', 0)
-        emoji = wallet.get('nick_emoji', None)
+        # The countdown changes every second, so only the wallet fields are
+        # cached (see view_cache.py)
+        status = self.view_cache.get(user_id, "status")
+        if status is None:
+            wallet = await self.store.get_wallet(user_id)
+            status = (wallet.get('nick_expires', 0), wallet.get('nick_emoji', None))
+            self.view_cache.put(user_id, "status", status)
+
+        expires, emoji = status
         current_time = int(time.time())
 
         if not emoji or expires <= current_time:
@@ -649,105 +905,61 @@ class AllCommands(commands.Cog):
     # --- [UPDATED] Shop Commands ---
 
     @commands.command()
-    async def shop(self, ctx):
-        """Displays all items and roles available for purchase"""
-        embed = discord.Embed(
-            title="🛒 Cookie Shop 🛒",
-            description="Buy items or roles with your `cookie` currency!",
-            color=discord.Color.dark_orange())
-
-        # --- Item Shop Section ---
-        item_list = []
-        for key, details in item_shop.items():
-            emoji = CURRENCY_EMOJIS.get(key, '🎁')
-            # Using Markdown for better formatting
-            item_list.append(
-                f"**{details['name']} {emoji}**: `{details['price']}` 🍪\n*Type `!buy {key}` to purchase or `!sell {key} [amount]` to sell.*"
-            )
-
-        if item_list:
-            embed.add_field(
-                name="--- ☕ Items ☕ ---",
-                value="\n\n".join(item_list),  # Added newlines for spacing
-                inline=False)
-
-        # --- Role Shop Section ---
-        role_list = []
-        for key, details in shop_items.items():
-            price_currency = details.get("currency", "cookie")
-            price_emoji = CURRENCY_EMOJIS.get(price_currency, '🎁')
-
-            # [تم التعديل] عرض العملة المطلوبة
-            role_list.append(
-                f"**{details['name']} ({details.get('emoji', '')})**: `{details['price']}` {price_emoji} ({price_currency.title()})\n*Type `!buy {key}` to purchase.*"
-            )
-
-        if role_list:
-            embed.add_field(
-                name="--- 👑 Roles 👑 ---",
-                value="\n\n".join(role_list),  # Added newlines for spacing
-                inline=False)
-
-        await ctx.send(embed=embed)
+    async def shop(self, ctx, page: int = 1):
+        """!shop [page] - Displays the items and roles available for purchase"""
+        # Pages are rendered once and only rebuilt when the config changes
+        self.catalog.refresh()
+        await ctx.send(embed=self.catalog.page(page))
 
     @commands.command()
     async def buy(self, ctx, *, item_key: str):
         """!buy {item_name} - Buys an item or role from the shop"""
-        item_key = item_key.lower().strip(
-        )  # make it case-insensitive and remove spaces
         user_id = str(ctx.author.id)
 
-        # Get the user's wallet (or create/fix it)
-        wallet = get_wallet(user_id)  # Now returns a REAL dict
-        cookie_balance = wallet.get("cookie", 0)
+        # Case-insensitive, also matches names, emojis and aliases
+        self.catalog.refresh()
+        entry = self.catalog.find(item_key, "item", "role")
 
         # --- Check Item Shop First ---
-        if item_key in item_shop:
-            item = item_shop[item_key]
-            price = item["price"]
-
-            # Check if user has enough cookies
-            if cookie_balance < price:
-                await ctx.send(
-                    f"You don't have enough cookies! You need `{price}` 🍪, but you only have `{cookie_balance}` 🍪."
-                )
-                return
+        if entry is not None and entry.kind == "item":
+            item_key = entry.key
+            price = entry.price
 
             # Process the transaction
             try:
-                # Take cookies
-                wallet["cookie"] -= price
-                # Give item
-                if item_key not in wallet: wallet[item_key] = 0
-                wallet[item_key] += 1
-                # Save REAL dict back to DB
-                db[user_id] = wallet
-
-                emoji = CURRENCY_EMOJIS.get(item_key, '🎁')
+                async with self.store.transaction(user_id) as txn:
+                    wallet = txn[user_id]
+                    cookie_balance = wallet.get("cookie", 0)
+
+                    if cookie_balance >= price:
+                        # Take cookies
+                        wallet["cookie"] -= price
+                        # Give item
+                        if item_key not in wallet: wallet[item_key] = 0
+                        wallet[item_key] += 1
+
+                # Check if user has enough cookies
+                if cookie_balance < price:
+                    await ctx.send(
+                        f"You don't have enough cookies! You need `{price}` 🍪, but you only have `{cookie_balance}` 🍪."
+                    )
+                    return
+
                 await ctx.send(
-                    f"Congratulations! You bought 1 **{item['name']}** {emoji} for `{price}` 🍪!"
+                    f"Congratulations! You bought 1 **{entry.name}** {entry.emoji} for `{price}` 🍪!"
                 )
             except Exception as e:
                 await ctx.send(f"An unexpected error occurred: {e}")
 
         # --- Check Role Shop Second ---
-        elif item_key in shop_items:
-            item = shop_items[item_key]
-            price = item["price"]
-            role_id = item["role_id"]
-            perm_emoji = item.get("emoji", "")  # [تم الحصول على الرمز الدائم]
+        elif entry is not None:
+            price = entry.price
+            role_id = entry.role_id
+            perm_emoji = entry.emoji  # [تم الحصول على الرمز الدائم]
 
             # [تم التعديل] يتم الحصول على العملة المطلوبة
-            required_currency = item.get("currency", "cookie")
-            required_balance = wallet.get(required_currency, 0)
-            required_emoji = CURRENCY_EMOJIS.get(required_currency, '🎁')
-
-            # Check if user has enough of the required currency
-            if required_balance < price:
-                await ctx.send(
-                    f"You don't have enough {required_currency}! You need `{price}` {required_emoji}, but you only have `{required_balance}` {required_emoji}."
-                )
-                return
+            required_currency = entry.currency
+            required_emoji = entry.currency_emoji
 
             # Check if user already has the role
             role = ctx.guild.get_role(role_id)
@@ -761,35 +973,54 @@ class AllCommands(commands.Cog):
                 await ctx.send("You already have this item/role!")
                 return
 
-            # Process the transaction
+            # Process the transaction: take the currency, then give the role
+            # once the wallet is unlocked (Discord calls can take seconds);
+            # the currency is refunded if the role can't be given
             try:
-                # Take the required currency
-                wallet[required_currency] -= price
-                # Save REAL dict back to DB
-                db[user_id] = wallet
-                # Give role
-                await ctx.author.add_roles(role)
+                async with self.store.transaction(user_id) as txn:
+                    wallet = txn[user_id]
+                    required_balance = wallet.get(required_currency, 0)
 
-                # [جديد] تطبيق الرمز الدائم
-                if perm_emoji:
-                    # نمرر الرمز والـ flag True
-                    await self._apply_nickname_prefix(ctx.author,
-                                                      perm_emoji,
-                                                      is_permanent=True)
+                    # Take the required currency
+                    if required_balance >= price:
+                        wallet[required_currency] -= price
+            except Exception as e:
+                await ctx.send(f"An unexpected error occurred: {e}")
+                return
 
+            # Check if user has enough of the required currency
+            if required_balance < price:
                 await ctx.send(
-                    f"Congratulations! You bought the **{item['name']}** role for `{price}` {required_emoji}!"
+                    f"You don't have enough {required_currency}! You need `{price}` {required_emoji}, but you only have `{required_balance}` {required_emoji}."
                 )
+                return
 
+            try:
+                # Give role
+                await ctx.author.add_roles(role)
             except discord.Forbidden:
+                await self._refund(user_id, required_currency, price)
                 await ctx.send(
                     "Error: I don't have permission to give you that role. (Check 'Manage Roles' permission & my role position)."
                 )
+                return
             except Exception as e:
+                await self._refund(user_id, required_currency, price)
                 await ctx.send(f"An unexpected error occurred: {e}")
-                # Give back currency if something went wrong
-                wallet[required_currency] += price
-                db[user_id] = wallet
+                return
+            # Don't wait for on_member_update to see the new role
+            self.role_index.invalidate(ctx.author)
+
+            # [جديد] تطبيق الرمز الدائم
+            if perm_emoji:
+                # نمرر الرمز والـ flag True
+                await self._apply_nickname_prefix(ctx.author,
+                                                  perm_emoji,
+                                                  is_permanent=True)
+
+            await ctx.send(
+                f"Congratulations! You bought the **{entry.name}** role for `{price}` {required_emoji}!"
+            )
 
         # --- If Not Found ---
         else:
@@ -815,28 +1046,83 @@ class AllCommands(commands.Cog):
             # Add the reaction for the user to click
             await drop_msg.add_reaction("🍪")
 
-            # Add the message ID and amount to our tracking dictionary
-            self.admin_drops[drop_msg.id] = amount
-            print(
-                f"Admin drop created! Message ID: {drop_msg.id}, Amount: {amount}"
-            )
+            # Add the message ID and amount to the drop registry
+            await self.drops.add(drop_msg.id, ctx.channel.id, amount, admin=True)
+            drop_log.info("Admin drop created! Message ID: %s, Amount: %d",
+                          drop_msg.id, amount)
 
         except discord.Forbidden:
             await ctx.send("Error: Bot missing permissions to send or react.")
-        except Exception as e:
-            print(f"Error during admin cookie drop: {e}")
+        except Exception:
+            drop_log.exception("Error during admin cookie drop")
             await ctx.send(
                 "An unexpected error occurred while creating the drop.")
 
+    # --- [NEW] Drop Statistics (Admin) ---
+    @commands.command()
+    @commands.has_permissions(administrator=True)
+    async def dropstats(self, ctx):
+        """(Admin) Shows how many cookie drops were created or suppressed."""
+        counters = self.drop_scheduler.counters
+        lines = [f"Open drops: `{len(self.drops)}`"]
+        lines += [
+            f"{name.replace('_', ' ').title()}: `{count}`"
+            for name, count in counters.items()
+        ]
+        lines.append(f"Total Suppressed: `{self.drop_scheduler.suppressed}`")
+        await ctx.send("\n".join(lines))
+
+    # --- [NEW] Economy Statistics (Admin) ---
+    @commands.command()
+    @commands.has_permissions(administrator=True)
+    async def economy(self, ctx):
+        """(Admin) Shows totals, wealth spread and Gini for the whole economy."""
+        stats = self.economy_snapshot.summary()
+
+        embed = discord.Embed(title="📊 Economy Overview",
+                              color=discord.Color.dark_orange())
+        embed.add_field(
+            name="Totals",
+            value="\n".join(
+                f"{CURRENCY_EMOJIS.get(name, name)} {name.title()}: `{total}` "
+                f"({stats['holders'][name]} holders)"
+                for name, total in stats["totals"].items()),
+            inline=False)
+        embed.add_field(
+            name="Cookies",
+            value=(f"In circulation: `{stats['cookies_in_circulation']}`\n"
+                   f"Share in banks: `{stats['bank_share']:.1%}`"),
+            inline=False)
+        percentiles = stats["percentiles"]
+        embed.add_field(
+            name="Net Worth",
+            value=(f"Total: `{stats['net_worth_total']}` over `{stats['users']}` users\n"
+                   f"Median: `{percentiles.get('p50', 0):.0f}` • "
+                   f"Top 10%: `{percentiles.get('p90', 0):.0f}` • "
+                   f"Top 1%: `{percentiles.get('p99', 0):.0f}`\n"
+                   f"Gini: `{stats['gini']:.3f}`"),
+            inline=False)
+        histogram = stats["histogram"]
+        if histogram:
+            widest = max(bucket["users"] for bucket in histogram) or 1
+            lines = [
+                f"`{bucket['from']:>7}-{bucket['to']:<7}` "
+                f"{'█' * round(10 * bucket['users'] / widest)} {bucket['users']}"
+                for bucket in histogram
+            ]
+            embed.add_field(name="Distribution", value="\n".join(lines), inline=False)
+        await ctx.send(embed=embed)
+
     # --- [NEW] Sell Command (Added in previous step) ---
     @commands.command()
     async def sell(self, ctx, item_key: str, amount: int):
         """!sell {item_name} [amount] - Sells items for cookies (10% tax)."""
-        item_key = item_key.lower().strip()
         user_id = str(ctx.author.id)
 
         # --- Initial Checks ---
-        if item_key not in item_shop:
+        self.catalog.refresh()
+        entry = self.catalog.find(item_key, "item")
+        if entry is None:
             await ctx.send(
                 "That item cannot be sold or doesn't exist. Check `!shop` for sellable items."
             )
@@ -846,19 +1132,11 @@ class AllCommands(commands.Cog):
             await ctx.send("You must sell at least 1 item.")
             return
 
-        wallet = get_wallet(user_id)
-
-        # Check user's item balance
-        current_items = wallet.get(item_key, 0)
-        if current_items < amount:
-            await ctx.send(
-                f"You only have `{current_items}` {item_key.title()} to sell.")
-            return
-
         # --- Calculation ---
 
         # Get the original purchase price (which is the sell value per unit in cookies)
-        unit_sell_price = item_shop[item_key]["price"]
+        item_key = entry.key
+        unit_sell_price = entry.price
 
         # Total cookies received before tax
         total_received_cookies = amount * unit_sell_price
@@ -878,17 +1156,23 @@ class AllCommands(commands.Cog):
             return
 
         # --- Transaction ---
+        async with self.store.transaction(user_id) as txn:
+            wallet = txn[user_id]
 
-        # 1. Deduct items
-        wallet[item_key] -= amount
+            # Check user's item balance
+            current_items = wallet.get(item_key, 0)
+            if current_items < amount:
+                await ctx.send(
+                    f"You only have `{current_items}` {item_key.title()} to sell.")
+                return
 
-        # 2. Add cookies (the "cookie" key is guaranteed to exist by get_wallet)
-        wallet["cookie"] += int(net_gain)  # Add the net gain
+            # 1. Deduct items
+            wallet[item_key] -= amount
 
-        # 3. Save
-        db[user_id] = wallet
+            # 2. Add cookies (the "cookie" key is guaranteed to exist by get_wallet)
+            wallet["cookie"] += int(net_gain)  # Add the net gain
 
-        item_emoji = CURRENCY_EMOJIS.get(item_key, '🎁')
+        item_emoji = entry.emoji
 
         await ctx.send(
             f"✅ You sold `{amount}` **{item_key.title()}** {item_emoji}.\n"
@@ -898,7 +1182,7 @@ class AllCommands(commands.Cog):
     # 5. Award Currency Command (Admin Only) [!FIXED!]
     @commands.command()
     @commands.has_permissions(administrator=True)  # <-- Makes this admin-only
-    async def award(self, ctx, member: discord.Member, amount: int,
+    async def award(self, ctx, member: LazyMember, amount: int,
                     item_name: str):
         """!award @username [amount] [item_name] - Adds to a user's balance."""
         user_id = str(member.id)
@@ -910,60 +1194,60 @@ class AllCommands(commands.Cog):
             )
             return
 
-        # Get or CREATE/FIX the wallet
-        wallet = get_wallet(user_id)  # Get/Create/Fix wallet (now a REAL dict)
-
-        # Modify the REAL dict
-        wallet[item_name] += amount
-
-        # Save the REAL dict back to DB (this is now CRITICAL)
-        db[user_id] = wallet
+        # Get or CREATE/FIX the wallet, modify it and save it atomically
+        async with self.store.transaction(user_id) as txn:
+            txn[user_id][item_name] += amount
 
         emoji = CURRENCY_EMOJIS.get(item_name, '🎁')
         await ctx.send(f"Awarded {amount} {emoji} to {member.mention}!")
 
     # 6. Balance Command (Wallet) [!MODIFIED!]
     @commands.command()
-    async def balance(self, ctx, member: Optional[discord.Member] = None):
+    async def balance(self, ctx, member: Optional[LazyMember] = None):
         """!balance (shows your own balance) or !balance @username"""
         if member is None:
             member = ctx.author
 
-        # Get or create/fix the user's wallet (now a REAL dict)
-        # [FIX] Convert member.id (int) to str for the helper function
-        wallet = get_wallet(str(member.id))
-
-        embed = discord.Embed(title=f"💰 {member.name}'s Wallet",
-                              color=discord.Color.green())
-
-        # Calculate total net worth first
-        total_worth = 0
-
-        # Display all currencies in the wallet
-        for item_name in CURRENCIES:
-            # We don't count "bank" in this display loop
-            if item_name == "bank" or item_name == "last_taxed":
-                continue
-            amount = wallet.get(item_name, 0)
-            embed.add_field(
-                name=
-                f"{CURRENCY_EMOJIS.get(item_name, '🎁')} {item_name.title()}",
-                value=f"**{amount}**",
-                inline=True)
+        user_id = str(member.id)
+        # Rendered once per wallet version (see view_cache.py)
+        embed = self.view_cache.get(user_id, ("balance", member.name))
+        if embed is None:
+            # Get or create/fix the user's wallet (now a REAL dict)
+            wallet = await self.store.get_wallet(user_id)
+
+            embed = discord.Embed(title=f"💰 {member.name}'s Wallet",
+                                  color=discord.Color.green())
+
+            # Calculate total net worth first
+            total_worth = 0
+
+            # Display all currencies in the wallet
+            for item_name in CURRENCIES:
+                # We don't count "bank" in this display loop
+                if item_name == "bank" or item_name == "last_taxed":
+                    continue
+                amount = wallet.get(item_name, 0)
+                embed.add_field(
+                    name=
+                    f"{CURRENCY_EMOJIS.get(item_name, '🎁')} {item_name.title()}",
+                    value=f"**{amount}**",
+                    inline=True)
 
-            # Add to net worth
-            total_worth += amount * CURRENCY_VALUES.get(item_name, 0)
+                # Add to net worth
+                total_worth += amount * CURRENCY_VALUES.get(item_name, 0)
 
-        # Add bank balance separately to total worth
-        bank_balance = wallet.get("bank", 0)
-        total_worth += bank_balance * CURRENCY_VALUES.get("bank", 1)
+            # Add bank balance separately to total worth
+            bank_balance = wallet.get("bank", 0)
+            total_worth += bank_balance * CURRENCY_VALUES.get("bank", 1)
 
-        embed.description = f"**Total Net Worth:** `{total_worth}` 🍪"
+            embed.description = f"**Total Net Worth:** `{total_worth}` 🍪"
 
-        # Add Bank balance to the fields
-        embed.add_field(name=f"{CURRENCY_EMOJIS.get('bank', '🏦')} Bank",
-                        value=f"**{bank_balance}**",
-                        inline=True)
+            # Add Bank balance to the fields
+            embed.add_field(name=f"{CURRENCY_EMOJIS.get('bank', '🏦')} Bank",
+                            value=f"**{bank_balance}**",
+                            inline=True)
+            self.view_cache.put(user_id, ("balance", member.name), embed,
+                                next_tax_at(wallet))
 
         await ctx.send(embed=embed)
 
@@ -973,35 +1257,34 @@ class AllCommands(commands.Cog):
         """!leaderboard (shows top 5 richest users)"""
         if count > 20: count = 20  # Max 20 users
 
-        all_users = db.keys()
-        leaderboard_data = {}  # Will store {user_id: total_net_worth}
-
-        for user_id in all_users:
-            if user_id.isdigit():  # Check if it's a user ID
-
-                # get_wallet() will now fix bad data,
-                wallet = get_wallet(user_id)  # Get user's wallet (or fix it)
-                if not isinstance(wallet, dict):
-                    continue
+        # Read the current top entries first (one multi-get): this charges
+        # any bank tax owed, which re-ranks them through the index write hook.
+        await self.store.get_many(
+            [user_id for user_id, _ in self.leaderboard_index.top(count)])
 
-                total_net_worth = 0
+        sorted_users = self.leaderboard_index.top(count)
 
-                # Calculate total net worth for this user
-                for item_name, amount in wallet.items():
-                    # We MUST include 'bank' in total net worth calculation
-                    if item_name != "last_taxed":
-                        item_value = CURRENCY_VALUES.get(
-                            item_name, 0)  # Get value from our new map
-                        total_net_worth += amount * item_value
+        # The rendered embed is reused until the top entries change. Names
+        # that failed to resolve (rate limit, HTTP error) would be stuck as
+        # "Unknown User", so such an embed is not kept.
+        cache_key = tuple(sorted_users)
+        if self.leaderboard_embed_cache and self.leaderboard_embed_cache[0] == cache_key:
+            embed = self.leaderboard_embed_cache[1].copy()
+        else:
+            embed, all_named = await self._render_leaderboard(ctx.guild, sorted_users)
+            if all_named:
+                self.leaderboard_embed_cache = (cache_key, embed)
+                embed = embed.copy()
 
-                if total_net_worth > 0:
-                    leaderboard_data[user_id] = total_net_worth
+        author_rank = self.leaderboard_index.rank(str(ctx.author.id))
+        if author_rank is not None:
+            embed.set_footer(
+                text=f"Your rank: #{author_rank} of {len(self.leaderboard_index)}")
 
-        # Sort them from highest to lowest
-        sorted_users = sorted(leaderboard_data.items(),
-                              key=lambda item: item[1],
-                              reverse=True)
+        await ctx.send(embed=embed)
 
+    async def _render_leaderboard(self, guild, sorted_users):
+        """(embed, True if every name resolved)."""
         embed = discord.Embed(title="🏆 Richest Users (by Net Worth)",
                               color=discord.Color.gold())
 
@@ -1010,26 +1293,25 @@ class AllCommands(commands.Cog):
         else:
             embed.description = "The top users based on their total wallet value."
 
-        for i, (user_id, net_worth) in enumerate(sorted_users[:count]):
-            try:
-                # Need to use self.bot to fetch user
-                user = await self.bot.fetch_user(int(user_id))
-                # [تصحيح] التأكد من أن user ليس None
-                if user is not None:
-                    user_display_name = f"**{i+1}. {user.name}**"
-                else:
-                    user_display_name = f"**{i+1}. Unknown User**"
+        # Resolve every name at once (gateway cache first, REST last)
+        names = await self.name_resolver.resolve_many(
+            [int(user_id) for user_id, _ in sorted_users], guild)
 
-                # Display the net worth in the value using Markdown
-                embed.add_field(name=user_display_name,
-                                value=f"`{net_worth}` 🍪 Total Worth",
-                                inline=False)
-            except Exception:
-                embed.add_field(name=f"**{i+1}. Unknown User**",
-                                value=f"`{net_worth}` 🍪 Total Worth",
-                                inline=False)
+        all_named = True
+        for i, (user_id, net_worth) in enumerate(sorted_users):
+            name = names.get(int(user_id))
+            if name is not None:
+                user_display_name = f"**{i+1}. {name}**"
+            else:
+                user_display_name = f"**{i+1}. Unknown User**"
+                all_named = False
 
-        await ctx.send(embed=embed)
+            # Display the net worth in the value using Markdown
+            embed.add_field(name=user_display_name,
+                            value=f"`{net_worth}` 🍪 Total Worth",
+                            inline=False)
+
+        return embed, all_named
 
 
 # This function is required to load the cog
@@ -2,30 +2,39 @@ import discord
 import os
 import asyncio 
 from discord.ext import commands
-from flask import Flask, jsonify
-from threading import Thread
-from typing import Optional
-import math # <-- [NEW] Import math for cooldown timer
-
-# --- (Keep Alive Section (from AI code)) ---
-# This will keep the bot running 24/7 with UptimeRobot
-app = Flask('')
-
-@app.route('/')
-def home():
-    # This is the route UptimeRobot will visit
-    return jsonify({'status': 'Bot is alive!'})
-
-def run_server():
-    # [تصحيح] تم تغيير البورت إلى 5000
-    port = int(os.environ.get('PORT', 5000)) 
-    app.run(host='0.0.0.0', port=port)
-
-def keep_alive():
-    # This function runs the web server in a separate thread
-    t = Thread(target=run_server)
-    t.start()
-# ----------------------------------------------------
+
+# --- (Economy Section) ---
+
+# Every wallet key that holds an amount ("bank" is shown separately)
+CURRENCIES = ["cookie", "coffee", "milk", "bank"]
+
+# What one of each is worth in cookies (for net worth)
+CURRENCY_VALUES = {"cookie": 1, "coffee": 5, "milk": 3, "bank": 1}
+
+CURRENCY_EMOJIS = {"cookie": "🍪", "coffee": "☕", "milk": "🥛", "bank": "🏦"}
+
+# Items bought and sold for cookies (!buy / !sell)
+item_shop = {
+    "coffee": {"name": "Coffee", "price": 5},
+    "milk": {"name": "Milk", "price": 3},
+}
+
+# Roles bought once, shown as a permanent emoji in front of the nickname.
+# The role IDs belong to your server: set them in Secrets (🔒).
+shop_items = {
+    "gold": {"name": "Gold Role", "price": 1000, "emoji": "🥇",
+             "role_id": int(os.environ.get('GOLD_ROLE_ID', 0))},
+    "silver": {"name": "Silver Role", "price": 500, "emoji": "🥈",
+               "role_id": int(os.environ.get('SILVER_ROLE_ID', 0))},
+    "bronze": {"name": "Bronze Role", "price": 100, "emoji": "🥉",
+               "role_id": int(os.environ.get('BRONZE_ROLE_ID', 0))},
+}
+
+# Items used up (!use) for a temporary emoji in front of the nickname
+TEMPORARY_ITEMS = {
+    "coffee": {"cost": 5, "emoji": "☕"},
+    "milk": {"cost": 5, "emoji": "🥛"},
+}
 
 # --- (Bot Section) ---
 
@@ -84,9 +93,6 @@ async def main():
         print("[Error] Bot token not found in Secrets (🔒)")
         return
 
-    # Start the keep-alive server
-    keep_alive() 
-
     # Load the commands from our other file
     try:
         await bot.load_extension('bot_commands')
@@ -0,0 +1,115 @@
+import time
+from collections import OrderedDict
+
+from discord.ext import commands
+
+import metrics
+from wallet_store import CachedWalletStore
+
+COOLDOWN_CACHE_SIZE = 10000
+
+
+class PersistentCooldown:
+    """A per-user cooldown that survives restarts.
+
+    The next allowed timestamp is saved in the user's wallet under `field`.
+    A small LRU dict keeps recent values so repeated checks don't touch
+    storage; evicted users are simply read back from their wallet.
+
+    With `shared` state, the reservation is also claimed there, so two
+    shard processes can't both start the cooldown for the same user.
+    """
+
+    def __init__(self, store: CachedWalletStore, field: str, per: float,
+                 cache_size: int = COOLDOWN_CACHE_SIZE, shared=None):
+        self.store = store
+        self.field = field
+        self.per = per
+        self.shared = shared
+        self.cache_size = cache_size
+        # Used to build CommandOnCooldown errors (rate 1 per `per` seconds)
+        self.cooldown = commands.Cooldown(1, per)
+        self._next_allowed = OrderedDict()  # {user_id: timestamp}
+
+    def peek(self, user_id: str, now=None) -> float:
+        """Seconds left as far as the in-memory cache knows (0 if unknown).
+
+        Never reserves and never touches storage.
+        """
+        if now is None:
+            now = time.time()
+        return max(self._next_allowed.get(user_id, 0) - now, 0)
+
+    async def reserve(self, user_id: str, now=None) -> float:
+        """Starts the cooldown if it is over. Returns the seconds left (0 if reserved)."""
+        if now is None:
+            now = time.time()
+
+        next_allowed = self._next_allowed.get(user_id)
+        if next_allowed is None:
+            wallet = await self.store.get_wallet(user_id)
+            # Another call may have reserved while we were waiting
+            next_allowed = self._next_allowed.get(user_id,
+                                                  wallet.get(self.field, 0))
+
+        if next_allowed > now:
+            self._remember(user_id, next_allowed)
+            return next_allowed - now
+
+        next_allowed = int(now + self.per)
+        if self.shared is not None:
+            key = f"cooldown:{self.field}:{user_id}"
+            if not await self.shared.add(key, next_allowed, self.per):
+                # Another process reserved it first
+                taken = await self.shared.get(key) or next_allowed
+                self._remember(user_id, taken)
+                return max(taken - now, 0.001)
+        self._remember(user_id, next_allowed)
+        async with self.store.transaction(user_id) as txn:
+            txn[user_id][self.field] = next_allowed
+        return 0
+
+    def _remember(self, user_id: str, next_allowed: float):
+        self._next_allowed[user_id] = next_allowed
+        self._next_allowed.move_to_end(user_id)
+        if len(self._next_allowed) > self.cache_size:
+            self._next_allowed.popitem(last=False)
+
+
+def _on_cooldown(cooldown: PersistentCooldown, retry_after: float):
+    return commands.CommandOnCooldown(cooldown.cooldown, retry_after,
+                                      commands.BucketType.user)
+
+
+def persistent_cooldown(attribute: str):
+    """Cooldown decorator using the cog's PersistentCooldown named `attribute`.
+
+    Like @commands.cooldown, the cooldown is only started once the command
+    is about to run (a before_invoke hook), so `can_run` and the help
+    command never use it up. The check only rejects users the cache
+    already knows are on cooldown. Both raise the normal
+    CommandOnCooldown, so on_command_error handles it the same way.
+    """
+
+    async def predicate(ctx):
+        cooldown = getattr(ctx.cog, attribute)
+        retry_after = cooldown.peek(str(ctx.author.id))
+        if retry_after > 0:
+            raise _on_cooldown(cooldown, retry_after)
+        return True
+
+    async def reserve(cog, ctx):
+        cooldown = getattr(cog, attribute)
+        # Runs before cog_before_invoke: count its storage calls as the command's
+        token = metrics.current_scope.set(ctx.command.qualified_name)
+        try:
+            retry_after = await cooldown.reserve(str(ctx.author.id))
+        finally:
+            metrics.current_scope.reset(token)
+        if retry_after > 0:
+            raise _on_cooldown(cooldown, retry_after)
+
+    def decorator(func):
+        return commands.check(predicate)(commands.before_invoke(reserve)(func))
+
+    return decorator
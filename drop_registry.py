@@ -0,0 +1,87 @@
+import asyncio
+import os
+import time
+
+from wallet_store import WalletStore
+
+DROPS_KEY = "cookie_drops"
+DROP_TTL_SECONDS = int(os.environ.get('DROP_TTL_SECONDS', 3600))  # 1 hour
+
+
+class DropRegistry:
+    """Open cookie drops, keyed by the drop message ID.
+
+    The dict is the in-memory index; every change is also written to the
+    wallet backend under DROPS_KEY, so drops survive restarts and
+    `reload_extension`. Each drop has its own expiry time.
+
+    With `shared` state, a claim also has to win a claim token there, so
+    only one shard process can ever pay out a drop.
+    """
+
+    def __init__(self, backend: WalletStore, key: str = DROPS_KEY,
+                 ttl: int = DROP_TTL_SECONDS, shared=None):
+        self.backend = backend
+        self.key = key
+        self.ttl = ttl
+        self.shared = shared
+        self._drops = {}  # {message_id: {"channel_id", "amount", "admin", "expires"}}
+        self._save_lock = asyncio.Lock()
+
+    async def load(self):
+        data = await self.backend.get(self.key) or {}
+        # JSON object keys are strings
+        self._drops = {int(message_id): drop for message_id, drop in data.items()}
+
+    async def add(self, message_id: int, channel_id: int, amount: int,
+                  admin: bool = False, ttl=None):
+        self._drops[message_id] = {
+            "channel_id": channel_id,
+            "amount": amount,
+            "admin": admin,
+            "expires": int(time.time()) + (ttl or self.ttl),
+        }
+        await self._save()
+
+    async def claim(self, message_id: int):
+        """Removes and returns the drop, or None if there is no live drop."""
+        # Popped before any await, so only one claimer can ever get it
+        drop = self._drops.pop(message_id, None)
+        if drop is None:
+            return None
+        await self._save()
+        if drop["expires"] <= time.time():
+            return None
+        if self.shared is not None and not await self.shared.add(
+                f"drop_claim:{message_id}", True, self.ttl):
+            return None
+        return drop
+
+    async def sweep(self, now=None) -> dict:
+        """Removes expired drops and returns them as {message_id: drop}."""
+        if now is None:
+            now = time.time()
+        expired = {
+            message_id: drop
+            for message_id, drop in self._drops.items()
+            if drop["expires"] <= now
+        }
+        if expired:
+            for message_id in expired:
+                del self._drops[message_id]
+            await self._save()
+        return expired
+
+    def __contains__(self, message_id: int):
+        return message_id in self._drops
+
+    def __len__(self):
+        return len(self._drops)
+
+    async def _save(self):
+        # One write at a time, each sending the latest state
+        async with self._save_lock:
+            await self.backend.put(self.key, {
+                str(message_id): drop
+                for message_id, drop in self._drops.items()
+            })
@@ -0,0 +1,127 @@
+import os
+import random
+import time
+from collections import OrderedDict
+
+# --- Drop Settings (override with environment variables) ---
+DROP_CHANCE_PERCENT = float(os.environ.get('DROP_CHANCE_PERCENT', 1))
+DROP_CHANNEL_PER_HOUR = float(os.environ.get('DROP_CHANNEL_PER_HOUR', 6))
+DROP_CHANNEL_BURST = float(os.environ.get('DROP_CHANNEL_BURST', 1))
+DROP_GUILD_PER_HOUR = float(os.environ.get('DROP_GUILD_PER_HOUR', 20))
+DROP_GUILD_BURST = float(os.environ.get('DROP_GUILD_BURST', 3))
+DROP_MIN_SPACING_SECONDS = float(os.environ.get('DROP_MIN_SPACING_SECONDS', 120))
+DROP_MAX_OPEN = int(os.environ.get('DROP_MAX_OPEN', 50))
+
+# Idle buckets are full anyway, so only this many are remembered
+MAX_TRACKED_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `capacity`."""
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def available(self, now: float) -> bool:
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens >= 1
+
+    def take(self):
+        self.tokens -= 1
+
+
+class DropScheduler:
+    """Decides whether a chat message should spawn a cookie drop.
+
+    A message must win the random roll, then pass (in order) the global cap
+    on open drops, the per-channel minimum spacing, and the per-channel and
+    per-guild token buckets. Tokens are only taken when every check passes.
+    """
+
+    def __init__(self,
+                 chance_percent: float = DROP_CHANCE_PERCENT,
+                 channel_per_hour: float = DROP_CHANNEL_PER_HOUR,
+                 channel_burst: float = DROP_CHANNEL_BURST,
+                 guild_per_hour: float = DROP_GUILD_PER_HOUR,
+                 guild_burst: float = DROP_GUILD_BURST,
+                 min_spacing: float = DROP_MIN_SPACING_SECONDS,
+                 max_open: int = DROP_MAX_OPEN):
+        self.chance = chance_percent / 100
+        self.channel_rate = channel_per_hour / 3600
+        self.channel_burst = channel_burst
+        self.guild_rate = guild_per_hour / 3600
+        self.guild_burst = guild_burst
+        self.min_spacing = min_spacing
+        self.max_open = max_open
+
+        self._channel_buckets = OrderedDict()  # {channel_id: TokenBucket}
+        self._guild_buckets = OrderedDict()  # {guild_id: TokenBucket}
+        self._last_drop = OrderedDict()  # {channel_id: timestamp}
+
+        self.counters = {
+            "created": 0,
+            "suppressed_open_cap": 0,
+            "suppressed_spacing": 0,
+            "suppressed_channel_rate": 0,
+            "suppressed_guild_rate": 0,
+        }
+
+    def should_drop(self, guild_id: int, channel_id: int, open_drops: int,
+                    now=None) -> bool:
+        if random.random() >= self.chance:
+            return False
+
+        if now is None:
+            now = time.monotonic()
+
+        if open_drops >= self.max_open:
+            self.counters["suppressed_open_cap"] += 1
+            return False
+
+        last = self._last_drop.get(channel_id)
+        if last is not None and now - last < self.min_spacing:
+            self.counters["suppressed_spacing"] += 1
+            return False
+
+        channel_bucket = self._bucket(self._channel_buckets, channel_id,
+                                      self.channel_rate, self.channel_burst, now)
+        if not channel_bucket.available(now):
+            self.counters["suppressed_channel_rate"] += 1
+            return False
+
+        guild_bucket = self._bucket(self._guild_buckets, guild_id,
+                                    self.guild_rate, self.guild_burst, now)
+        if not guild_bucket.available(now):
+            self.counters["suppressed_guild_rate"] += 1
+            return False
+
+        channel_bucket.take()
+        guild_bucket.take()
+        self._remember(self._last_drop, channel_id, now)
+        self.counters["created"] += 1
+        return True
+
+    @property
+    def suppressed(self) -> int:
+        return sum(count for name, count in self.counters.items()
+                   if name.startswith("suppressed_"))
+
+    def _bucket(self, buckets: OrderedDict, key: int, rate: float,
+                capacity: float, now: float) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(rate, capacity, now)
+        self._remember(buckets, key, bucket)
+        return bucket
+
+    @staticmethod
+    def _remember(mapping: OrderedDict, key, value):
+        mapping[key] = value
+        mapping.move_to_end(key)
+        if len(mapping) > MAX_TRACKED_BUCKETS:
+            mapping.popitem(last=False)
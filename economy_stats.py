@@ -0,0 +1,115 @@
+import os
+
+import numpy as np
+
+from bot_config import CURRENCIES, CURRENCY_VALUES
+
+# Rows added at a time when the snapshot runs out of space
+ECONOMY_GROW_ROWS = int(os.environ.get('ECONOMY_GROW_ROWS', 4096))
+# Buckets in the net worth histogram (log-spaced)
+ECONOMY_HISTOGRAM_BINS = int(os.environ.get('ECONOMY_HISTOGRAM_BINS', 10))
+
+# One column per currency (and the bank); last_taxed is a timestamp
+COLUMNS = tuple(dict.fromkeys([*CURRENCIES, "bank"]))
+
+
+class EconomySnapshot:
+    """Every wallet's balances as one NumPy array, for economy-wide stats.
+
+    Row i holds one user's balances in COLUMNS order. Built once from all
+    wallets, then kept current by a write hook that overwrites a single
+    row, so a query never has to read the wallets again. `summary()` is
+    computed with array operations and cached until the next change.
+    """
+
+    def __init__(self, grow_rows: int = ECONOMY_GROW_ROWS):
+        self.grow_rows = grow_rows
+        self.values = np.array([CURRENCY_VALUES.get(name, 0) for name in COLUMNS],
+                               dtype=np.int64)
+        self._rows = {}  # {user_id: row}
+        self._data = np.zeros((0, len(COLUMNS)), dtype=np.int64)
+        self._size = 0
+        self._version = 0
+        self._summary = None  # (version, summary)
+
+    def rebuild(self, wallets):
+        """Loads `(user_id, wallet)` pairs (done once at startup)."""
+        wallets = list(wallets)
+        self._rows = {user_id: row for row, (user_id, _) in enumerate(wallets)}
+        self._data = np.array(
+            [[wallet.get(name, 0) for name in COLUMNS] for _, wallet in wallets],
+            dtype=np.int64).reshape(len(wallets), len(COLUMNS))
+        self._size = len(wallets)
+        self._version += 1
+
+    def update(self, user_id: str, wallet: dict):
+        """Write hook: overwrites the user's row (adding one if new)."""
+        row = self._rows.get(user_id)
+        if row is None:
+            if self._size == len(self._data):
+                grown = np.zeros((self._size + self.grow_rows, len(COLUMNS)),
+                                 dtype=np.int64)
+                grown[:self._size] = self._data[:self._size]
+                self._data = grown
+            row = self._rows[user_id] = self._size
+            self._size += 1
+        self._data[row] = [wallet.get(name, 0) for name in COLUMNS]
+        self._version += 1
+
+    def __len__(self):
+        return self._size
+
+    def summary(self) -> dict:
+        """Totals, percentiles, Gini and a histogram of net worth."""
+        if self._summary is not None and self._summary[0] == self._version:
+            return self._summary[1]
+
+        data = self._data[:self._size]
+        worth = data @ self.values
+        totals = data.sum(axis=0)
+        holders = np.count_nonzero(data, axis=0)
+        result = {
+            "users": int(self._size),
+            "totals": {name: int(total) for name, total in zip(COLUMNS, totals)},
+            "holders": {name: int(count) for name, count in zip(COLUMNS, holders)},
+            "net_worth_total": int(worth.sum()),
+        }
+
+        cookies = result["totals"].get("cookie", 0)
+        bank = result["totals"].get("bank", 0)
+        result["cookies_in_circulation"] = cookies + bank
+        result["bank_share"] = round(bank / (cookies + bank), 4) if cookies + bank else 0.0
+
+        positive = np.sort(worth[worth > 0])
+        result["gini"] = round(_gini(positive), 4)
+        if len(positive):
+            p50, p90, p99 = np.percentile(positive, [50, 90, 99])
+            result["percentiles"] = {"p50": float(p50), "p90": float(p90),
+                                     "p99": float(p99)}
+            result["histogram"] = _histogram(positive)
+        else:
+            result["percentiles"] = {}
+            result["histogram"] = []
+
+        self._summary = (self._version, result)
+        return result
+
+
+def _gini(sorted_worth) -> float:
+    """Gini coefficient of an ascending array of positive values."""
+    count = len(sorted_worth)
+    if count == 0:
+        return 0.0
+    ranks = np.arange(1, count + 1)
+    return float((2 * ranks - count - 1) @ sorted_worth / (count * sorted_worth.sum()))
+
+
+def _histogram(positive) -> list:
+    """[{"from", "to", "users"}] over log-spaced net worth buckets."""
+    edges = np.unique(np.geomspace(1, max(positive[-1], 1) + 1,
+                                   ECONOMY_HISTOGRAM_BINS + 1).astype(np.int64))
+    if len(edges) < 2:
+        edges = np.array([1, 2])
+    counts, edges = np.histogram(positive, bins=edges)
+    return [{"from": int(low), "to": int(high), "users": int(count)}
+            for low, high, count in zip(edges[:-1], edges[1:], counts)]
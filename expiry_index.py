@@ -0,0 +1,96 @@
+import asyncio
+import heapq
+
+from wallet_store import WalletStore
+
+NICK_EXPIRY_KEY = "nick_expiry"
+
+
+class ExpiryIndex:
+    """Persisted {user_id: expires} index with a min-heap for due lookups.
+
+    The mapping is stored under one backend key so it survives restarts.
+    The heap may hold stale entries (rescheduled or removed users); they
+    are skipped when popped.
+    """
+
+    def __init__(self, backend: WalletStore, key: str = NICK_EXPIRY_KEY):
+        self.backend = backend
+        self.key = key
+        self._expires = {}  # {user_id: expires}
+        self._heap = []  # [(expires, user_id)]
+        self._save_lock = asyncio.Lock()
+
+    async def load(self) -> bool:
+        """Loads the saved index. Returns False if none has been saved yet."""
+        data = await self.backend.get(self.key)
+        if data is None:
+            return False
+        self._expires = {user_id: int(expires) for user_id, expires in data.items()}
+        self._rebuild_heap()
+        return True
+
+    async def rebuild(self, entries: dict):
+        """Replaces the index (used once to migrate from old wallets)."""
+        self._expires = dict(entries)
+        self._rebuild_heap()
+        await self._save()
+
+    async def schedule(self, user_id: str, expires: int):
+        self._expires[user_id] = expires
+        heapq.heappush(self._heap, (expires, user_id))
+        await self._save()
+
+    def due(self, now: int) -> dict:
+        """{user_id: expires} for every entry due at or before `now`.
+
+        Nothing is removed: once the caller has recorded the users somewhere
+        safe, it hands the result to `remove()`.
+        """
+        due = {}
+        # Only heap nodes that are due can have due children
+        stack = [0]
+        while stack:
+            i = stack.pop()
+            if i >= len(self._heap) or self._heap[i][0] > now:
+                continue
+            expires, user_id = self._heap[i]
+            if self._expires.get(user_id) == expires:
+                due[user_id] = expires
+            stack += (2 * i + 1, 2 * i + 2)
+        return due
+
+    async def remove(self, entries: dict):
+        """Removes users whose entry is still the one in `entries`.
+
+        A user rescheduled since `due()` keeps the new entry.
+        """
+        removed = False
+        for user_id, expires in entries.items():
+            if self._expires.get(user_id) == expires:
+                del self._expires[user_id]
+                removed = True
+        self._drop_stale()
+        if removed:
+            await self._save()
+
+    def __len__(self):
+        return len(self._expires)
+
+    def _drop_stale(self):
+        while self._heap:
+            expires, user_id = self._heap[0]
+            if self._expires.get(user_id) == expires:
+                return
+            heapq.heappop(self._heap)
+
+    def _rebuild_heap(self):
+        self._heap = [(expires, user_id)
+                      for user_id, expires in self._expires.items()]
+        heapq.heapify(self._heap)
+
+    async def _save(self):
+        # One write at a time, each sending the latest state, so an older
+        # snapshot can never land after a newer one
+        async with self._save_lock:
+            await self.backend.put(self.key, dict(self._expires))
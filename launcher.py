@@ -0,0 +1,106 @@
+"""Runs the bot as several processes, each with its own range of shards.
+
+    python launcher.py --shards 8 --processes 2
+
+Every process runs main.py with SHARD_COUNT, SHARD_IDS and its own PORT
+(base port + process number). Unless SHARED_STATE is already set, the
+processes share state through SQLite (see shared_state.py). A process that
+exits is restarted with a growing delay.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import sys
+
+from logging_setup import setup_logging
+
+# Restart delays for a crashing process: doubles up to the maximum
+RESTART_DELAY_SECONDS = 1.0
+RESTART_DELAY_MAX_SECONDS = 60.0
+# A process that ran this long is considered healthy again
+HEALTHY_AFTER_SECONDS = 300
+
+log = logging.getLogger('launcher')
+
+
+def shard_ranges(shards: int, processes: int) -> list:
+    """Splits shards 0..shards-1 into contiguous "start-end" ranges."""
+    processes = max(1, min(processes, shards))
+    size, extra = divmod(shards, processes)
+    ranges = []
+    start = 0
+    for number in range(processes):
+        end = start + size + (1 if number < extra else 0)
+        ranges.append(f"{start}-{end - 1}")
+        start = end
+    return ranges
+
+
+async def run_process(number: int, shard_ids: str, env: dict,
+                      stopping: asyncio.Event):
+    """Keeps one shard process running until `stopping` is set."""
+    delay = RESTART_DELAY_SECONDS
+    main_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    while not stopping.is_set():
+        process = await asyncio.create_subprocess_exec(sys.executable, main_py,
+                                                       env=env)
+        log.info("Started process %d (shards %s, pid %d).", number, shard_ids,
+                 process.pid)
+        started = asyncio.get_running_loop().time()
+
+        waiter = asyncio.ensure_future(process.wait())
+        stopper = asyncio.ensure_future(stopping.wait())
+        await asyncio.wait({waiter, stopper}, return_when=asyncio.FIRST_COMPLETED)
+        stopper.cancel()
+        if stopping.is_set():
+            if process.returncode is None:
+                process.terminate()
+            await waiter
+            return
+
+        if asyncio.get_running_loop().time() - started > HEALTHY_AFTER_SECONDS:
+            delay = RESTART_DELAY_SECONDS
+        log.warning("Process %d (shards %s) exited with %s; restarting in %.0fs.",
+                    number, shard_ids, process.returncode, delay)
+        try:
+            await asyncio.wait_for(stopping.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+        delay = min(delay * 2, RESTART_DELAY_MAX_SECONDS)
+
+
+async def launch(shards: int, processes: int, base_port: int):
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    runners = []
+    for number, shard_ids in enumerate(shard_ranges(shards, processes)):
+        env = dict(os.environ,
+                   SHARD_COUNT=str(shards),
+                   SHARD_IDS=shard_ids,
+                   PORT=str(base_port + number))
+        env.setdefault('SHARED_STATE', 'sqlite')
+        runners.append(run_process(number, shard_ids, env, stopping))
+    await asyncio.gather(*runners)
+    log.info("All shard processes stopped.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, required=True,
+                        help="total shard count")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--base-port", type=int,
+                        default=int(os.environ.get('PORT', 8080)),
+                        help="web server port of process 0 (others count up)")
+    args = parser.parse_args()
+
+    log_listener = setup_logging()
+    try:
+        asyncio.run(launch(args.shards, args.processes, args.base_port))
+    finally:
+        log_listener.stop()
@@ -0,0 +1,67 @@
+from bisect import bisect_left, insort
+
+from bot_config import CURRENCY_VALUES
+
+
+def net_worth(wallet: dict) -> int:
+    """Total wallet value in cookies (bank included, like the leaderboard always did)."""
+    total = 0
+    for item_name, amount in wallet.items():
+        if item_name == "last_taxed" or not isinstance(amount, (int, float)):
+            continue
+        total += amount * CURRENCY_VALUES.get(item_name, 0)
+    return total
+
+
+class LeaderboardIndex:
+    """Net worth of every user with a positive balance, kept sorted.
+
+    Entries are `(-net_worth, user_id)` tuples in a sorted list, so the top N
+    is a slice and a user's rank is one binary search. Updates remove and
+    re-insert a single entry.
+    """
+
+    def __init__(self):
+        self._worth = {}  # {user_id: net_worth}
+        self._sorted = []  # [(-net_worth, user_id)]
+
+    def rebuild(self, wallets):
+        """Builds the index from `(user_id, wallet)` pairs (done once at startup)."""
+        self._worth = {}
+        for user_id, wallet in wallets:
+            worth = net_worth(wallet)
+            if worth > 0:
+                self._worth[user_id] = worth
+        self._sorted = sorted((-worth, user_id)
+                              for user_id, worth in self._worth.items())
+
+    def update(self, user_id: str, wallet: dict):
+        """Re-ranks one user after their wallet changed."""
+        worth = net_worth(wallet)
+        old_worth = self._worth.get(user_id)
+        if old_worth == worth:
+            return
+
+        if old_worth is not None:
+            position = bisect_left(self._sorted, (-old_worth, user_id))
+            del self._sorted[position]
+            del self._worth[user_id]
+
+        if worth > 0:
+            self._worth[user_id] = worth
+            insort(self._sorted, (-worth, user_id))
+
+    def top(self, count: int) -> list:
+        """The `count` richest users as `(user_id, net_worth)` pairs."""
+        return [(user_id, -negative_worth)
+                for negative_worth, user_id in self._sorted[:count]]
+
+    def rank(self, user_id: str):
+        """1-based rank of the user, or None if they are not on the board."""
+        worth = self._worth.get(user_id)
+        if worth is None:
+            return None
+        return bisect_left(self._sorted, (-worth, user_id)) + 1
+
+    def __len__(self):
+        return len(self._sorted)
@@ -0,0 +1,444 @@
+"""Append-only ledger of wallet changes, with periodic wallet snapshots.
+
+    python ledger.py wallet 123456789             # state from snapshot + ledger
+    python ledger.py wallet 123456789 --at 2026-10-01T12:00
+    python ledger.py export > ledger.csv          # every record, for analysis
+
+A wallet's state at any point is the latest snapshot taken before it, with
+the later ledger records replayed on top.
+"""
+import argparse
+import csv
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+
+import metrics
+from wallet_codec import WALLET_FIELDS, decode_wallet, encode_wallet, load_wallet
+from wallet_store import CachedWalletStore, fix_wallet, run_blocking
+
+# --- Ledger Settings (override with environment variables) ---
+# Set LEDGER=0 to turn the ledger off
+LEDGER_ENABLED = os.environ.get('LEDGER', '1') == '1'
+LEDGER_DIR = os.environ.get('LEDGER_DIR', 'ledger')
+LEDGER_SNAPSHOT_SECONDS = int(os.environ.get('LEDGER_SNAPSHOT_SECONDS', 6 * 3600))
+# Snapshots kept (with the ledger needed to replay from them)
+LEDGER_KEEP_SNAPSHOTS = int(os.environ.get('LEDGER_KEEP_SNAPSHOTS', 8))
+# Segment files grow (and are mapped) this much at a time
+LEDGER_GROW_BYTES = 4 * 1024 * 1024
+
+# --- Record Format ---
+#
+#   ledger record  <QIQqHH  seq, unix time, user ID, delta, field, reason
+#                           (32 bytes; a record with seq 0 is unused space)
+#   snapshot       <8sQQqI  magic, first seq of the segment it started,
+#                           last seq when it finished, unix time, count
+#                  then per wallet: <QI user ID, record length, then the
+#                  compact wallet record (see wallet_codec.py)
+#
+# `field` indexes the field table stored with the segments (FIELDS_FILE,
+# one wallet field name per line) and `reason` indexes REASONS. Both only
+# ever grow at the end: a wallet field without a code is appended to the
+# table before its first record, so the wallet record layout can change
+# without renumbering the ledger.
+
+RECORD = struct.Struct("<QIQqHH")
+# The same layout for numpy.frombuffer (offline analytics)
+RECORD_DTYPE = [("seq", "<u8"), ("ts", "<u4"), ("user_id", "<u8"),
+                ("delta", "<i8"), ("field", "<u2"), ("reason", "<u2")]
+SNAPSHOT_HEADER = struct.Struct("<8sQQqI")
+SNAPSHOT_ENTRY = struct.Struct("<QI")
+SNAPSHOT_MAGIC = b"WALLSNAP"
+FIELDS_FILE = "fields.txt"
+
+# Command, event or loop names (see metrics.current_scope)
+REASONS = ("other", "tax", "daily", "slots", "dice", "give", "steal",
+           "deposit", "withdraw", "buy", "sell", "award", "use",
+           "drop_claim", "temp_nick")
+_REASON_CODES = {name: code for code, name in enumerate(REASONS)}
+
+# Field codes of ledgers written before the table was stored (the wallet
+# record layout of the time: currencies, then bank and last_taxed)
+_LEGACY_FIELDS = (*(name for name in WALLET_FIELDS if name not in ("bank", "last_taxed")),
+                  "bank", "last_taxed")
+
+log = logging.getLogger("bot.storage")
+
+
+def reason_code(scope: str) -> int:
+    """Maps a metrics scope ("give", "event:drop_claim", "loop:tax") to a code."""
+    name = scope.rpartition(":")[2]
+    return _REASON_CODES.get(name, 0)
+
+
+def _segment_path(directory: str, first_seq: int) -> str:
+    return os.path.join(directory, f"{first_seq:020d}.log")
+
+
+def _snapshot_path(directory: str, last_seq: int) -> str:
+    return os.path.join(directory, f"{last_seq:020d}.snap")
+
+
+def read_fields(directory: str) -> list:
+    """The ledger's field table: field names, indexed by code."""
+    try:
+        with open(os.path.join(directory, FIELDS_FILE), encoding="utf-8") as f:
+            return f.read().split()
+    except FileNotFoundError:
+        # No table yet: empty for a new ledger, the old codes for an old one
+        return list(_LEGACY_FIELDS) if _files(directory, ".log") else []
+
+
+def _files(directory: str, suffix: str) -> list:
+    """[(number, path)] of segment or snapshot files, oldest first."""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted((int(name[:-len(suffix)]), os.path.join(directory, name))
+                  for name in names if name.endswith(suffix))
+
+
+def _used_records(buffer) -> int:
+    """Number of written records in a segment (binary search for seq 0)."""
+    low, high = 0, len(buffer) // RECORD.size
+    while low < high:
+        middle = (low + high) // 2
+        if RECORD.unpack_from(buffer, middle * RECORD.size)[0]:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def iter_segment(path: str):
+    """Yields every record (as a tuple) in one segment file."""
+    with open(path, "rb") as f:
+        data = f.read()
+    used = _used_records(data)
+    yield from RECORD.iter_unpack(memoryview(data)[:used * RECORD.size])
+
+
+class Ledger:
+    """Memory-mapped, append-only log of numeric wallet changes.
+
+    Hooked into the wallet store as a change hook: every committed change
+    appends one 32-byte record per changed field (the delta) and stamps
+    the wallet with its last sequence number (`ledger_seq`). Appends are a
+    copy into the mapped file, so they never wait on the disk.
+
+    The log is split into segments; a new one starts with every snapshot,
+    and old snapshots and segments are deleted as new ones are taken.
+
+    `sync()` runs on the I/O thread pool while appends, growth and segment
+    switches run on the event loop; `_map_lock` keeps a flush from ever
+    seeing a map that is being closed or swapped.
+    """
+
+    def __init__(self, directory: str = None):
+        self.directory = directory or LEDGER_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        self.seq = 0
+        self._file = None
+        self._map = None
+        self._offset = 0
+        self._map_lock = threading.Lock()
+        self.fields = self._load_fields()
+        self._field_codes = {name: code for code, name in enumerate(self.fields)}
+        self._open_latest()
+
+    # --- Writing ---
+
+    def _load_fields(self) -> list:
+        """Reads the field table, appending any wallet field it lacks."""
+        fields = read_fields(self.directory)
+        missing = [name for name in WALLET_FIELDS if name not in fields]
+        path = os.path.join(self.directory, FIELDS_FILE)
+        if missing or not os.path.exists(path):
+            # Append-only: existing codes never move
+            with open(path, "a", encoding="utf-8") as f:
+                if f.tell() == 0:
+                    missing = fields + missing
+                f.write("".join(name + "\n" for name in missing))
+                f.flush()
+                os.fsync(f.fileno())
+            fields = read_fields(self.directory)
+        return fields
+
+    def _open_latest(self):
+        segments = _files(self.directory, ".log")
+        if not segments:
+            self._open_segment(_segment_path(self.directory, 1))
+            return
+        self._open_segment(segments[-1][1])
+        used = _used_records(self._map)
+        self._offset = used * RECORD.size
+        if used:
+            self.seq = RECORD.unpack_from(self._map, self._offset - RECORD.size)[0]
+        else:
+            self.seq = segments[-1][0] - 1
+
+    def _open_segment(self, path: str):
+        with self._map_lock:
+            self._close()
+            self._file = open(path, "a+b")
+            size = os.fstat(self._file.fileno()).st_size
+            if size == 0:
+                size = LEDGER_GROW_BYTES
+                self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), size)
+            self._offset = 0
+
+    def _grow(self):
+        with self._map_lock:
+            size = len(self._map) + LEDGER_GROW_BYTES
+            self._map.close()
+            self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), size)
+
+    def append(self, user_id: int, field: int, delta: int, reason: int,
+               now=None) -> int:
+        """Appends one record and returns its sequence number."""
+        if self._offset + RECORD.size > len(self._map):
+            self._grow()
+        self.seq += 1
+        RECORD.pack_into(self._map, self._offset, self.seq,
+                         int(now or time.time()), user_id, delta, field, reason)
+        self._offset += RECORD.size
+        return self.seq
+
+    def record_changes(self, changes: dict, reason=None):
+        """Change hook for CachedWalletStore (see wallet_store.py)."""
+        code = reason_code(reason or metrics.current_scope.get())
+        now = int(time.time())
+        for user_id, (old, new) in changes.items():
+            last = None
+            for name, field in self._field_codes.items():
+                delta = new.get(name, 0) - old.get(name, 0)
+                if delta:
+                    last = self.append(int(user_id), field, delta, code, now)
+            if last is not None:
+                new["ledger_seq"] = last
+
+    def sync(self):
+        """Forces written records to disk (the OS does it eventually anyway)."""
+        with self._map_lock:
+            if self._map is not None:
+                self._map.flush()
+
+    def close(self):
+        with self._map_lock:
+            self._close()
+
+    def _close(self):
+        # Caller holds _map_lock
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # --- Snapshots ---
+
+    async def snapshot(self, store: CachedWalletStore) -> str:
+        """Writes every wallet to a new snapshot file and returns its path.
+
+        Wallets change while the snapshot is taken, so each one keeps its
+        own `ledger_seq`; replay skips records a wallet already includes.
+        """
+        await run_blocking(self.sync)
+        # New segment first: replay starts at the segment before a snapshot
+        first_seq = self.seq + 1
+        self._open_segment(_segment_path(self.directory, first_seq))
+
+        path = _snapshot_path(self.directory, first_seq) + ".tmp"
+        count = 0
+        with open(path, "wb") as f:
+            f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, 0, 0, 0, 0))
+            chunk = []
+            async for user_id, wallet in store.iter_wallets(raw=True):
+                record = encode_wallet(wallet)
+                chunk.append(SNAPSHOT_ENTRY.pack(int(user_id), len(record)))
+                chunk.append(record)
+                count += 1
+                if len(chunk) >= 1000:
+                    await run_blocking(f.write, b"".join(chunk))
+                    chunk = []
+            await run_blocking(f.write, b"".join(chunk))
+            f.seek(0)
+            f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, first_seq, self.seq,
+                                         int(time.time()), count))
+            await run_blocking(os.fsync, f.fileno())
+        final = _snapshot_path(self.directory, self.seq)
+        os.replace(path, final)
+        self._prune()
+        log.info("Ledger snapshot written (%d wallets, seq %d).", count, self.seq)
+        return final
+
+    def _prune(self):
+        snapshots = _files(self.directory, ".snap")
+        if len(snapshots) <= LEDGER_KEEP_SNAPSHOTS:
+            return
+        for _, path in snapshots[:-LEDGER_KEEP_SNAPSHOTS]:
+            os.remove(path)
+        # Keep the segment before the oldest snapshot's own (see replay)
+        oldest = read_snapshot_header(snapshots[-LEDGER_KEEP_SNAPSHOTS][1])
+        segments = _files(self.directory, ".log")
+        keep_from = max((i for i, (first, _) in enumerate(segments)
+                         if first <= oldest["first_seq"]), default=0)
+        for _, path in segments[:max(keep_from - 1, 0)]:
+            os.remove(path)
+
+    # --- Crash Recovery ---
+
+    async def recover(self, store: CachedWalletStore) -> int:
+        """Re-applies records that never reached the backend (call at startup).
+
+        The wallet cache writes back every few seconds, so a crash can lose
+        the last changes; the ledger still has them. Wallets are read raw
+        (no read hooks) and saved with the missing deltas replayed.
+        """
+        since = self._replay_start()
+        pending = {}  # {user_id: [(seq, field, delta)]}
+        for segment in since:
+            for seq, ts, user_id, delta, field, reason in iter_segment(segment):
+                pending.setdefault(str(user_id), []).append((seq, field, delta))
+        if not pending:
+            return 0
+
+        recovered = {}
+        user_ids = list(pending)
+        for start in range(0, len(user_ids), 500):
+            page = user_ids[start:start + 500]
+            stored = await store.backend.get_many(page)
+            for user_id in page:
+                wallet = load_wallet(stored.get(user_id), fix_wallet)
+                if apply_records(wallet, pending[user_id], self.fields):
+                    recovered[user_id] = wallet
+        if recovered:
+            await store.save_many(recovered)
+            log.warning("Recovered %d wallet(s) from the ledger.", len(recovered))
+        return len(recovered)
+
+    def _replay_start(self) -> list:
+        """Segment paths from the one before the current segment onwards."""
+        segments = _files(self.directory, ".log")
+        return [path for _, path in segments[-2:]]
+
+
+def apply_records(wallet: dict, records, fields) -> bool:
+    """Applies (seq, field, delta) records newer than the wallet's ledger_seq.
+
+    `fields` is the ledger's field table (see read_fields).
+    """
+    applied = False
+    seq_seen = wallet.get("ledger_seq", 0)
+    for seq, field, delta in records:
+        if seq > seq_seen:
+            name = fields[field]
+            wallet[name] = wallet.get(name, 0) + delta
+            wallet["ledger_seq"] = seq_seen = seq
+            applied = True
+    return applied
+
+
+# --- Offline Reading ---
+
+
+def read_snapshot_header(path: str) -> dict:
+    with open(path, "rb") as f:
+        magic, first_seq, last_seq, ts, count = SNAPSHOT_HEADER.unpack(
+            f.read(SNAPSHOT_HEADER.size))
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError(f"{path} is not a wallet snapshot")
+    return {"first_seq": first_seq, "last_seq": last_seq, "ts": ts, "count": count}
+
+
+def iter_snapshot(path: str):
+    """Yields (user_id, wallet) for every wallet in a snapshot file."""
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = SNAPSHOT_HEADER.size
+    while offset < len(data):
+        user_id, length = SNAPSHOT_ENTRY.unpack_from(data, offset)
+        offset += SNAPSHOT_ENTRY.size
+        yield str(user_id), decode_wallet(data[offset:offset + length])
+        offset += length
+
+
+def iter_records(directory: str = LEDGER_DIR, since_seq: int = 0):
+    """Yields every ledger record with seq > since_seq, oldest first."""
+    segments = _files(directory, ".log")
+    for index, (first_seq, path) in enumerate(segments):
+        next_first = segments[index + 1][0] if index + 1 < len(segments) else None
+        if next_first is not None and next_first <= since_seq + 1:
+            continue  # the whole segment is older
+        for record in iter_segment(path):
+            if record[0] > since_seq:
+                yield record
+
+
+def wallet_at(user_id: str, directory: str = LEDGER_DIR, until_ts=None):
+    """A wallet's fields as they were at `until_ts` (default: now).
+
+    None if the ledger doesn't go back far enough to know.
+    """
+    until_ts = until_ts or time.time()
+    snapshots = [path for _, path in _files(directory, ".snap")
+                 if read_snapshot_header(path)["ts"] <= until_ts]
+    if snapshots:
+        wallet = next((w for uid, w in iter_snapshot(snapshots[-1]) if uid == user_id),
+                      None)
+    else:
+        segments = _files(directory, ".log")
+        if not segments or segments[0][0] != 1:
+            return None  # older history has been pruned
+        wallet = None
+    records = [(seq, field, delta)
+               for seq, ts, uid, delta, field, reason in iter_records(directory)
+               if str(uid) == user_id and ts <= until_ts]
+    if wallet is None:
+        if not records:
+            return None
+        # Not in the snapshot: a new user since then
+        wallet = {name: 0 for name in WALLET_FIELDS}
+
+    # Records the snapshot already includes are skipped by ledger_seq
+    apply_records(wallet, records, read_fields(directory))
+    return wallet
+
+
+def _parse_time(text: str) -> float:
+    return datetime.fromisoformat(text).timestamp()
+
+
+def _export(directory: str, out):
+    writer = csv.writer(out)
+    writer.writerow(["seq", "time", "user_id", "field", "delta", "reason"])
+    fields = read_fields(directory)
+    for seq, ts, user_id, delta, field, reason in iter_records(directory):
+        writer.writerow([seq, ts, user_id, fields[field], delta,
+                         REASONS[reason] if reason < len(REASONS) else reason])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dir", default=LEDGER_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    show = commands.add_parser("wallet", help="print a wallet at a point in time")
+    show.add_argument("user_id")
+    show.add_argument("--at", type=_parse_time, help="ISO time (default: now)")
+    commands.add_parser("export", help="write every record as CSV to stdout")
+    args = parser.parse_args()
+
+    if args.command == "wallet":
+        print(wallet_at(args.user_id, args.dir, args.at))
+    else:
+        _export(args.dir, sys.stdout)
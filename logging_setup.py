@@ -0,0 +1,136 @@
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+# --- Logging Settings (override with environment variables) ---
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+# Per-subsystem levels, e.g. "bot.tax=WARNING,bot.drops=DEBUG,discord=WARNING"
+LOG_LEVELS = os.environ.get('LOG_LEVELS', 'discord=WARNING')
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')  # json | text
+# Each repeated message (same logger + template) is let through this many
+# times per window; the rest are counted and reported on the next one.
+LOG_RATE_LIMIT = int(os.environ.get('LOG_RATE_LIMIT', 10))
+LOG_RATE_WINDOW_SECONDS = float(os.environ.get('LOG_RATE_WINDOW_SECONDS', 60))
+
+# Attributes every LogRecord has; anything else came from `extra=` and is
+# written out as a field of its own.
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and extras."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets each message template through at most `limit` times per window.
+
+    Messages are keyed by logger name and the unformatted template, so
+    "Error processing tax for user %s" counts as one message no matter
+    which user it is about. The number dropped is attached to the next
+    record that gets through as `suppressed`.
+    """
+
+    def __init__(self, limit: int = LOG_RATE_LIMIT,
+                 window: float = LOG_RATE_WINDOW_SECONDS):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._windows = {}  # {(logger, template): [window start, seen, dropped]}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.limit <= 0:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        state = self._windows.get(key)
+        if state is None or now - state[0] >= self.window:
+            dropped = state[2] if state else 0
+            state = self._windows[key] = [now, 0, 0]
+            if dropped:
+                record.suppressed = dropped
+        state[1] += 1
+        if state[1] > self.limit:
+            state[2] += 1
+            return False
+        if state[2]:
+            record.suppressed = state[2]
+            state[2] = 0
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps the traceback apart from the message."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve args and tracebacks now; they may not survive the thread hop
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _parse_levels(spec: str) -> dict:
+    levels = {}
+    for part in spec.split(','):
+        name, _, level = part.strip().partition('=')
+        if name and level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level: str = LOG_LEVEL, levels: str = LOG_LEVELS,
+                  fmt: str = LOG_FORMAT) -> logging.handlers.QueueListener:
+    """Routes all logging through a queue to a background writer thread.
+
+    The event loop only pays for putting a record on the queue; formatting
+    and the (blocking) write to stdout happen on the listener's thread.
+    Returns the listener; call `.stop()` on shutdown to drain the queue.
+    """
+    if fmt == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            '%(asctime)s %(levelname)s %(name)s: %(message)s')
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+    for name, subsystem_level in _parse_levels(levels).items():
+        logging.getLogger(name).setLevel(subsystem_level)
+
+    listener = logging.handlers.QueueListener(log_queue, stream,
+                                              respect_handler_level=True)
+    listener.start()
+    return listener
@@ -1,30 +1,17 @@
 import discord
+import logging
 import os
 import asyncio 
 from discord.ext import commands
-from flask import Flask, jsonify
-from threading import Thread
 from typing import Optional
 import math # <-- [NEW] Import math for cooldown timer
 
-# --- (Keep Alive Section (from AI code)) ---
-# This will keep the bot running 24/7 with UptimeRobot
-app = Flask('')
+from logging_setup import setup_logging
+from member_cache import LOW_MEMORY_MODE, bot_options
+import sharding
+from web_server import WebServer
 
-@app.route('/')
-def home():
-    # This is the route UptimeRobot will visit
-    return jsonify({'status': 'Bot is alive!'})
-
-def run_server():
-    port = int(os.environ.get('PORT', 8080))
-    app.run(host='0.0.0.0', port=port)
-
-def keep_alive():
-    # This function runs the web server in a separate thread
-    t = Thread(target=run_server)
-    t.start()
-# ----------------------------------------------------
+log = logging.getLogger('bot')
 
 # --- (Bot Section) ---
 
@@ -35,13 +22,24 @@ intents.members = True         # To see member information
 intents.guilds = True          # Required for role management
 
 # 2. Define the Bot (Prefix is !)
-bot = commands.Bot(command_prefix='!', intents=intents, help_command=None)
+# LOW_MEMORY_MODE=1 skips the full member cache (see member_cache.py)
+# SHARD_COUNT / SHARD_IDS switch to an AutoShardedBot (see launcher.py)
+bot_class = commands.AutoShardedBot if sharding.SHARD_COUNT else commands.Bot
+bot = bot_class(command_prefix='!', intents=intents, help_command=None,
+                **bot_options(), **sharding.bot_options())
+
+# --- (Keep Alive Section) ---
+# This will keep the bot running 24/7 with UptimeRobot.
+# It runs on the same asyncio loop as the bot (see web_server.py).
+web_server = WebServer(bot)
 
 # 3. On Ready Event (Simple)
 @bot.event
 async def on_ready():
-    print(f'Bot logged in as: {bot.user}')
-    print('---------------------------')
+    log.info('Bot logged in as: %s (shards %s of %s)', bot.user,
+             getattr(bot, 'shard_ids', None) or 'all', bot.shard_count or 1)
+    if LOW_MEMORY_MODE:
+        log.info('Low-memory mode: members are fetched on demand.')
 
 # 4. (Important) Error Handling (Moved from main file)
 @bot.event
@@ -72,32 +70,42 @@ async def on_command_error(ctx, error):
     elif isinstance(error, commands.BadArgument):
         await ctx.send(f"Error: Invalid argument. Make sure you are using the command correctly.")
     else:
-        # Print other errors to the console for debugging
-        print(f"An unexpected error occurred: {error}") 
+        # Log other errors (with traceback) for debugging
+        log.error("An unexpected error occurred: %s", error, exc_info=error)
 
 # --- [NEW] Main async function to load Cogs and run the bot ---
 async def main():
+    # Structured logs, written from a background thread (see logging_setup.py)
+    log_listener = setup_logging()
+
     # Get the token
     token = os.environ.get('DISCORD_BOT_TOKEN') 
     if not token:
-        print("[Error] Bot token not found in Secrets (🔒)")
+        log.error("Bot token not found in Secrets (🔒)")
+        log_listener.stop()
         return
 
     # Start the keep-alive server
-    keep_alive() 
+    await web_server.start()
 
     # Load the commands from our other file
     try:
         await bot.load_extension('bot_commands')
-        print("Successfully loaded 'bot_commands.py'")
-    except Exception as e:
-        print(f"Failed to load 'bot_commands.py': {e}")
+        log.info("Successfully loaded 'bot_commands.py'")
+    except Exception:
+        log.exception("Failed to load 'bot_commands.py'")
 
     # Start the bot
     try:
         await bot.start(token)
     except Exception as e:
-        print(f"[Error] An issue occurred: {e}")
+        log.error("An issue occurred: %s", e)
+    finally:
+        # Closing the bot unloads the cogs (which flushes wallets)
+        if not bot.is_closed():
+            await bot.close()
+        await web_server.stop()
+        log_listener.stop()
 
 # --- (Run Section) ---
 if __name__ == "__main__":
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import re
+import resource
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import discord
+from discord.ext import commands
+
+# --- Member Cache Settings (override with environment variables) ---
+# LOW_MEMORY_MODE=1: don't cache every member of every guild; members are
+# fetched when a command needs them and kept in a small LRU instead
+LOW_MEMORY_MODE = os.environ.get('LOW_MEMORY_MODE', '0') == '1'
+MEMBER_LRU_SIZE = int(os.environ.get('MEMBER_LRU_SIZE', 1000))
+MEMBER_LRU_TTL = int(os.environ.get('MEMBER_LRU_TTL', 300))  # seconds
+MEMBER_FETCH_CONCURRENCY = int(os.environ.get('MEMBER_FETCH_CONCURRENCY', 4))
+
+_MENTION_OR_ID = re.compile(r'<@!?(\d{15,20})>$|(\d{15,20})$')
+
+
+def bot_options(low_memory: bool = LOW_MEMORY_MODE) -> dict:
+    """Keyword arguments for commands.Bot that control the member cache."""
+    if not low_memory:
+        return {}
+    return {
+        # Keep only members discord.py hands us (message authors, etc.)
+        'member_cache_flags': discord.MemberCacheFlags.none(),
+        # Don't download every guild's member list on connect
+        'chunk_guilds_at_startup': False,
+    }
+
+
+def resident_memory_bytes() -> Optional[int]:
+    """Current RSS of this process (peak RSS where /proc is missing)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except (OSError, ValueError):
+        return None
+
+
+class MemberResolver:
+    """Finds guild members, falling back to `fetch_member` when uncached.
+
+    Order of lookups: the guild's member cache (enough on its own once the
+    guild is chunked), then an LRU of earlier fetches (entries expire after
+    `ttl` so roles and nicknames don't go stale), and only then
+    `fetch_member`, capped by a semaphore. Members that don't exist are
+    remembered too, as None.
+    """
+
+    def __init__(self, bot, size: int = MEMBER_LRU_SIZE,
+                 ttl: int = MEMBER_LRU_TTL,
+                 concurrency: int = MEMBER_FETCH_CONCURRENCY):
+        self.bot = bot
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.fetches = 0
+        self._members = OrderedDict()  # {(guild_id, user_id): (member, expires_at)}
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def get(self, guild: discord.Guild, user_id: int):
+        """The member, or None if they are not in the guild."""
+        member = guild.get_member(user_id)
+        # A chunked guild has every member cached: a miss means "not a member"
+        if member is not None or guild.chunked:
+            return member
+
+        key = (guild.id, user_id)
+        cached = self._members.get(key)
+        if cached is not None and cached[1] > time.monotonic():
+            self._members.move_to_end(key)
+            self.hits += 1
+            return cached[0]
+
+        async with self._semaphore:
+            self.fetches += 1
+            try:
+                member = await guild.fetch_member(user_id)
+            except discord.NotFound:
+                member = None
+        self._store(key, member)
+        return member
+
+    def forget(self, guild_id: int, user_id: int):
+        self._members.pop((guild_id, user_id), None)
+
+    def __len__(self):
+        return len(self._members)
+
+    def _store(self, key, member):
+        self._members[key] = (member, time.monotonic() + self.ttl)
+        self._members.move_to_end(key)
+        while len(self._members) > self.size:
+            self._members.popitem(last=False)
+
+
+class LazyMember(commands.Converter):
+    """Member argument that goes through the cog's MemberResolver.
+
+    Mentions and IDs are looked up in the message's mentions, then the
+    resolver; anything else (names) uses discord.py's MemberConverter.
+    """
+
+    async def convert(self, ctx, argument: str) -> discord.Member:
+        resolver = getattr(ctx.cog, 'member_resolver', None)
+        match = _MENTION_OR_ID.match(argument)
+        if resolver is None or match is None or ctx.guild is None:
+            return await commands.MemberConverter().convert(ctx, argument)
+
+        user_id = int(match.group(1) or match.group(2))
+        for mentioned in ctx.message.mentions:
+            if mentioned.id == user_id and isinstance(mentioned, discord.Member):
+                return mentioned
+        member = await resolver.get(ctx.guild, user_id)
+        if member is None:
+            raise commands.MemberNotFound(argument)
+        return member
@@ -0,0 +1,283 @@
+import contextvars
+import functools
+import json
+import time
+from bisect import bisect_left
+
+from wallet_store import WalletStore
+
+# Default histogram buckets (seconds) for commands and loop iterations
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Name of the command or loop currently running in this task. Storage calls
+# are counted against it, so /metrics shows which commands cost round-trips.
+current_scope = contextvars.ContextVar("metrics_scope", default="other")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values = {}  # {label values: count}
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        for label_values, value in sorted(self._values.items()):
+            yield self.name + _labels(self.label_names, label_values), value
+
+
+class Histogram:
+    """Cumulative bucket histogram (Prometheus semantics) with optional labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels=(),
+                 buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # {label values: [bucket counts..., sum, count]}
+
+    def observe(self, value: float, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+        # Only the first matching bucket is bumped; totals are summed on export
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def count(self, *label_values) -> int:
+        series = self._series.get(label_values)
+        return series[-1] if series else 0
+
+    def samples(self):
+        for label_values, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, hits in zip(self.buckets, series):
+                cumulative += hits
+                yield (self.name + "_bucket" + _labels(
+                    self.label_names, label_values, f'le="{_number(bound)}"'),
+                       cumulative)
+            yield (self.name + "_bucket" + _labels(
+                self.label_names, label_values, 'le="+Inf"'), series[-1])
+            yield self.name + "_sum" + _labels(self.label_names, label_values), series[-2]
+            yield self.name + "_count" + _labels(self.label_names, label_values), series[-1]
+
+
+class Gauge:
+    """Value read from a callback when metrics are scraped.
+
+    `kind="counter"` exposes a monotonic value someone else already counts.
+    """
+
+    def __init__(self, name: str, help_text: str, read, kind: str = "gauge"):
+        self.name = name
+        self.help = help_text
+        self.read = read
+        self.kind = kind
+
+    def samples(self):
+        value = self.read()
+        if value is not None:
+            yield self.name, value
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._metrics = {}
+
+    def counter(self, name: str, help_text: str, labels=()) -> Counter:
+        return self._add(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels=(),
+                  buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def gauge(self, name: str, help_text: str, read, kind: str = "gauge") -> Gauge:
+        """Registers (or replaces) a gauge whose value comes from `read()`."""
+        gauge = Gauge(name, help_text, read, kind)
+        self._metrics[name] = gauge
+        return gauge
+
+    def remove(self, name: str):
+        self._metrics.pop(name, None)
+
+    def _add(self, metric):
+        # Re-registering returns the existing metric (cog reloads)
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                samples = list(metric.samples())
+            except Exception:
+                continue  # A broken gauge should not break the whole scrape
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample, value in samples:
+                lines.append(f"{sample} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+COMMAND_LATENCY = REGISTRY.histogram(
+    "bot_command_duration_seconds", "Time spent running a command.",
+    labels=("command", ))
+COMMAND_ERRORS = REGISTRY.counter(
+    "bot_command_errors_total", "Commands that raised an error.",
+    labels=("command", ))
+LOOP_LATENCY = REGISTRY.histogram(
+    "bot_loop_duration_seconds", "Time spent in one background loop iteration.",
+    labels=("loop", ))
+STORAGE_CALLS = REGISTRY.counter(
+    "bot_storage_calls_total",
+    "Backend calls (one per key for reads, one per batch for writes).",
+    labels=("scope", "op"))
+STORAGE_BYTES = REGISTRY.counter(
+    "bot_storage_bytes_total", "Payload bytes read from / written to the backend.",
+    labels=("scope", "direction"))
+
+
+# --- Commands and loops ---
+
+
+def command_started(ctx):
+    """Call from a before_invoke hook."""
+    ctx._metrics_started = time.perf_counter()
+    ctx._metrics_token = current_scope.set(ctx.command.qualified_name)
+
+
+def command_finished(ctx):
+    """Call from an after_invoke hook (it also runs when the command failed)."""
+    started = getattr(ctx, "_metrics_started", None)
+    if started is None:
+        return
+    name = ctx.command.qualified_name
+    COMMAND_LATENCY.observe(time.perf_counter() - started, name)
+    if ctx.command_failed:
+        COMMAND_ERRORS.inc(name)
+    current_scope.reset(ctx._metrics_token)
+    ctx._metrics_started = None
+
+
+def timed_loop(name: str):
+    """Decorator for a tasks.loop body: times it and attributes its storage calls.
+
+    Usage (under @tasks.loop so the loop still sees a coroutine function):
+        @tasks.loop(minutes=1)
+        @timed_loop("temp_nick_task")
+        async def temp_nick_task(self): ...
+    """
+
+    def decorator(func):
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            token = current_scope.set(f"loop:{name}")
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                LOOP_LATENCY.observe(time.perf_counter() - started, name)
+                current_scope.reset(token)
+
+        return wrapper
+
+    return decorator
+
+
+# --- Storage ---
+
+
+def _payload_size(value) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return len(json.dumps(value))
+
+
+class InstrumentedBackend(WalletStore):
+    """Wraps a backend and counts calls and bytes per command/loop."""
+
+    def __init__(self, backend: WalletStore):
+        self.backend = backend
+
+    async def get(self, key: str):
+        value = await self.backend.get(key)
+        scope = current_scope.get()
+        STORAGE_CALLS.inc(scope, "read")
+        STORAGE_BYTES.inc(scope, "read", amount=_payload_size(value))
+        return value
+
+    async def get_many(self, keys) -> dict:
+        keys = list(keys)
+        values = await self.backend.get_many(keys)
+        scope = current_scope.get()
+        STORAGE_CALLS.inc(scope, "read", amount=len(keys))
+        STORAGE_BYTES.inc(scope, "read",
+                          amount=sum(_payload_size(value) for value in values.values()))
+        return values
+
+    async def put_many(self, items: dict):
+        if not items:
+            return
+        await self.backend.put_many(items)
+        scope = current_scope.get()
+        STORAGE_CALLS.inc(scope, "write")
+        STORAGE_BYTES.inc(scope, "write",
+                          amount=sum(_payload_size(value) for value in items.values()))
+
+    async def delete(self, key: str):
+        await self.backend.delete(key)
+        STORAGE_CALLS.inc(current_scope.get(), "delete")
+
+    async def keys(self, prefix: str = ""):
+        keys = await self.backend.keys(prefix)
+        STORAGE_CALLS.inc(current_scope.get(), "list")
+        return keys
+
+    async def close(self):
+        await self.backend.close()
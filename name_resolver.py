@@ -0,0 +1,75 @@
+import asyncio
+import os
+import time
+
+import discord
+
+# --- Name Resolution Settings ---
+NAME_CACHE_TTL = int(os.environ.get('NAME_CACHE_TTL', 3600))  # seconds
+NAME_FETCH_CONCURRENCY = int(os.environ.get('NAME_FETCH_CONCURRENCY', 4))
+
+
+class NameResolver:
+    """Turns user IDs into display names with as few REST calls as possible.
+
+    Order of lookups: the gateway cache (`bot.get_user` / guild members),
+    then a TTL cache of earlier results, and only then `fetch_user`, run
+    concurrently but capped by a semaphore. If Discord rate limits us,
+    fetching is paused and the names show up as unknown until it resumes.
+    """
+
+    def __init__(self, bot, ttl: int = NAME_CACHE_TTL,
+                 concurrency: int = NAME_FETCH_CONCURRENCY):
+        self.bot = bot
+        self.ttl = ttl
+        self._names = {}  # {user_id: (name or None, expires_at)}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._paused_until = 0.0
+
+    async def resolve_many(self, user_ids, guild=None) -> dict:
+        """Returns {user_id: name}; the name is None for unknown users."""
+        now = time.monotonic()
+        names = {}
+        missing = []
+
+        for user_id in user_ids:
+            user = self.bot.get_user(user_id)
+            if user is None and guild is not None:
+                user = guild.get_member(user_id)
+            if user is not None:
+                names[user_id] = user.name
+                self._names[user_id] = (user.name, now + self.ttl)
+                continue
+
+            cached = self._names.get(user_id)
+            if cached is not None and cached[1] > now:
+                names[user_id] = cached[0]
+            else:
+                missing.append(user_id)
+
+        if missing:
+            fetched = await asyncio.gather(
+                *(self._fetch_name(user_id) for user_id in missing))
+            names.update(zip(missing, fetched))
+
+        return names
+
+    async def _fetch_name(self, user_id: int):
+        if time.monotonic() < self._paused_until:
+            return None
+
+        async with self._semaphore:
+            try:
+                user = await self.bot.fetch_user(user_id)
+                name = user.name if user is not None else None
+            except discord.NotFound:
+                name = None
+            except discord.HTTPException as e:
+                if e.status == 429:
+                    retry_after = getattr(e, 'retry_after', 5.0)
+                    self._paused_until = time.monotonic() + retry_after
+                # Don't cache failures other than "user not found"
+                return None
+
+        self._names[user_id] = (name, time.monotonic() + self.ttl)
+        return name
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+import random
+
+import aiohttp
+import discord
+
+# --- Nickname Revert Settings (override with environment variables) ---
+# Member edits in flight at once, across all guilds
+NICK_REVERT_CONCURRENCY = int(os.environ.get('NICK_REVERT_CONCURRENCY', 8))
+# ...and per guild (Discord rate limits member edits per guild)
+NICK_REVERT_PER_GUILD = int(os.environ.get('NICK_REVERT_PER_GUILD', 2))
+NICK_REVERT_RETRIES = int(os.environ.get('NICK_REVERT_RETRIES', 3))
+NICK_REVERT_BACKOFF_SECONDS = float(os.environ.get('NICK_REVERT_BACKOFF_SECONDS', 1.0))
+# User IDs per member query when searching guilds (Discord's maximum)
+NICK_QUERY_BATCH = 100
+
+log = logging.getLogger("bot.nick")
+
+# Outcome of one revert job
+DONE = "done"  # reverted, or nothing left to revert
+GONE = "gone"  # member or guild not found, or no permission: give up
+RETRY = "retry"  # still failing after every retry: try again later
+
+
+class RevertJob:
+    """One expired temporary nickname to take off a user."""
+
+    __slots__ = ("user_id", "emoji", "expires", "guild_ids", "status")
+
+    def __init__(self, user_id: str, emoji: str, expires: int, guild_ids):
+        self.user_id = user_id
+        self.emoji = emoji
+        self.expires = expires
+        self.guild_ids = guild_ids  # guilds to revert in (None: search all)
+        self.status = None
+
+
+class NickReverter:
+    """Reverts many temporary nicknames at once without tripping rate limits.
+
+    Jobs are grouped by guild. A job's guilds come from the wallet (the
+    guild `!use` was run in); older wallets without one fall back to every
+    guild the member is in, found from the member cache or with one
+    batched member query per guild (never one lookup per user and guild).
+    The guilds found are left in `job.guild_ids` for the caller to keep.
+    Other members are looked up with the awaitable `resolve(guild,
+    user_id)` (see member_cache.py).
+
+    Edits run concurrently, capped both overall and per guild, since
+    discord.py queues requests that share a rate-limit bucket anyway.
+    Network errors, 429s and 5xx are retried with backoff; a job that
+    still fails is marked RETRY so the caller keeps it.
+
+    `new_nick(member, emoji)` returns the nickname to set (None to clear
+    it), or False if the temporary emoji is no longer there.
+    """
+
+    def __init__(self, bot, new_nick, resolve,
+                 concurrency: int = NICK_REVERT_CONCURRENCY,
+                 per_guild: int = NICK_REVERT_PER_GUILD,
+                 retries: int = NICK_REVERT_RETRIES,
+                 backoff: float = NICK_REVERT_BACKOFF_SECONDS):
+        self.bot = bot
+        self.new_nick = new_nick
+        self.resolve = resolve
+        self.per_guild = per_guild
+        self.retries = retries
+        self.backoff = backoff
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._guild_semaphores = {}  # {guild_id: Semaphore}
+
+    async def run(self, jobs) -> list:
+        """Reverts every job and sets its `status`. Returns the jobs."""
+        jobs = list(jobs)
+        # {job: [status per guild]}; a job is only done once every guild is
+        results = {job: [] for job in jobs}
+        by_guild = await self._group_by_guild(jobs, results)
+
+        async def edit(guild, member, job):
+            results[job].append(await self._edit(guild, member, job))
+
+        edits = []
+        for guild_id, guild_jobs in by_guild.items():
+            guild = self.bot.get_guild(guild_id)
+            for job, member in guild_jobs:
+                if member is None and guild is not None:
+                    member = await self.resolve(guild, int(job.user_id))
+                if member is None:
+                    results[job].append(GONE)
+                else:
+                    edits.append(edit(guild, member, job))
+        await asyncio.gather(*edits)
+
+        for job in jobs:
+            statuses = results[job]
+            if RETRY in statuses:
+                job.status = RETRY
+            elif DONE in statuses:
+                job.status = DONE
+            else:
+                job.status = GONE
+        return jobs
+
+    async def _group_by_guild(self, jobs, results) -> dict:
+        """{guild_id: [(job, member or None)]}, searching guilds if needed."""
+        by_guild = {}
+        unknown = {}
+        for job in jobs:
+            if job.guild_ids:
+                for guild_id in job.guild_ids:
+                    by_guild.setdefault(guild_id, []).append((job, None))
+            else:
+                unknown[int(job.user_id)] = job
+        if not unknown:
+            return by_guild
+
+        failed = set()
+        for guild in self.bot.guilds:
+            found = [member for member in map(guild.get_member, unknown)
+                     if member is not None]
+            if not guild.chunked:
+                # Members missing from the cache: one query per 100 users
+                missing = [member_id for member_id in unknown
+                           if guild.get_member(member_id) is None]
+                for start in range(0, len(missing), NICK_QUERY_BATCH):
+                    batch = missing[start:start + NICK_QUERY_BATCH]
+                    try:
+                        found += await guild.query_members(
+                            user_ids=batch, limit=len(batch), cache=False)
+                    except (discord.ClientException, asyncio.TimeoutError) as e:
+                        # The user may be here after all: keep the job for later
+                        log.warning("Member query failed in %s: %s", guild.id, e)
+                        for member_id in batch:
+                            results[unknown[member_id]].append(RETRY)
+                            failed.add(unknown[member_id])
+            for member in found:
+                job = unknown[member.id]
+                by_guild.setdefault(guild.id, []).append((job, member))
+                job.guild_ids = (job.guild_ids or []) + [guild.id]
+        for job in failed:
+            job.guild_ids = None  # not every guild was searched
+        return by_guild
+
+    def _guild_semaphore(self, guild_id: int) -> asyncio.Semaphore:
+        semaphore = self._guild_semaphores.get(guild_id)
+        if semaphore is None:
+            semaphore = self._guild_semaphores[guild_id] = asyncio.Semaphore(
+                self.per_guild)
+        return semaphore
+
+    async def _edit(self, guild, member, job) -> str:
+        nick = self.new_nick(member, job.emoji)
+        if nick is False:
+            return DONE
+
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                async with self._guild_semaphore(guild.id), self._semaphore:
+                    await member.edit(nick=nick)
+                log.debug("Reverted temporary nickname for %s in %s.",
+                          member.name, guild.id)
+                return DONE
+            except (discord.Forbidden, discord.NotFound) as e:
+                log.warning("Could not revert nick for %s in %s: %s",
+                            member.name, guild.id, e)
+                return GONE
+            except discord.RateLimited as e:
+                retry_after = e.retry_after
+                error = repr(e)
+            except discord.HTTPException as e:
+                if e.status != 429 and e.status < 500:
+                    # e.g. 400: the nickname was rejected; retrying won't help
+                    log.warning("Error reverting nick for %s in %s: %s",
+                                member.name, guild.id, e)
+                    return GONE
+                error = repr(e)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = repr(e)
+
+            if attempt >= self.retries:
+                log.warning("Giving up on nick revert for %s in %s for now: %s",
+                            member.name, guild.id, error)
+                return RETRY
+            delay = retry_after or self.backoff * (2**attempt) * random.uniform(0.5, 1.5)
+            attempt += 1
+            await asyncio.sleep(delay)
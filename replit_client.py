@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import os
+import random
+from typing import Optional
+from urllib.parse import quote, unquote
+
+import aiohttp
+
+# --- Replit DB Settings (override with environment variables) ---
+# Replit sets REPLIT_DB_URL (and writes it to /tmp/replitdb) for every repl
+REPLIT_DB_URL = os.environ.get('REPLIT_DB_URL')
+REPLIT_DB_URL_FILE = '/tmp/replitdb'
+REPLIT_DB_CONCURRENCY = int(os.environ.get('REPLIT_DB_CONCURRENCY', 16))
+REPLIT_DB_RETRIES = int(os.environ.get('REPLIT_DB_RETRIES', 4))
+REPLIT_DB_BACKOFF_SECONDS = float(os.environ.get('REPLIT_DB_BACKOFF_SECONDS', 0.25))
+REPLIT_DB_TIMEOUT_SECONDS = float(os.environ.get('REPLIT_DB_TIMEOUT_SECONDS', 10))
+# Key/value pairs sent per POST when setting many keys
+REPLIT_DB_SET_BATCH = int(os.environ.get('REPLIT_DB_SET_BATCH', 100))
+
+log = logging.getLogger("bot.storage")
+
+
+class ReplitDBError(Exception):
+    """The database kept failing after every retry."""
+
+
+def database_url() -> Optional[str]:
+    if REPLIT_DB_URL:
+        return REPLIT_DB_URL
+    try:
+        with open(REPLIT_DB_URL_FILE) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+class ReplitDBClient:
+    """Async client for the Replit DB HTTP API.
+
+    Protocol (all values are strings):
+        GET    {url}/{key}                -> value, or 404
+        POST   {url}  key=value&...       -> sets one or more keys
+        DELETE {url}/{key}
+        GET    {url}?prefix=p&encode=true -> matching keys, one per line
+
+    One pooled keep-alive session is shared by every call. Multi-gets run
+    up to `concurrency` requests at once, and failed requests (network
+    errors, 429 and 5xx) are retried with exponential backoff.
+    """
+
+    def __init__(self, url: Optional[str] = None,
+                 concurrency: int = REPLIT_DB_CONCURRENCY,
+                 retries: int = REPLIT_DB_RETRIES,
+                 backoff: float = REPLIT_DB_BACKOFF_SECONDS,
+                 timeout: float = REPLIT_DB_TIMEOUT_SECONDS):
+        self.url = (url or database_url() or "").rstrip("/")
+        if not self.url:
+            raise ReplitDBError("REPLIT_DB_URL is not set")
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session = None
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Created lazily: a ClientSession must be made inside the running loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.concurrency,
+                                             keepalive_timeout=30)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=self.timeout)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _request(self, method: str, url: str, **kwargs):
+        """Returns (status, body text), retrying transient failures."""
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                async with self._semaphore:
+                    async with self._get_session().request(method, url,
+                                                           **kwargs) as response:
+                        body = await response.text()
+                        if response.status == 429:
+                            retry_after = response.headers.get("Retry-After")
+                        elif response.status < 500:
+                            return response.status, body
+                error = f"HTTP {response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = repr(e)
+
+            if attempt >= self.retries:
+                raise ReplitDBError(f"{method} failed after {attempt + 1} attempt(s): {error}")
+            try:
+                delay = float(retry_after)
+            except (TypeError, ValueError):
+                delay = self.backoff * (2**attempt) * random.uniform(0.5, 1.5)
+            log.warning("Replit DB %s failed (%s), retrying in %.2fs", method,
+                        error, delay)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def _key_url(self, key: str) -> str:
+        return f"{self.url}/{quote(key, safe='')}"
+
+    async def get_raw(self, key: str) -> Optional[str]:
+        """The stored string, or None if the key does not exist."""
+        status, body = await self._request("GET", self._key_url(key))
+        if status == 404:
+            return None
+        if status != 200:
+            raise ReplitDBError(f"GET {key!r}: HTTP {status}")
+        return body
+
+    async def get_many_raw(self, keys) -> dict:
+        """Fetches several keys concurrently over the pooled connections."""
+        keys = list(keys)
+        values = await asyncio.gather(*(self.get_raw(key) for key in keys))
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    async def set_bulk_raw(self, values: dict):
+        items = list(values.items())
+        for start in range(0, len(items), REPLIT_DB_SET_BATCH):
+            status, body = await self._request(
+                "POST", self.url, data=dict(items[start:start + REPLIT_DB_SET_BATCH]))
+            if status not in (200, 204):
+                raise ReplitDBError(f"POST: HTTP {status}")
+
+    async def delete(self, key: str):
+        status, body = await self._request("DELETE", self._key_url(key))
+        if status not in (200, 204, 404):
+            raise ReplitDBError(f"DELETE {key!r}: HTTP {status}")
+
+    async def keys(self, prefix: str = "") -> list:
+        """Every key starting with `prefix`, in one request."""
+        status, body = await self._request("GET", self.url,
+                                           params={"prefix": prefix, "encode": "true"})
+        if status != 200:
+            raise ReplitDBError(f"list {prefix!r}: HTTP {status}")
+        if not body:
+            return []
+        return [unquote(key) for key in body.split("\n")]
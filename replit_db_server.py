@@ -0,0 +1,103 @@
+"""Local stand-in for the Replit DB HTTP API (for testing and benchmarks).
+
+    python replit_db_server.py --port 8765 --latency 0.002
+    export REPLIT_DB_URL=http://127.0.0.1:8765
+
+Data lives in memory only.
+"""
+import argparse
+import asyncio
+from urllib.parse import quote
+
+from aiohttp import web
+
+
+class ReplitDBServer:
+    """In-memory server speaking the Replit DB protocol (see replit_client.py).
+
+    `latency` adds a delay to every request, and `requests` counts them.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.data = {}
+        self.latency = latency
+        self.requests = 0
+        self.url = None
+        self._runner = None
+
+        self.app = web.Application(middlewares=[self._count])
+        self.app.add_routes([
+            web.get('/', self.list_keys),
+            web.post('/', self.set_keys),
+            web.get('/{key:.+}', self.get_key),
+            web.delete('/{key:.+}', self.delete_key),
+        ])
+
+    @web.middleware
+    async def _count(self, request, handler):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return await handler(request)
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Starts listening (port 0 picks a free one) and returns the base URL."""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_host, bound_port = self._runner.addresses[0][:2]
+        self.url = f"http://{bound_host}:{bound_port}"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    # --- Routes ---
+
+    async def list_keys(self, request):
+        prefix = request.query.get('prefix', '')
+        keys = [key for key in self.data if key.startswith(prefix)]
+        if request.query.get('encode') == 'true':
+            keys = [quote(key, safe='') for key in keys]
+        return web.Response(text="\n".join(keys))
+
+    async def set_keys(self, request):
+        form = await request.post()
+        self.data.update((key, str(value)) for key, value in form.items())
+        return web.Response()
+
+    async def get_key(self, request):
+        value = self.data.get(request.match_info['key'])
+        if value is None:
+            raise web.HTTPNotFound()
+        return web.Response(text=value)
+
+    async def delete_key(self, request):
+        self.data.pop(request.match_info['key'], None)
+        return web.Response()
+
+
+async def serve(host: str, port: int, latency: float):
+    server = ReplitDBServer(latency)
+    url = await server.start(host, port)
+    print(f"Replit DB stand-in listening; export REPLIT_DB_URL={url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds added to every request")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.latency))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,92 @@
+import os
+from collections import OrderedDict
+
+from shop_catalog import ShopCatalog
+
+# Members whose permanent emoji is remembered
+ROLE_CACHE_SIZE = int(os.environ.get('ROLE_CACHE_SIZE', 10000))
+
+
+class RoleEmojiIndex:
+    """Maps shop roles to their nickname emoji, and nicknames to prefixes.
+
+    Built from the shop catalog: `role_id -> (priority, emoji)` for every
+    role that gives a permanent emoji (lower priority wins; `priority` in
+    the config, otherwise shop order). A member's emoji is the set
+    intersection of those role IDs with the member's role IDs, cached per
+    (guild, member) until `invalidate()` is called from on_member_update.
+    """
+
+    def __init__(self, catalog: ShopCatalog, cache_size: int = ROLE_CACHE_SIZE):
+        self.catalog = catalog
+        self.cache_size = cache_size
+        self.fingerprint = None
+        self._roles = {}  # {role_id: (priority, emoji)}
+        self._role_ids = frozenset()
+        # Longest first, so an emoji never matches as part of a longer one
+        self._permanent_prefixes = ()
+        self._temporary_prefixes = ()
+        self._members = OrderedDict()  # {(guild_id, member_id): emoji}
+        self.refresh()
+
+    def refresh(self):
+        """Rebuilds the tables if the catalog was rebuilt since last time."""
+        if self.fingerprint == self.catalog.fingerprint:
+            return
+        roles = {}
+        permanent, temporary = set(), set()
+        for position, entry in enumerate(self.catalog.entries("role")):
+            if entry.role_id is None or not entry.emoji:
+                continue
+            priority = entry.details.get("priority", position)
+            # NOTE: int() on role_id keeps IDs stored as strings working
+            roles[int(entry.role_id)] = (priority, entry.emoji)
+            permanent.add(entry.emoji)
+        for entry in self.catalog.entries("temporary"):
+            temporary.add(entry.emoji + " ")
+
+        self._roles = roles
+        self._role_ids = frozenset(roles)
+        self._permanent_prefixes = tuple(sorted(permanent, key=len, reverse=True))
+        self._temporary_prefixes = tuple(sorted(temporary, key=len, reverse=True))
+        self._members.clear()
+        self.fingerprint = self.catalog.fingerprint
+
+    # --- Members ---
+
+    def permanent_emoji(self, member) -> str:
+        """The emoji of the member's highest-priority shop role ("" if none)."""
+        key = (member.guild.id, member.id)
+        emoji = self._members.get(key)
+        if emoji is not None:
+            self._members.move_to_end(key)
+            return emoji
+
+        # discord.py keeps role IDs in member._roles; avoid building Role objects
+        role_ids = getattr(member, "_roles", None)
+        if role_ids is None:
+            role_ids = [role.id for role in member.roles]
+        owned = self._role_ids.intersection(role_ids)
+        emoji = min(self._roles[role_id] for role_id in owned)[1] if owned else ""
+
+        self._members[key] = emoji
+        if len(self._members) > self.cache_size:
+            self._members.popitem(last=False)
+        return emoji
+
+    def invalidate(self, member):
+        self._members.pop((member.guild.id, member.id), None)
+
+    # --- Nicknames ---
+
+    @staticmethod
+    def _strip_one(nick: str, prefixes) -> str:
+        for prefix in prefixes:
+            if nick.startswith(prefix):
+                return nick[len(prefix):].lstrip()
+        return nick
+
+    def strip_prefixes(self, nick: str) -> str:
+        """Removes one permanent emoji, then one temporary emoji, from the front."""
+        nick = self._strip_one(nick, self._permanent_prefixes)
+        return self._strip_one(nick, self._temporary_prefixes)
@@ -0,0 +1,54 @@
+import os
+from typing import Optional
+
+# --- Sharding Settings (set by launcher.py, or by hand) ---
+# SHARD_COUNT: total shards across every process. Unset = no sharding
+# (plain commands.Bot). "auto" = one AutoShardedBot process, with the
+# shard count Discord recommends.
+SHARD_COUNT = os.environ.get('SHARD_COUNT', '')
+# SHARD_IDS: shards run by this process, e.g. "0-3" or "0,2,4" (default: all)
+SHARD_IDS = os.environ.get('SHARD_IDS', '')
+
+
+def parse_shard_ids(text: str) -> Optional[list]:
+    """ "0-2,5" -> [0, 1, 2, 5]; "" -> None (every shard)."""
+    if not text.strip():
+        return None
+    ids = set()
+    for part in text.split(','):
+        start, _, end = part.strip().partition('-')
+        ids.update(range(int(start), int(end or start) + 1))
+    return sorted(ids)
+
+
+def shard_count() -> Optional[int]:
+    """Total shard count, or None when unset or "auto"."""
+    if SHARD_COUNT in ('', 'auto'):
+        return None
+    return int(SHARD_COUNT)
+
+
+def is_sharded() -> bool:
+    """True when the bot runs as (one of) several processes."""
+    count = shard_count()
+    if count is None:
+        return False
+    ids = parse_shard_ids(SHARD_IDS)
+    return ids is not None and len(ids) < count
+
+
+def process_tag() -> str:
+    """Suffix for backend keys that belong to this process's shards only."""
+    if not is_sharded():
+        return ""
+    return ":shards-" + SHARD_IDS.replace(',', '_')
+
+
+def bot_options() -> dict:
+    """Keyword arguments for AutoShardedBot ({} means a plain Bot)."""
+    if not SHARD_COUNT:
+        return {}
+    return {
+        'shard_count': shard_count(),
+        'shard_ids': parse_shard_ids(SHARD_IDS),
+    }
@@ -0,0 +1,234 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from wallet_store import run_blocking
+
+# --- Shared State Settings (override with environment variables) ---
+# local: this process only. sqlite: every process on this host (sharding)
+SHARED_STATE = os.environ.get('SHARED_STATE', 'local')
+SHARED_STATE_PATH = os.environ.get('SHARED_STATE_PATH', 'shared_state.db')
+# A lock whose holder died is free again after this long
+SHARED_LOCK_TTL_SECONDS = float(os.environ.get('SHARED_LOCK_TTL_SECONDS', 30))
+SHARED_LOCK_POLL_SECONDS = 0.01
+# Expired rows are deleted once every this many writes
+SHARED_PURGE_EVERY = 1000
+
+
+class SharedStateError(Exception):
+    """A shared lock could not be taken in time."""
+
+
+class SharedState:
+    """Small key-value store that every shard process agrees on.
+
+    Values are JSON-compatible. Keys can expire (`ttl`, in seconds), and
+    `add` / `pop` are atomic, which is enough to build claims, cooldowns
+    and locks on top. Implementations: LocalSharedState (one process) and
+    SQLiteSharedState (every process on one host); spreading shards over
+    several hosts needs an implementation on a network store.
+    """
+
+    async def get(self, key: str):
+        raise NotImplementedError
+
+    async def set(self, key: str, value, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    async def add(self, key: str, value, ttl: Optional[float] = None) -> bool:
+        """Sets the key only if it is missing (or expired). True if it did."""
+        raise NotImplementedError
+
+    async def pop(self, key: str):
+        """Removes the key and returns its value (None if missing)."""
+        raise NotImplementedError
+
+    async def delete_if(self, key: str, value) -> bool:
+        """Removes the key only if it still holds `value`."""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    @asynccontextmanager
+    async def lock(self, name: str, timeout: float = SHARED_LOCK_TTL_SECONDS,
+                   ttl: float = SHARED_LOCK_TTL_SECONDS):
+        """Cross-process mutex. Raises SharedStateError after `timeout`."""
+        key = "lock:" + name
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        while not await self.add(key, token, ttl):
+            if time.monotonic() >= deadline:
+                raise SharedStateError(f"timed out waiting for {key}")
+            await asyncio.sleep(SHARED_LOCK_POLL_SECONDS)
+        try:
+            yield
+        finally:
+            await self.delete_if(key, token)
+
+
+class LocalSharedState(SharedState):
+    """In-memory stand-in for a single process (the default)."""
+
+    def __init__(self):
+        self._data = {}  # {key: (value, expires_at or None)}
+        # One asyncio.Lock per name, dropped once nobody holds it
+        self._locks = weakref.WeakValueDictionary()
+
+    def _live(self, key: str):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self._data[key]
+            return None
+        return entry
+
+    async def get(self, key: str):
+        entry = self._live(key)
+        return entry[0] if entry else None
+
+    async def set(self, key: str, value, ttl: Optional[float] = None):
+        self._data[key] = (value, time.time() + ttl if ttl else None)
+
+    async def add(self, key: str, value, ttl: Optional[float] = None) -> bool:
+        # No await between the check and the set: atomic on the event loop
+        if self._live(key) is not None:
+            return False
+        self._data[key] = (value, time.time() + ttl if ttl else None)
+        return True
+
+    async def pop(self, key: str):
+        entry = self._live(key)
+        self._data.pop(key, None)
+        return entry[0] if entry else None
+
+    async def delete_if(self, key: str, value) -> bool:
+        entry = self._live(key)
+        if entry is None or entry[0] != value:
+            return False
+        del self._data[key]
+        return True
+
+    @asynccontextmanager
+    async def lock(self, name: str, timeout: float = SHARED_LOCK_TTL_SECONDS,
+                   ttl: float = SHARED_LOCK_TTL_SECONDS):
+        # One process: a plain asyncio.Lock, no polling
+        lock = self._locks.get(name)
+        if lock is None:
+            lock = self._locks[name] = asyncio.Lock()
+        try:
+            await asyncio.wait_for(lock.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise SharedStateError(f"timed out waiting for lock:{name}") from None
+        try:
+            yield
+        finally:
+            lock.release()
+
+
+class SQLiteSharedState(SharedState):
+    """Shared state in one SQLite file, for every shard process on a host.
+
+    Each call is a single statement (or a short IMMEDIATE transaction), so
+    SQLite's file locking makes `add` / `pop` atomic across processes.
+    Calls run on the wallet I/O thread pool.
+    """
+
+    def __init__(self, path: str = SHARED_STATE_PATH):
+        # isolation_level=None: transactions are opened explicitly below
+        self.conn = sqlite3.connect(path, timeout=SHARED_LOCK_TTL_SECONDS,
+                                    check_same_thread=False,
+                                    isolation_level=None)
+        self._conn_lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS state ("
+                          "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL)")
+        self._writes = 0
+
+    @staticmethod
+    def _expires(ttl):
+        return time.time() + ttl if ttl else None
+
+    def _get(self, key: str):
+        with self._conn_lock:
+            row = self.conn.execute(
+                "SELECT value FROM state WHERE key = ? AND "
+                "(expires IS NULL OR expires > ?)", (key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _purge(self):
+        # Caller holds _conn_lock
+        self._writes += 1
+        if self._writes % SHARED_PURGE_EVERY == 0:
+            self.conn.execute("DELETE FROM state WHERE expires <= ?", (time.time(), ))
+
+    def _set(self, key: str, value, ttl):
+        with self._conn_lock:
+            self._purge()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO state (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value), self._expires(ttl)))
+
+    def _add(self, key: str, value, ttl) -> bool:
+        with self._conn_lock:
+            self._purge()
+            # Replace the row only if it has expired
+            cursor = self.conn.execute(
+                "INSERT INTO state (key, value, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, "
+                "expires = excluded.expires "
+                "WHERE state.expires IS NOT NULL AND state.expires <= ?",
+                (key, json.dumps(value), self._expires(ttl), time.time()))
+            return cursor.rowcount == 1
+
+    def _pop(self, key: str):
+        with self._conn_lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT value, expires FROM state WHERE key = ?", (key, )).fetchone()
+                self.conn.execute("DELETE FROM state WHERE key = ?", (key, ))
+            finally:
+                self.conn.execute("COMMIT")
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return json.loads(row[0])
+
+    def _delete_if(self, key: str, value) -> bool:
+        with self._conn_lock:
+            cursor = self.conn.execute(
+                "DELETE FROM state WHERE key = ? AND value = ?", (key, json.dumps(value)))
+            return cursor.rowcount == 1
+
+    async def get(self, key: str):
+        return await run_blocking(self._get, key)
+
+    async def set(self, key: str, value, ttl: Optional[float] = None):
+        await run_blocking(self._set, key, value, ttl)
+
+    async def add(self, key: str, value, ttl: Optional[float] = None) -> bool:
+        return await run_blocking(self._add, key, value, ttl)
+
+    async def pop(self, key: str):
+        return await run_blocking(self._pop, key)
+
+    async def delete_if(self, key: str, value) -> bool:
+        return await run_blocking(self._delete_if, key, value)
+
+    async def close(self):
+        await run_blocking(self.conn.close)
+
+
+def make_shared_state(name: str = SHARED_STATE) -> SharedState:
+    """Builds the shared state selected by SHARED_STATE."""
+    if name == "sqlite":
+        return SQLiteSharedState(SHARED_STATE_PATH)
+    if name == "local":
+        return LocalSharedState()
+    raise ValueError(f"Unknown SHARED_STATE: {name!r}")
@@ -0,0 +1,202 @@
+import os
+
+import discord
+
+import bot_config
+
+# Most shop entries on one !shop page; a page also ends early when the
+# embed would break one of Discord's limits below
+SHOP_PAGE_SIZE = int(os.environ.get('SHOP_PAGE_SIZE', 25))
+# Discord rejects embeds past these limits
+EMBED_FIELD_LIMIT = 1024  # characters per field value
+EMBED_MAX_FIELDS = 25
+EMBED_TOTAL_LIMIT = 6000  # characters in title, description, fields, footer
+# Room kept for the "Page x/y" footer
+FOOTER_RESERVE = 100
+
+DEFAULT_EMOJI = '🎁'
+
+
+def normalize(name: str) -> str:
+    """Lower-case with single spaces, so "  Gold   Role" matches "gold role"."""
+    return " ".join(name.lower().split())
+
+
+class CatalogEntry:
+    """One thing that can be bought, sold or used, with its price precomputed."""
+
+    __slots__ = ("key", "kind", "name", "price", "currency", "currency_emoji",
+                 "emoji", "role_id", "details")
+
+    def __init__(self, key: str, kind: str, name: str, price: int,
+                 currency: str, currency_emoji: str, emoji: str,
+                 role_id=None, details=None):
+        self.key = key
+        self.kind = kind  # "item", "role" or "temporary"
+        self.name = name
+        self.price = price
+        self.currency = currency
+        self.currency_emoji = currency_emoji
+        self.emoji = emoji
+        self.role_id = role_id
+        self.details = details or {}
+
+    @property
+    def cost(self) -> tuple:
+        """(price, currency)"""
+        return self.price, self.currency
+
+
+class ShopCatalog:
+    """Lookup index and pre-rendered shop pages, built from bot_config.
+
+    Entries are found by key, display name, emoji or any `aliases` listed
+    in the config, ignoring case and extra spaces. Everything is rebuilt
+    only when `refresh()` sees that the config has changed (the config
+    dicts were replaced, e.g. by reloading bot_config); `fingerprint`
+    counts the rebuilds.
+    """
+
+    def __init__(self, page_size: int = SHOP_PAGE_SIZE):
+        self.page_size = page_size
+        self.fingerprint = 0
+        self._config = None
+        self._entries = []  # every CatalogEntry, in config order
+        self._index = {}  # {kind: {alias: CatalogEntry}}
+        self._pages = []  # embed payloads (dicts), one per page
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """Rebuilds the catalog if the config changed. Returns True if it did."""
+        config = (bot_config.item_shop, bot_config.shop_items,
+                  bot_config.TEMPORARY_ITEMS, bot_config.CURRENCY_EMOJIS)
+        # Identity checks only: this runs on every shop command
+        if self._config is not None and all(
+                new is old for new, old in zip(config, self._config)):
+            return False
+        self._build(*config)
+        self._config = config
+        self.fingerprint += 1
+        return True
+
+    def _build(self, item_shop, shop_items, temporary_items, currency_emojis):
+        entries = []
+        for key, details in item_shop.items():
+            entries.append(CatalogEntry(
+                key, "item", details['name'], details['price'], "cookie",
+                currency_emojis.get("cookie", DEFAULT_EMOJI),
+                currency_emojis.get(key, DEFAULT_EMOJI), details=details))
+        for key, details in shop_items.items():
+            currency = details.get("currency", "cookie")
+            entries.append(CatalogEntry(
+                key, "role", details['name'], details['price'], currency,
+                currency_emojis.get(currency, DEFAULT_EMOJI),
+                details.get("emoji", ""), role_id=details.get("role_id"),
+                details=details))
+        for key, details in temporary_items.items():
+            # Paid for with the item itself
+            entries.append(CatalogEntry(
+                key, "temporary", key.title(), details['cost'], key,
+                currency_emojis.get(key, DEFAULT_EMOJI), details['emoji'],
+                details=details))
+
+        index = {"item": {}, "role": {}, "temporary": {}}
+        for entry in entries:
+            aliases = [entry.key, entry.name, entry.key.replace("_", " ")]
+            aliases += entry.details.get("aliases", [])
+            if entry.kind != "temporary" and entry.emoji:
+                aliases.append(entry.emoji)
+            for alias in aliases:
+                # The first entry to claim an alias keeps it
+                index[entry.kind].setdefault(normalize(alias), entry)
+        self._entries = entries
+        self._index = index
+        self._pages = self._render_pages([e for e in entries if e.kind != "temporary"])
+
+    # --- Lookups ---
+
+    def find(self, name: str, *kinds):
+        """The first entry of the given kinds (in order) matching `name`."""
+        alias = normalize(name)
+        for kind in kinds or ("item", "role", "temporary"):
+            entry = self._index[kind].get(alias)
+            if entry is not None:
+                return entry
+        return None
+
+    def entries(self, kind: str) -> list:
+        """Every entry of one kind, in config order."""
+        return [entry for entry in self._entries if entry.kind == kind]
+
+    # --- Shop Pages ---
+
+    @property
+    def page_count(self) -> int:
+        return len(self._pages)
+
+    def page(self, number: int) -> discord.Embed:
+        """Embed for 1-based page `number` (clamped to the valid range)."""
+        number = min(max(number, 1), self.page_count)
+        return discord.Embed.from_dict(self._pages[number - 1])
+
+    def _render_pages(self, entries) -> list:
+        # Fill each page until the next entry would break an embed limit
+        chunks = [[]]
+        for entry in entries:
+            candidate = chunks[-1] + [entry]
+            if chunks[-1] and (len(candidate) > self.page_size
+                               or not _fits(self._render_page(candidate))):
+                chunks.append([entry])
+            else:
+                chunks[-1] = candidate
+
+        pages = []
+        for number, chunk in enumerate(chunks):
+            embed = self._render_page(chunk)
+            if len(chunks) > 1:
+                embed.set_footer(
+                    text=f"Page {number + 1}/{len(chunks)} • Type !shop <page> to see more.")
+            pages.append(embed.to_dict())
+        return pages
+
+    def _render_page(self, chunk) -> discord.Embed:
+        embed = discord.Embed(
+            title="🛒 Cookie Shop 🛒",
+            description="Buy items or roles with your `cookie` currency!",
+            color=discord.Color.dark_orange())
+        for title, kind in (("--- ☕ Items ☕ ---", "item"),
+                            ("--- 👑 Roles 👑 ---", "role")):
+            lines = [self._render_line(e) for e in chunk if e.kind == kind]
+            self._add_fields(embed, title, lines)
+        return embed
+
+    @staticmethod
+    def _render_line(entry: CatalogEntry) -> str:
+        if entry.kind == "item":
+            return (f"**{entry.name} {entry.emoji}**: `{entry.price}` {entry.currency_emoji}\n"
+                    f"*Type `!buy {entry.key}` to purchase or `!sell {entry.key} [amount]` to sell.*")
+        return (f"**{entry.name} ({entry.emoji})**: `{entry.price}` {entry.currency_emoji} "
+                f"({entry.currency.title()})\n*Type `!buy {entry.key}` to purchase.*")
+
+    @staticmethod
+    def _add_fields(embed: discord.Embed, title: str, lines: list):
+        # Split into several fields if one would be too long for Discord
+        value = ""
+        for line in lines:
+            candidate = f"{value}\n\n{line}" if value else line
+            if len(candidate) > EMBED_FIELD_LIMIT and value:
+                embed.add_field(name=title, value=value, inline=False)
+                title = "\u200b"  # blank name for the continuation field
+                candidate = line
+            value = candidate
+        if value:
+            embed.add_field(name=title, value=value, inline=False)
+
+
+def _fits(embed: discord.Embed) -> bool:
+    """True if Discord accepts the embed (leaving room for a page footer)."""
+    payload = embed.to_dict()
+    fields = payload.get("fields", [])
+    size = len(payload.get("title", "")) + len(payload.get("description", ""))
+    size += sum(len(field["name"]) + len(field["value"]) for field in fields)
+    return len(fields) <= EMBED_MAX_FIELDS and size <= EMBED_TOTAL_LIMIT - FOOTER_RESERVE
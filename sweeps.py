@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import os
+import time
+
+from wallet_store import WalletStore, is_wallet_key
+
+# --- Sweep Settings (override with environment variables) ---
+SWEEP_PAGE_SIZE = int(os.environ.get('SWEEP_PAGE_SIZE', 200))
+# Pause between pages; 0 still gives every other task a turn
+SWEEP_PAUSE_SECONDS = float(os.environ.get('SWEEP_PAUSE_SECONDS', 0))
+
+CHECKPOINT_PREFIX = "sweep:"
+
+log = logging.getLogger("bot.sweeps")
+
+
+class Sweep:
+    """Runs a page handler over a set of keys without hogging the event loop.
+
+    Keys are processed in sorted order, `page_size` at a time, and the
+    event loop gets a turn between pages. After every page
+    the last finished key is saved under "sweep:<name>", so a sweep that is
+    interrupted (restart, error, cancel) resumes where it stopped next time.
+
+    By default every wallet key is swept. A sweep can instead be given an
+    explicit list of keys; that list is saved in the checkpoint, and keys
+    left over from an interrupted run are merged into the next one.
+    """
+
+    def __init__(self, backend: WalletStore, name: str,
+                 page_size: int = SWEEP_PAGE_SIZE,
+                 pause: float = SWEEP_PAUSE_SECONDS):
+        self.backend = backend
+        self.name = name
+        self.page_size = page_size
+        self.pause = pause
+        self.checkpoint_key = CHECKPOINT_PREFIX + name
+
+    async def run(self, handle_page, keys=None, on_saved=None) -> dict:
+        """Awaits `handle_page(page_keys)` for every page; returns run stats.
+
+        If the handler raises, the sweep stops (the error propagates) and
+        the page is retried on the next run. `on_saved()` is awaited once
+        the key list is in the checkpoint, before the first page: from then
+        on the caller may forget the keys.
+        """
+        started = time.perf_counter()
+        checkpoint = await self.backend.get(self.checkpoint_key)
+        resumed = checkpoint is not None
+        done_through = checkpoint.get("done_through") if checkpoint else None
+
+        if keys is None:
+            all_keys = await self.backend.keys()
+            pending = sorted(key for key in all_keys if is_wallet_key(key))
+            saved_keys = None
+        else:
+            pending = set(keys)
+            if checkpoint and checkpoint.get("keys") is not None:
+                # Keys the interrupted run never reached
+                pending.update(key for key in checkpoint["keys"]
+                               if done_through is None or key > done_through)
+            pending = saved_keys = sorted(pending)
+            done_through = None  # the merged list starts from the top
+            # Save the list before starting: the caller may not have it anymore
+            await self.backend.put(self.checkpoint_key, {
+                "done_through": None,
+                "keys": saved_keys,
+            })
+        if on_saved is not None:
+            await on_saved()
+
+        if done_through is not None:
+            pending = [key for key in pending if key > done_through]
+        if resumed:
+            log.info("Resuming sweep %s (%d key(s) left).", self.name, len(pending))
+
+        pages = 0
+        for start in range(0, len(pending), self.page_size):
+            page = pending[start:start + self.page_size]
+            await handle_page(page)
+            pages += 1
+            await self.backend.put(self.checkpoint_key, {
+                "done_through": page[-1],
+                "keys": saved_keys,
+            })
+            await asyncio.sleep(self.pause)
+
+        await self.backend.delete(self.checkpoint_key)
+        return {
+            "keys": len(pending),
+            "pages": pages,
+            "resumed": resumed,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
@@ -0,0 +1,36 @@
+import asyncio
+
+from cooldowns import PersistentCooldown
+from wallet_store import CachedWalletStore, MemoryWalletStore
+
+NOW = 1_700_000_000
+
+
+def test_peek_never_reserves():
+    async def run():
+        store = CachedWalletStore(MemoryWalletStore())
+        cooldown = PersistentCooldown(store, "daily_next", 86400)
+        assert cooldown.peek("1", NOW) == 0
+        assert store.dirty_count == 0
+        assert (await store.get_wallet("1")).get("daily_next", 0) == 0
+
+        assert await cooldown.reserve("1", NOW) == 0
+        assert cooldown.peek("1", NOW + 60) == 86400 - 60
+        assert await cooldown.reserve("1", NOW + 60) == 86400 - 60
+        return await store.get_wallet("1")
+
+    assert asyncio.run(run())["daily_next"] == NOW + 86400
+
+
+def test_reservation_survives_a_restart():
+    async def run():
+        backend = MemoryWalletStore()
+        store = CachedWalletStore(backend)
+        await PersistentCooldown(store, "daily_next", 86400).reserve("1", NOW)
+        await store.flush()
+
+        restarted = PersistentCooldown(CachedWalletStore(backend), "daily_next", 86400)
+        # Not cached yet: only reserve() reads the wallet
+        return restarted.peek("1", NOW + 10), await restarted.reserve("1", NOW + 10)
+
+    assert asyncio.run(run()) == (0, 86400 - 10)
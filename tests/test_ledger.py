@@ -0,0 +1,135 @@
+import asyncio
+import importlib
+import os
+
+import pytest
+
+import bot_config
+import ledger
+import wallet_codec
+from wallet_store import CachedWalletStore, MemoryWalletStore
+
+
+@pytest.fixture
+def grown_ledger(monkeypatch):
+    """ledger as it loads after a currency is added to the config."""
+    monkeypatch.setattr(bot_config, "CURRENCIES", [*bot_config.CURRENCIES, "tea"])
+    importlib.reload(wallet_codec)
+    yield importlib.reload(ledger)
+    monkeypatch.undo()
+    importlib.reload(wallet_codec)
+    importlib.reload(ledger)
+
+
+def test_field_table_is_stored_with_the_segments(tmp_path):
+    log = ledger.Ledger(str(tmp_path))
+    log.close()
+    assert ledger.read_fields(str(tmp_path)) == list(wallet_codec.WALLET_FIELDS)
+
+
+def test_field_codes_survive_schema_growth(tmp_path, grown_ledger):
+    directory = str(tmp_path)
+    with open(os.path.join(directory, ledger.FIELDS_FILE), "w") as f:
+        f.write("cookie\nbank\n")
+
+    log = grown_ledger.Ledger(directory)
+    log.close()
+    fields = grown_ledger.read_fields(directory)
+    # Existing codes never move; new fields are appended
+    assert fields[:2] == ["cookie", "bank"]
+    assert sorted(fields) == sorted(set(grown_ledger.WALLET_FIELDS))
+    assert fields[-1] == "tea"
+
+
+def test_ledger_without_a_table_keeps_the_old_codes(tmp_path):
+    directory = str(tmp_path)
+    open(os.path.join(directory, f"{1:020d}.log"), "wb").close()
+
+    log = ledger.Ledger(directory)
+    log.close()
+    fields = ledger.read_fields(directory)
+    assert fields[-2:] == ["bank", "last_taxed"]
+    assert fields[0] == bot_config.CURRENCIES[0]
+
+
+def ledger_store(directory, backend=None):
+    store = CachedWalletStore(backend or MemoryWalletStore())
+    log = ledger.Ledger(directory)
+    store.change_hooks.append(log.record_changes)
+    return store, log
+
+
+def test_records_hold_field_deltas(tmp_path):
+    async def scenario():
+        store, log = ledger_store(str(tmp_path))
+        async with store.transaction("1", "2") as txn:
+            txn["1"]["cookie"] -= 5
+            txn["2"]["cookie"] += 5
+            txn["2"]["bank"] += 7
+        log.close()
+        return await store.get_wallet("2")
+
+    wallet = asyncio.run(scenario())
+    fields = ledger.read_fields(str(tmp_path))
+    records = [(user_id, fields[field], delta)
+               for seq, ts, user_id, delta, field, reason in ledger.iter_records(str(tmp_path))]
+    assert sorted(records) == [(1, "cookie", -5), (2, "bank", 7), (2, "cookie", 5)]
+    assert wallet["ledger_seq"] == 3
+
+
+def test_recover_replays_changes_that_never_reached_the_backend(tmp_path):
+    directory = str(tmp_path)
+
+    async def scenario():
+        backend = MemoryWalletStore()
+        store, log = ledger_store(directory, backend)
+        async with store.transaction("1") as txn:
+            txn["1"]["cookie"] = 10
+        await store.flush()
+        # Changes after the last flush are lost in a "crash"...
+        async with store.transaction("1", "2") as txn:
+            txn["1"]["cookie"] -= 4
+            txn["2"]["cookie"] += 4
+        log.close()
+
+        # ...and recovered from the ledger on the next start
+        store, log = ledger_store(directory, backend)
+        recovered = await log.recover(store)
+        await store.flush()
+        # Running it again changes nothing: ledger_seq marks what was applied
+        again = await log.recover(store)
+        wallets = await store.get_wallet("1"), await store.get_wallet("2")
+        log.close()
+        return recovered, again, wallets
+
+    recovered, again, (first, second) = asyncio.run(scenario())
+    assert recovered == 2
+    assert again == 0
+    assert (first["cookie"], second["cookie"]) == (6, 4)
+
+
+def test_snapshot_and_wallet_at(tmp_path):
+    directory = str(tmp_path)
+
+    async def scenario():
+        store, log = ledger_store(directory)
+        async with store.transaction("1") as txn:
+            txn["1"]["cookie"] = 10
+            txn["1"]["bank"] = 100
+        await store.flush()
+        path = await log.snapshot(store)
+        # After the snapshot: replayed on top of it
+        async with store.transaction("1") as txn:
+            txn["1"]["cookie"] += 5
+        log.close()
+        return path
+
+    path = asyncio.run(scenario())
+    header = ledger.read_snapshot_header(path)
+    assert header["count"] == 1
+    snapshot = dict(ledger.iter_snapshot(path))
+    assert (snapshot["1"]["cookie"], snapshot["1"]["bank"]) == (10, 100)
+
+    wallet = ledger.wallet_at("1", directory)
+    assert (wallet["cookie"], wallet["bank"]) == (15, 100)
+    assert ledger.wallet_at("404", directory) is None
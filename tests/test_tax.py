@@ -0,0 +1,75 @@
+import asyncio
+import random
+
+import numpy as np
+
+from bank_tax import TAX_INTERVAL_SECONDS, apply_bank_tax, taxed_balance
+from tax_engine import TaxEngine, tax_arrays
+from wallet_store import CachedWalletStore, MemoryWalletStore
+
+NOW = 1_700_000_000
+
+
+def baseline_tax(bank, last_taxed, now):
+    """The tax as the old daily sweep in bot_commands charged it."""
+    time_since_tax = now - last_taxed
+    if time_since_tax < TAX_INTERVAL_SECONDS:
+        return bank, last_taxed
+    days_passed = time_since_tax // TAX_INTERVAL_SECONDS
+    if bank > 0:
+        bank = int(bank * (0.97**days_passed))
+    return bank, last_taxed + days_passed * TAX_INTERVAL_SECONDS
+
+
+def random_wallets(count, seed=1):
+    rng = random.Random(seed)
+    banks = [rng.choice([0, rng.randint(1, 100), rng.randint(1, 10**12)])
+             for _ in range(count)]
+    # Up to two years of missed days, plus a few not due yet
+    gaps = [rng.randint(-TAX_INTERVAL_SECONDS, 730 * TAX_INTERVAL_SECONDS)
+            for _ in range(count)]
+    return banks, [NOW - gap for gap in gaps]
+
+
+def test_taxed_balance_matches_baseline_over_multi_day_gaps():
+    for bank in (1, 33, 100, 12345, 10**9 + 7):
+        for days in range(0, 400):
+            expected, _ = baseline_tax(bank, NOW - days * TAX_INTERVAL_SECONDS, NOW)
+            assert taxed_balance(bank, days) == expected
+
+
+def test_apply_bank_tax_matches_baseline():
+    banks, last_taxed = random_wallets(5000)
+    for bank, taxed in zip(banks, last_taxed):
+        wallet = {"bank": bank, "last_taxed": taxed}
+        apply_bank_tax(wallet, NOW)
+        assert (wallet["bank"], wallet["last_taxed"]) == baseline_tax(bank, taxed, NOW)
+
+
+def test_tax_arrays_match_baseline():
+    banks, last_taxed = random_wallets(20000, seed=2)
+    new_bank, new_last_taxed = tax_arrays(np.array(banks, dtype=np.int64),
+                                          np.array(last_taxed, dtype=np.int64), NOW)
+    expected = [baseline_tax(bank, taxed, NOW) for bank, taxed in zip(banks, last_taxed)]
+    assert list(zip(new_bank.tolist(), new_last_taxed.tolist())) == expected
+
+
+def test_tax_engine_writes_only_changed_banks():
+    async def run():
+        store = CachedWalletStore(MemoryWalletStore())
+        await store.save_many({
+            "1": {"bank": 1000, "last_taxed": NOW - 3 * TAX_INTERVAL_SECONDS},
+            "2": {"bank": 0, "last_taxed": NOW - 3 * TAX_INTERVAL_SECONDS},
+            "3": {"bank": 1000, "last_taxed": NOW},
+        })
+        await store.flush()
+        stats = await TaxEngine(store, now=NOW).run()
+        return stats, await store.get_raw_many(["1", "2", "3"])
+
+    stats, wallets = asyncio.run(run())
+    assert stats["taxed"] == 1
+    assert wallets["1"]["bank"] == int(1000 * 0.97**3)
+    assert wallets["1"]["last_taxed"] == NOW
+    # Empty banks are left for the lazy tax
+    assert wallets["2"]["last_taxed"] == NOW - 3 * TAX_INTERVAL_SECONDS
+    assert wallets["3"]["bank"] == 1000
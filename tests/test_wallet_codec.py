@@ -0,0 +1,73 @@
+import importlib
+import struct
+
+import pytest
+
+import bot_config
+import wallet_codec
+from wallet_codec import WALLET_FIELDS, decode_wallet, encode_wallet
+
+# Version 1 layout: the currencies first, then bank and last_taxed
+V1_FIELDS = (*(name for name in bot_config.CURRENCIES if name != "bank"),
+             "bank", "last_taxed")
+
+
+@pytest.fixture
+def grown_codec(monkeypatch):
+    """wallet_codec as it loads after a currency is added to the config."""
+    monkeypatch.setattr(bot_config, "CURRENCIES", [*bot_config.CURRENCIES, "tea"])
+    yield importlib.reload(wallet_codec)
+    monkeypatch.undo()
+    importlib.reload(wallet_codec)
+
+
+def sample_wallet(**extra):
+    wallet = {name: (i + 1) * 7 for i, name in enumerate(WALLET_FIELDS)}
+    wallet["last_taxed"] = 1_700_000_000
+    wallet.update(extra)
+    return wallet
+
+
+def v1_record(wallet):
+    return struct.pack("<BBB", 1, 0, len(V1_FIELDS)) + struct.pack(
+        "<" + "i" * len(V1_FIELDS), *(wallet[name] for name in V1_FIELDS))
+
+
+def test_round_trip():
+    wallet = sample_wallet(nick_emoji="☕", nick_expires=1_700_086_400,
+                           daily_next=1_700_050_000, ledger_seq=42,
+                           custom={"a": [1, 2]})
+    assert decode_wallet(encode_wallet(wallet)) == wallet
+
+
+def test_round_trip_wide_values():
+    wallet = sample_wallet(bank=2**40, cookie=-2**35)
+    record = encode_wallet(wallet)
+    assert record[1] & wallet_codec.FLAG_WIDE
+    assert decode_wallet(record) == wallet
+
+
+def test_old_record_after_schema_grows(grown_codec):
+    wallet = sample_wallet()
+    record = encode_wallet(wallet)
+
+    decoded = grown_codec.decode_wallet(record)
+    assert decoded == dict(wallet, tea=0)
+    # Re-encoded with the new layout, nothing is lost
+    decoded["tea"] = 3
+    assert grown_codec.decode_wallet(grown_codec.encode_wallet(decoded)) == decoded
+
+
+def test_version_1_record():
+    wallet = sample_wallet()
+    assert decode_wallet(v1_record(wallet)) == wallet
+
+
+def test_version_1_record_after_schema_grows(grown_codec):
+    wallet = sample_wallet()
+    assert grown_codec.decode_wallet(v1_record(wallet)) == dict(wallet, tea=0)
+
+
+def test_unknown_version():
+    with pytest.raises(ValueError):
+        decode_wallet(struct.pack("<BBB", 99, 0, 0))
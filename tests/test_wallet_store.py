@@ -0,0 +1,174 @@
+import asyncio
+
+import pytest
+
+from wallet_codec import decode_wallet
+from wallet_store import CachedWalletStore, MemoryWalletStore
+
+
+class FailingBackend(MemoryWalletStore):
+    """put_many fails while `fail` is set."""
+
+    def __init__(self):
+        super().__init__()
+        self.fail = False
+        self.puts = 0
+
+    async def put_many(self, items: dict):
+        self.puts += 1
+        if self.fail:
+            raise ConnectionError("backend down")
+        await super().put_many(items)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+# --- Transactions ---
+
+
+def test_transaction_commits_changes():
+    async def scenario():
+        store = CachedWalletStore(MemoryWalletStore())
+        async with store.transaction("1", "2") as txn:
+            txn["1"]["cookie"] -= 5
+            txn["2"]["cookie"] += 5
+        return await store.get_wallet("1"), await store.get_wallet("2"), store.dirty_count
+
+    giver, receiver, dirty = run(scenario())
+    assert (giver["cookie"], receiver["cookie"], dirty) == (-5, 5, 2)
+
+
+def test_exception_rolls_back_every_wallet():
+    async def scenario():
+        store = CachedWalletStore(MemoryWalletStore())
+        with pytest.raises(RuntimeError):
+            async with store.transaction("1", "2") as txn:
+                txn["1"]["cookie"] += 10
+                txn["2"]["cookie"] += 10
+                raise RuntimeError("boom")
+        return await store.get_wallet("1"), await store.get_wallet("2"), store.dirty_count
+
+    first, second, dirty = run(scenario())
+    assert first["cookie"] == second["cookie"] == 0
+    assert dirty == 0
+
+
+def test_rollback_discards_changes_and_hooks_see_nothing():
+    async def scenario():
+        store = CachedWalletStore(MemoryWalletStore())
+        seen = []
+        store.change_hooks.append(lambda changes, reason: seen.append(changes))
+        async with store.transaction("1") as txn:
+            txn["1"]["cookie"] += 10
+            txn.rollback()
+        return await store.get_wallet("1"), seen
+
+    wallet, seen = run(scenario())
+    assert wallet["cookie"] == 0
+    assert seen == []
+
+
+def test_locks_are_taken_in_sorted_order():
+    async def transfer(store, giver, receiver):
+        async with store.transaction(giver, receiver) as txn:
+            await asyncio.sleep(0)  # let the other transfer try to interleave
+            txn[giver]["cookie"] -= 1
+            txn[receiver]["cookie"] += 1
+
+    async def scenario():
+        store = CachedWalletStore(MemoryWalletStore())
+        assert store.transaction("b", "a", "b").user_ids == ["a", "b"]
+        # Opposite argument order would deadlock without a global lock order
+        await asyncio.wait_for(asyncio.gather(
+            *(transfer(store, "a", "b") for _ in range(50)),
+            *(transfer(store, "b", "a") for _ in range(30))), timeout=5)
+        return await store.get_wallet("a"), await store.get_wallet("b")
+
+    a, b = run(scenario())
+    assert (a["cookie"], b["cookie"]) == (-20, 20)
+
+
+def test_concurrent_transactions_on_one_wallet_do_not_lose_updates():
+    async def add_one(store):
+        async with store.transaction("1") as txn:
+            value = txn["1"]["cookie"]
+            await asyncio.sleep(0)
+            txn["1"]["cookie"] = value + 1
+
+    async def scenario():
+        store = CachedWalletStore(MemoryWalletStore())
+        await asyncio.gather(*(add_one(store) for _ in range(100)))
+        return await store.get_wallet("1")
+
+    assert run(scenario())["cookie"] == 100
+
+
+# --- Write-back cache ---
+
+
+def test_flush_writes_dirty_wallets_once():
+    async def scenario():
+        backend = FailingBackend()
+        store = CachedWalletStore(backend)
+        for amount in range(5):
+            async with store.transaction("1") as txn:
+                txn["1"]["cookie"] = amount
+        assert backend.data == {}
+        assert store.dirty_count == 1
+        flushed = await store.flush()
+        return backend, store, flushed, await store.flush()
+
+    backend, store, flushed, second = run(scenario())
+    assert (flushed, second, store.dirty_count, backend.puts) == (1, 0, 0, 1)
+    assert decode_wallet(backend.data["1"])["cookie"] == 4
+
+
+def test_failed_flush_keeps_wallets_dirty():
+    async def scenario():
+        backend = FailingBackend()
+        store = CachedWalletStore(backend)
+        await store.save_wallet("1", {"cookie": 3})
+        backend.fail = True
+        with pytest.raises(ConnectionError):
+            await store.flush()
+        dirty_after_failure = store.dirty_count
+        backend.fail = False
+        return dirty_after_failure, await store.flush(), backend
+
+    dirty_after_failure, flushed, backend = run(scenario())
+    assert (dirty_after_failure, flushed) == (1, 1)
+    assert decode_wallet(backend.data["1"])["cookie"] == 3
+
+
+def test_dirty_wallets_are_never_evicted():
+    async def scenario():
+        backend = MemoryWalletStore()
+        store = CachedWalletStore(backend, capacity=1)
+        for user_id in ("1", "2", "3"):
+            await store.save_wallet(user_id, {"cookie": int(user_id)})
+        cached_before_flush = len(store._cache)
+        await store.flush()
+        fresh = CachedWalletStore(backend)
+        return (cached_before_flush, len(store._cache),
+                [(await fresh.get_wallet(user_id))["cookie"] for user_id in ("1", "2", "3")])
+
+    cached_before_flush, cached_after_flush, stored = run(scenario())
+    assert cached_before_flush == 3
+    assert cached_after_flush == 1
+    assert stored == [1, 2, 3]
+
+
+def test_write_hooks_see_every_saved_wallet():
+    async def scenario():
+        store = CachedWalletStore(MemoryWalletStore())
+        seen = []
+        store.write_hooks.append(lambda user_id, wallet: seen.append((user_id, wallet["cookie"])))
+        async with store.transaction("1") as txn:
+            txn["1"]["cookie"] = 7
+        async with store.transaction("1"):
+            pass  # unchanged: nothing saved
+        return seen
+
+    assert run(scenario()) == [("1", 7)]
@@ -0,0 +1,45 @@
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from economy_stats import EconomySnapshot
+from web_server import WebServer
+
+
+class FakeCog:
+    def __init__(self):
+        self.economy_snapshot = EconomySnapshot()
+        self.economy_snapshot.rebuild([("1", {"cookie": 10, "bank": 5})])
+
+
+class FakeBot:
+    latency = 0.05
+    guilds = []
+
+    def get_cog(self, name):
+        return FakeCog() if name == "AllCommands" else None
+
+
+async def get_economy(token, headers=None):
+    server = WebServer(FakeBot(), economy_token=token)
+    async with TestClient(TestServer(server.app)) as client:
+        response = await client.get("/economy", headers=headers or {})
+        return response.status, await response.json() if response.status == 200 else None
+
+
+def test_economy_is_off_without_a_token():
+    status, _ = asyncio.run(get_economy(""))
+    assert status == 404
+
+
+def test_economy_needs_the_token():
+    assert asyncio.run(get_economy("secret"))[0] == 401
+    status, _ = asyncio.run(get_economy("secret", {"Authorization": "Bearer wrong"}))
+    assert status == 401
+
+
+def test_economy_with_the_token():
+    status, body = asyncio.run(get_economy("secret", {"Authorization": "Bearer secret"}))
+    assert status == 200
+    assert body["totals"]["cookie"] == 10
+    assert body["cookies_in_circulation"] == 15
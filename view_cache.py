@@ -0,0 +1,64 @@
+import os
+import time
+from collections import OrderedDict
+
+# --- View Cache Settings (override with environment variables) ---
+# Users whose rendered !bank / !balance / !check_status views are kept
+# (0 turns the cache off)
+VIEW_CACHE_SIZE = int(os.environ.get('VIEW_CACHE_SIZE', 2000))
+VIEW_CACHE_TTL = int(os.environ.get('VIEW_CACHE_TTL', 60))  # seconds
+
+
+class ViewCache:
+    """Rendered read-only views (embeds, text) per user, LRU with a TTL.
+
+    A user's views belong to one version of their wallet: the write hook
+    `wallet_changed` runs on every wallet write and drops them, so the next
+    call builds them again. Callers must store a view right after reading
+    the wallet, with nothing awaited in between, so a view can never come
+    from a wallet older than the last write.
+
+    Views also expire after `ttl` seconds, or at an earlier `expires_at`
+    given when stored (e.g. when the lazy bank tax falls due).
+    """
+
+    def __init__(self, size: int = VIEW_CACHE_SIZE, ttl: int = VIEW_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._users = OrderedDict()  # {user_id: {key: (view, expires_at)}}
+
+    def get(self, user_id: str, key):
+        """The cached view, or None (counted as a miss)."""
+        views = self._users.get(user_id)
+        entry = views.get(key) if views is not None else None
+        if entry is None or entry[1] <= time.time():
+            self.misses += 1
+            return None
+        self._users.move_to_end(user_id)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, user_id: str, key, view, expires_at=None):
+        if self.size <= 0:
+            return
+        expires = time.time() + self.ttl
+        if expires_at is not None:
+            expires = min(expires, expires_at)
+        self._users.setdefault(user_id, {})[key] = (view, expires)
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.size:
+            self._users.popitem(last=False)
+
+    def wallet_changed(self, user_id: str, wallet: dict):
+        """Write hook for CachedWalletStore."""
+        self._users.pop(user_id, None)
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self):
+        return len(self._users)
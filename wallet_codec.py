@@ -0,0 +1,183 @@
+import json
+import struct
+
+from bot_config import CURRENCIES
+
+# --- Compact Wallet Record Format ---
+#
+#   header   <BBB   version, flags, number of fixed fields
+#   fields   <i/<q  one signed int per WALLET_FIELDS entry (int64 if FLAG_WIDE)
+#   [nick]   <qH    nick_expires, emoji byte length, then the UTF-8 emoji
+#   [daily]  <q     daily_next
+#   [ledger] <Q     ledger_seq: last ledger record applied (see ledger.py)
+#   [extra]         JSON object with any other keys (rest of the record)
+#
+# The fixed layout is last_taxed and bank, then the other CURRENCIES in
+# config order. New currencies must be appended to the end of CURRENCIES
+# (never inserted, reordered or removed): older records simply have fewer
+# fields and the missing ones decode as 0.
+#
+# Version 1 records put the currencies first and bank, last_taxed last, so
+# a new currency shifted both; they are still read (see _v1_fields).
+
+WALLET_FORMAT_VERSION = 2
+
+_FIXED_FIELDS = ("last_taxed", "bank")
+_CURRENCY_FIELDS = tuple(name for name in dict.fromkeys(CURRENCIES)
+                         if name not in _FIXED_FIELDS)
+
+WALLET_FIELDS = (*_FIXED_FIELDS, *_CURRENCY_FIELDS)
+
+FLAG_WIDE = 1  # fields are int64 instead of int32
+FLAG_NICK = 2
+FLAG_DAILY = 4
+FLAG_EXTRA = 8
+FLAG_LEDGER = 16
+
+_HEADER = struct.Struct("<BBB")
+_NICK = struct.Struct("<qH")
+_DAILY = struct.Struct("<q")
+_LEDGER = struct.Struct("<Q")
+_INT32_MIN, _INT32_MAX = -2**31, 2**31 - 1
+
+_OPTIONAL_KEYS = {"nick_emoji", "nick_expires", "daily_next", "ledger_seq"}
+
+
+def _fields_struct(count: int, wide: bool) -> struct.Struct:
+    return struct.Struct("<" + ("q" if wide else "i") * count)
+
+
+def _v1_fields(count: int) -> tuple:
+    """Field names of a version 1 record with `count` fixed fields."""
+    return (*_CURRENCY_FIELDS[:count - 2], "bank", "last_taxed")
+
+
+# Pre-built for the current layout (the common case)
+_NARROW = _fields_struct(len(WALLET_FIELDS), False)
+_WIDE = _fields_struct(len(WALLET_FIELDS), True)
+
+
+def encode_wallet(wallet: dict) -> bytes:
+    values = [int(wallet.get(name, 0)) for name in WALLET_FIELDS]
+    flags = 0
+    if min(values) < _INT32_MIN or max(values) > _INT32_MAX:
+        flags |= FLAG_WIDE
+
+    tail = []
+    emoji = wallet.get("nick_emoji")
+    if emoji:
+        emoji_bytes = emoji.encode("utf-8")
+        flags |= FLAG_NICK
+        tail.append(_NICK.pack(int(wallet.get("nick_expires", 0)), len(emoji_bytes)))
+        tail.append(emoji_bytes)
+    if wallet.get("daily_next"):
+        flags |= FLAG_DAILY
+        tail.append(_DAILY.pack(int(wallet["daily_next"])))
+    if wallet.get("ledger_seq"):
+        flags |= FLAG_LEDGER
+        tail.append(_LEDGER.pack(int(wallet["ledger_seq"])))
+    extra = {
+        key: value
+        for key, value in wallet.items()
+        if key not in _OPTIONAL_KEYS and key not in WALLET_FIELDS
+    }
+    if extra:
+        flags |= FLAG_EXTRA
+        tail.append(json.dumps(extra, separators=(",", ":")).encode("utf-8"))
+
+    fields = _WIDE if flags & FLAG_WIDE else _NARROW
+    return b"".join([
+        _HEADER.pack(WALLET_FORMAT_VERSION, flags, len(WALLET_FIELDS)),
+        fields.pack(*values),
+        *tail,
+    ])
+
+
+def decode_wallet(record: bytes) -> dict:
+    version, flags, count = _HEADER.unpack_from(record)
+    if version == WALLET_FORMAT_VERSION:
+        names = WALLET_FIELDS[:count]
+    elif version == 1:
+        names = _v1_fields(count)
+    else:
+        raise ValueError(f"Unknown wallet format version: {version}")
+
+    wide = bool(flags & FLAG_WIDE)
+    if count == len(WALLET_FIELDS):
+        fields = _WIDE if wide else _NARROW
+    else:
+        fields = _fields_struct(count, wide)
+    values = fields.unpack_from(record, _HEADER.size)
+    offset = _HEADER.size + fields.size
+
+    # Fields added to CURRENCIES after this record was written are 0
+    wallet = dict.fromkeys(WALLET_FIELDS, 0)
+    wallet.update(zip(names, values))
+
+    if flags & FLAG_NICK:
+        expires, length = _NICK.unpack_from(record, offset)
+        offset += _NICK.size
+        wallet["nick_expires"] = expires
+        wallet["nick_emoji"] = record[offset:offset + length].decode("utf-8")
+        offset += length
+    if flags & FLAG_DAILY:
+        wallet["daily_next"] = _DAILY.unpack_from(record, offset)[0]
+        offset += _DAILY.size
+    if flags & FLAG_LEDGER:
+        wallet["ledger_seq"] = _LEDGER.unpack_from(record, offset)[0]
+        offset += _LEDGER.size
+    if flags & FLAG_EXTRA:
+        wallet.update(json.loads(record[offset:].decode("utf-8")))
+    return wallet
+
+
+def load_wallet(stored, fix) -> dict:
+    """Turns whatever the backend returned into a wallet dict.
+
+    `stored` is a compact record (bytes), a legacy JSON dict, or None for a
+    new user. Only the last two need the `fix` (fill in missing fields) pass.
+    """
+    if isinstance(stored, (bytes, bytearray)):
+        return decode_wallet(stored)
+    return fix(stored)
+
+
+async def migrate_json_wallets(backend, batch_size: int = 500) -> int:
+    """One-shot rewrite of every legacy JSON wallet as a compact record.
+
+    Safe to run more than once: records that are already compact are
+    skipped. Returns the number of wallets converted.
+    """
+    from wallet_store import fix_wallet, is_wallet_key
+
+    converted = 0
+    keys = [key for key in await backend.keys() if is_wallet_key(key)]
+    for start in range(0, len(keys), batch_size):
+        stored = await backend.get_many(keys[start:start + batch_size])
+        batch = {
+            key: encode_wallet(fix_wallet(value))
+            for key, value in stored.items()
+            if not isinstance(value, (bytes, bytearray))
+        }
+        if batch:
+            await backend.put_many(batch)
+            converted += len(batch)
+    return converted
+
+
+async def _migrate():
+    from wallet_store import make_backend
+
+    backend = make_backend()
+    try:
+        return await migrate_json_wallets(backend)
+    finally:
+        await backend.close()
+
+
+if __name__ == "__main__":
+    # python wallet_codec.py  -> converts the configured backend in place
+    import asyncio
+
+    count = asyncio.run(_migrate())
+    print(f"Converted {count} wallet(s) to the compact format.")
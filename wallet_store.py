@@ -0,0 +1,587 @@
+import asyncio
+import base64
+import contextvars
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import AsyncExitStack
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from bot_config import CURRENCIES
+from wallet_codec import encode_wallet, load_wallet
+
+# --- Storage Settings (override with environment variables) ---
+WALLET_BACKEND = os.environ.get('WALLET_BACKEND', 'replit')  # replit | sqlite | memory
+WALLET_SQLITE_PATH = os.environ.get('WALLET_SQLITE_PATH', 'wallets.db')
+WALLET_CACHE_SIZE = int(os.environ.get('WALLET_CACHE_SIZE', 5000))
+WALLET_FLUSH_SECONDS = int(os.environ.get('WALLET_FLUSH_SECONDS', 30))
+# Threads used for blocking backend calls (SQLite) made off the event loop
+WALLET_IO_THREADS = int(os.environ.get('WALLET_IO_THREADS', 4))
+# Wallets fetched per backend batch when scanning every wallet
+WALLET_SCAN_PAGE_SIZE = int(os.environ.get('WALLET_SCAN_PAGE_SIZE', 200))
+
+_io_executor = None
+
+
+async def run_blocking(func, *args):
+    """Runs a blocking backend call on the bounded I/O thread pool.
+
+    The caller's context variables (e.g. the metrics scope) go with it.
+    """
+    global _io_executor
+    if _io_executor is None:
+        _io_executor = ThreadPoolExecutor(max_workers=WALLET_IO_THREADS,
+                                          thread_name_prefix="wallet-io")
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        _io_executor, functools.partial(context.run, func, *args))
+
+
+def is_wallet_key(key: str) -> bool:
+    """Wallets are stored under the user's numeric Discord ID."""
+    return key.isdigit()
+
+
+def fix_wallet(wallet) -> dict:
+    """Returns a plain dict that has every currency field the commands expect."""
+    if not isinstance(wallet, dict):
+        wallet = {}
+    wallet = dict(wallet)
+    for item_name in CURRENCIES:
+        wallet.setdefault(item_name, 0)
+    wallet.setdefault("bank", 0)
+    wallet.setdefault("last_taxed", int(time.time()))
+    return wallet
+
+
+# --- Backends ---
+# Every backend stores JSON-compatible values or bytes (compact wallet
+# records, see wallet_codec.py) under string keys. All methods are
+# coroutines; only get / put_many / delete / keys have to be implemented.
+
+
+class WalletStore:
+    """Base class for a key-value backend that holds wallets (and a few bot keys)."""
+
+    async def get(self, key: str):
+        raise NotImplementedError
+
+    async def get_many(self, keys) -> dict:
+        keys = list(keys)
+        values = await asyncio.gather(*(self.get(key) for key in keys))
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    async def put(self, key: str, value):
+        await self.put_many({key: value})
+
+    async def put_many(self, items: dict):
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def keys(self, prefix: str = ""):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class ReplitWalletStore(WalletStore):
+    """Adapter for the Replit key-value store, over its HTTP API.
+
+    Uses the async client in replit_client.py, so storage calls never block
+    the event loop. Replit only stores strings, so bytes are saved as
+    BINARY_PREFIX + base64.
+    """
+
+    BINARY_PREFIX = "~"
+
+    def __init__(self, client=None):
+        if client is None:
+            from replit_client import ReplitDBClient
+            client = ReplitDBClient()
+        self.client = client
+
+    @classmethod
+    def encode_value(cls, value) -> str:
+        if isinstance(value, (bytes, bytearray)):
+            return cls.BINARY_PREFIX + base64.b64encode(value).decode("ascii")
+        return json.dumps(value)
+
+    @classmethod
+    def decode_value(cls, raw: str):
+        if raw.startswith(cls.BINARY_PREFIX):
+            return base64.b64decode(raw[len(cls.BINARY_PREFIX):])
+        return json.loads(raw)
+
+    async def get(self, key: str):
+        raw = await self.client.get_raw(key)
+        return None if raw is None else self.decode_value(raw)
+
+    async def get_many(self, keys) -> dict:
+        # Requests are pipelined over the client's connection pool
+        raw = await self.client.get_many_raw(keys)
+        return {key: self.decode_value(value) for key, value in raw.items()}
+
+    async def put_many(self, items: dict):
+        if not items:
+            return
+        # One HTTP request for the whole batch instead of one per key
+        await self.client.set_bulk_raw(
+            {key: self.encode_value(value) for key, value in items.items()})
+
+    async def delete(self, key: str):
+        await self.client.delete(key)
+
+    async def keys(self, prefix: str = ""):
+        return await self.client.keys(prefix)
+
+    async def close(self):
+        await self.client.close()
+
+
+class SQLiteWalletStore(WalletStore):
+    """Adapter for a local SQLite file (one `kv` table of JSON values).
+
+    sqlite3 is blocking, so every call runs on the I/O thread pool; the
+    connection is shared between those threads behind a lock.
+    """
+
+    def __init__(self, path: str = WALLET_SQLITE_PATH):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def _decode(value):
+        # Compact wallet records are stored as BLOBs
+        if isinstance(value, bytes):
+            return value
+        return json.loads(value)
+
+    def _get_many(self, keys: list) -> dict:
+        result = {}
+        with self.lock:
+            # Stay under SQLite's limit on query parameters
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT key, value FROM kv WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk).fetchall()
+                result.update((key, self._decode(value)) for key, value in rows)
+        return result
+
+    def _put_many(self, items: dict):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)",
+                [(key, value if isinstance(value, bytes) else json.dumps(value))
+                 for key, value in items.items()])
+
+    def _delete(self, key: str):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM kv WHERE key = ?", (key, ))
+
+    def _keys(self, prefix: str) -> list:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT key FROM kv WHERE key >= ? AND key < ? ORDER BY key",
+                (prefix, prefix + "\uffff")).fetchall()
+        return [row[0] for row in rows]
+
+    async def get(self, key: str):
+        return (await self.get_many([key])).get(key)
+
+    async def get_many(self, keys) -> dict:
+        keys = list(keys)
+        if not keys:
+            return {}
+        return await run_blocking(self._get_many, keys)
+
+    async def put_many(self, items: dict):
+        if items:
+            await run_blocking(self._put_many, items)
+
+    async def delete(self, key: str):
+        await run_blocking(self._delete, key)
+
+    async def keys(self, prefix: str = ""):
+        return await run_blocking(self._keys, prefix)
+
+
+class MemoryWalletStore(WalletStore):
+    """Process-local backend, useful for development and benchmarks."""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key: str):
+        value = self.data.get(key)
+        if value is None or isinstance(value, bytes):
+            return value
+        return json.loads(value)
+
+    async def put_many(self, items: dict):
+        for key, value in items.items():
+            self.data[key] = value if isinstance(value, bytes) else json.dumps(value)
+
+    async def delete(self, key: str):
+        self.data.pop(key, None)
+
+    async def keys(self, prefix: str = ""):
+        return [key for key in self.data if key.startswith(prefix)]
+
+
+def make_backend(name: str = WALLET_BACKEND) -> WalletStore:
+    """Builds the backend selected by WALLET_BACKEND."""
+    if name == "replit":
+        return ReplitWalletStore()
+    if name == "sqlite":
+        return SQLiteWalletStore(WALLET_SQLITE_PATH)
+    if name == "memory":
+        return MemoryWalletStore()
+    raise ValueError(f"Unknown wallet backend: {name}")
+
+
+# --- Write-back Cache ---
+
+
+class CachedWalletStore:
+    """LRU write-back cache in front of a WalletStore.
+
+    Reads are served from memory after the first load. Writes only mark the
+    wallet dirty; `flush()` sends all dirty wallets to the backend in a
+    single batch, so repeated writes to a hot wallet are merged.
+
+    With `shared` state (several shard processes, see shared_state.py) the
+    cache turns coherent instead: clean wallets are always re-read,
+    transactions also hold a cross-process lock per wallet, and their
+    changes are written through before that lock is released.
+    """
+
+    def __init__(self, backend: WalletStore, capacity: int = WALLET_CACHE_SIZE,
+                 shared=None):
+        self.backend = backend
+        self.capacity = capacity
+        self.shared = shared
+        self._cache = OrderedDict()  # {user_id: wallet}
+        self._dirty = set()
+
+        # Functions run on every read; each may update the wallet in place
+        # (e.g. lazy bank tax) and returns True if it did.
+        self.read_hooks = []
+        # Functions called as hook(user_id, wallet) after a wallet changes
+        self.write_hooks = []
+        # Functions called as hook(changes, reason) just before changed
+        # wallets are stored, with changes = {user_id: (old, new)}. They may
+        # add fields to `new` (the ledger stamps its sequence number).
+        # reason None means "whatever command or loop is running".
+        self.change_hooks = []
+
+        # One asyncio.Lock per user, dropped once no transaction holds it
+        self._locks = weakref.WeakValueDictionary()
+        # Flushes run in a thread; one at a time so an older batch can never
+        # land after a newer one
+        self._flush_lock = asyncio.Lock()
+        # Wallets whose write is in flight; they must not be evicted (and
+        # then re-read stale from the backend) until it lands
+        self._flushing = set()
+
+        # Simple counters (handy when checking how well the cache works)
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+
+    def _cached(self, user_id: str):
+        """The cached wallet, if it can be trusted (None otherwise)."""
+        wallet = self._cache.get(user_id)
+        if wallet is None or self.shared is None:
+            return wallet
+        # Another process may have changed it; only our unwritten changes count
+        if user_id in self._dirty or user_id in self._flushing:
+            return wallet
+        return None
+
+    async def get_wallet(self, user_id: str) -> dict:
+        """Returns a copy of the user's wallet (creating it if needed)."""
+        wallet = self._cached(user_id)
+        if wallet is not None:
+            self.hits += 1
+            self._cache.move_to_end(user_id)
+        else:
+            self.misses += 1
+            stored = await self.backend.get(user_id)
+            # Another task may have loaded (and changed) it while we waited
+            wallet = self._cached(user_id)
+            if wallet is None:
+                wallet = load_wallet(stored, fix_wallet)
+                self._insert(user_id, wallet)
+
+        before = dict(wallet) if self.change_hooks else None
+        changed = False
+        for hook in self.read_hooks:
+            changed = hook(wallet) or changed
+        if changed:
+            # (the lazy bank tax is the only read hook)
+            self._record_changes({user_id: (before, wallet)}, "tax")
+            # Shared mode: saving outside a transaction could overwrite
+            # another process's write; the next transaction saves it instead
+            if self.shared is None:
+                self._dirty.add(user_id)
+            self._notify(user_id, wallet)
+
+        # Callers mutate the copy and hand it back through save_wallet()
+        return dict(wallet)
+
+    async def get_many(self, user_ids) -> dict:
+        """Like get_wallet() for several users.
+
+        Wallets that are not cached are fetched with one backend multi-get,
+        so a page of a sweep doesn't pay one round trip per wallet in turn.
+        """
+        missing = [user_id for user_id in user_ids if self._cached(user_id) is None]
+        if missing:
+            stored = await self.backend.get_many(missing)
+            for user_id in missing:
+                # A command may have loaded (and changed) it while we waited
+                if self._cached(user_id) is None:
+                    self.misses += 1
+                    self._insert(user_id, load_wallet(stored.get(user_id), fix_wallet))
+        return {user_id: await self.get_wallet(user_id) for user_id in user_ids}
+
+    async def save_wallet(self, user_id: str, wallet: dict):
+        """Stores the wallet in the cache and marks it for the next flush."""
+        self._dirty.add(user_id)
+        self._insert(user_id, dict(wallet))
+        self._notify(user_id, wallet)
+
+    async def save_many(self, wallets: dict):
+        """Stores several wallets at once (they reach the backend in one flush)."""
+        self._dirty.update(wallets)
+        for user_id, wallet in wallets.items():
+            self._insert(user_id, dict(wallet))
+        for user_id, wallet in wallets.items():
+            self._notify(user_id, wallet)
+
+    async def save_changes(self, changes: dict, reason=None):
+        """Saves wallets changed outside a transaction, as one batch.
+
+        `changes` is {user_id: (old, new)}; change hooks see it just like a
+        transaction's changes (so the ledger records them).
+        """
+        self._record_changes(changes, reason)
+        await self.save_many({user_id: new for user_id, (_, new) in changes.items()})
+
+    def transaction(self, *user_ids) -> "WalletTransaction":
+        """Locks the given users' wallets for an atomic read-modify-write.
+
+        Usage:
+            async with store.transaction(giver_id, receiver_id) as txn:
+                txn[giver_id]["cookie"] -= 5
+                txn[receiver_id]["cookie"] += 5
+        """
+        return WalletTransaction(self, user_ids)
+
+    def _lock_for(self, user_id: str) -> asyncio.Lock:
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[user_id] = lock
+        return lock
+
+    async def iter_wallets(self, page_size: int = WALLET_SCAN_PAGE_SIZE,
+                           raw: bool = False):
+        """Yields `(user_id, wallet)` for every wallet without filling the cache.
+
+        Wallets are fetched a page at a time with one multi-get, and the
+        event loop gets a turn between pages. Read hooks are applied to the
+        yielded copies (unless `raw`), but nothing is saved.
+        """
+        user_ids = await self.wallet_ids()
+        for start in range(0, len(user_ids), page_size):
+            wallets = await self.get_raw_many(user_ids[start:start + page_size])
+            for user_id, wallet in wallets.items():
+                if not raw:
+                    for hook in self.read_hooks:
+                        hook(wallet)
+                yield user_id, wallet
+            await asyncio.sleep(0)
+
+    async def get_raw_many(self, user_ids) -> dict:
+        """Copies of the wallets as cached or stored: no read hooks, and
+        wallets that were not cached stay out of the cache.
+
+        Nothing is awaited after the backend read, so the result is current
+        until the caller next awaits.
+        """
+        missing = [user_id for user_id in user_ids if self._cached(user_id) is None]
+        stored = await self.backend.get_many(missing) if missing else {}
+        wallets = {}
+        for user_id in user_ids:
+            wallet = self._cached(user_id)
+            if wallet is None:
+                wallet = load_wallet(stored.get(user_id), fix_wallet)
+            wallets[user_id] = dict(wallet)
+        return wallets
+
+    async def wallet_ids(self) -> list:
+        """All wallet keys (sorted), including ones not flushed yet."""
+        keys = await self.backend.keys()
+        ids = {key for key in keys if is_wallet_key(key)}
+        ids.update(self._dirty)
+        return sorted(ids)
+
+    @property
+    def dirty_count(self) -> int:
+        return len(self._dirty)
+
+    async def flush(self) -> int:
+        """Writes every dirty wallet to the backend in one batch.
+
+        Wallets changed while the write is in flight are simply dirty again
+        and go out with the next flush.
+        """
+        async with self._flush_lock:
+            if not self._dirty:
+                return 0
+            # Encode now: read hooks may update cached wallets in place later
+            batch = {
+                user_id: encode_wallet(self._cache[user_id])
+                for user_id in self._dirty
+            }
+            self._dirty.clear()
+            self._flushing = set(batch)
+            try:
+                await self.backend.put_many(batch)
+            except BaseException:
+                # Keep them dirty so the next flush retries
+                self._dirty.update(batch)
+                raise
+            finally:
+                self._flushing = set()
+            self.flushes += 1
+            self._evict()
+            return len(batch)
+
+    async def close(self):
+        """Releases the backend's connections (call after the last flush)."""
+        await self.backend.close()
+
+    def _record_changes(self, changes: dict, reason=None):
+        for hook in self.change_hooks:
+            hook(changes, reason)
+
+    def _notify(self, user_id: str, wallet: dict):
+        for hook in self.write_hooks:
+            hook(user_id, wallet)
+
+    def _insert(self, user_id: str, wallet: dict):
+        self._cache[user_id] = wallet
+        self._cache.move_to_end(user_id)
+        self._evict()
+
+    def _evict(self):
+        # Only clean entries can be dropped; dirty ones wait for the next flush
+        excess = len(self._cache) - self.capacity
+        if excess <= 0:
+            return
+        # Oldest first, stopping as soon as enough are found (never the
+        # newest entry, which the caller is still using)
+        newest = next(reversed(self._cache))
+        victims = []
+        for user_id in self._cache:
+            if len(victims) >= excess or user_id == newest:
+                break
+            if user_id not in self._dirty and user_id not in self._flushing:
+                victims.append(user_id)
+        for user_id in victims:
+            del self._cache[user_id]
+
+
+class WalletTransaction:
+    """Commit-or-rollback access to one or more wallets.
+
+    Locks are taken in sorted user ID order so two transactions over the
+    same users can never deadlock. Leaving the block normally saves every
+    wallet that changed in a single batch; an exception (or `rollback()`)
+    discards all changes.
+    """
+
+    def __init__(self, store: CachedWalletStore, user_ids):
+        self.store = store
+        self.user_ids = sorted(set(user_ids))
+        self.wallets = {}
+        self._originals = {}
+        self._held_locks = []
+        self._shared_locks = AsyncExitStack()
+        self._rolled_back = False
+
+    def __getitem__(self, user_id: str) -> dict:
+        return self.wallets[user_id]
+
+    def rollback(self):
+        """Discard every change made in this transaction."""
+        self._rolled_back = True
+
+    async def __aenter__(self):
+        try:
+            for user_id in self.user_ids:
+                lock = self.store._lock_for(user_id)
+                await lock.acquire()
+                self._held_locks.append(lock)
+            if self.store.shared is not None:
+                for user_id in self.user_ids:
+                    await self._shared_locks.enter_async_context(
+                        self.store.shared.lock("wallet:" + user_id))
+
+            for user_id in self.user_ids:
+                wallet = await self.store.get_wallet(user_id)
+                self.wallets[user_id] = wallet
+                self._originals[user_id] = dict(wallet)
+        except BaseException:
+            await self._shared_locks.aclose()
+            self._release()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None and not self._rolled_back:
+                changed = {
+                    user_id: wallet
+                    for user_id, wallet in self.wallets.items()
+                    if wallet != self._originals[user_id]
+                }
+                if changed:
+                    self.store._record_changes({
+                        user_id: (self._originals[user_id], wallet)
+                        for user_id, wallet in changed.items()
+                    })
+                    await self.store.save_many(changed)
+                    if self.store.shared is not None:
+                        # Write through while the other processes still wait
+                        await self.store.flush()
+        finally:
+            await self._shared_locks.aclose()
+            self._release()
+        return False
+
+    def _release(self):
+        while self._held_locks:
+            self._held_locks.pop().release()
+
+
+def make_wallet_store(backend: Optional[WalletStore] = None,
+                      shared=None) -> CachedWalletStore:
+    """Returns the cached store the cog uses."""
+    return CachedWalletStore(backend or make_backend(), WALLET_CACHE_SIZE, shared)
@@ -0,0 +1,129 @@
+import hmac
+import logging
+import os
+import time
+
+from aiohttp import web
+
+import metrics
+from member_cache import LOW_MEMORY_MODE, resident_memory_bytes
+
+WEB_HOST = os.environ.get('WEB_HOST', '0.0.0.0')
+WEB_PORT = int(os.environ.get('PORT', 8080))
+# /economy is only served when this is set, to requests sending
+# "Authorization: Bearer <token>" (it reveals every balance total)
+ECONOMY_API_TOKEN = os.environ.get('ECONOMY_API_TOKEN', '')
+
+log = logging.getLogger('web')
+
+
+class WebServer:
+    """Keep-alive web server running on the bot's own event loop.
+
+    Handlers only read state already kept in memory (discord.py's guild
+    and user caches, gateway latency, the cog's economy snapshot), so they
+    never block or touch storage.
+    """
+
+    def __init__(self, bot, host: str = WEB_HOST, port: int = WEB_PORT,
+                 economy_token: str = ECONOMY_API_TOKEN):
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.economy_token = economy_token
+        self.started_at = time.time()
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.add_routes([
+            web.get('/', self.home),
+            web.get('/health', self.health),
+            web.get('/stats', self.stats),
+            web.get('/metrics', self.metrics_text),
+        ])
+        if self.economy_token:
+            self.app.add_routes([web.get('/economy', self.economy)])
+
+        metrics.REGISTRY.gauge(
+            'bot_gateway_latency_seconds', 'Discord gateway heartbeat latency.',
+            lambda: None if self._latency_ms() is None else self.bot.latency)
+        metrics.REGISTRY.gauge(
+            'bot_guilds', 'Servers the bot is in.', lambda: len(self.bot.guilds))
+        metrics.REGISTRY.gauge(
+            'bot_cached_members', 'Guild members in the discord.py cache.',
+            self._cached_members)
+        metrics.REGISTRY.gauge(
+            'process_resident_memory_bytes', 'Resident memory size in bytes.',
+            resident_memory_bytes)
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        log.info("Web server listening on port %d", self.port)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _cached_members(self) -> int:
+        # guild.members would build a list per guild on every scrape
+        return sum(len(guild._members) for guild in self.bot.guilds)
+
+    def _latency_ms(self):
+        latency = self.bot.latency
+        # latency is inf/nan until the first heartbeat
+        if latency != latency or latency == float('inf'):
+            return None
+        return round(latency * 1000)
+
+    # --- Routes ---
+
+    async def home(self, request):
+        # This is the route UptimeRobot will visit
+        return web.json_response({'status': 'Bot is alive!'})
+
+    async def health(self, request):
+        ready = self.bot.is_ready() and not self.bot.is_closed()
+        return web.json_response(
+            {
+                'status': 'ok' if ready else 'starting',
+                'latency_ms': self._latency_ms(),
+            },
+            status=200 if ready else 503)
+
+    async def stats(self, request):
+        return web.json_response({
+            'bot': str(self.bot.user) if self.bot.user else None,
+            'guilds': len(self.bot.guilds),
+            'shard_ids': getattr(self.bot, 'shard_ids', None),
+            'shard_count': getattr(self.bot, 'shard_count', None),
+            'users': len(self.bot.users),
+            'cached_members': self._cached_members(),
+            'low_memory_mode': LOW_MEMORY_MODE,
+            'rss_bytes': resident_memory_bytes(),
+            'latency_ms': self._latency_ms(),
+            'uptime_seconds': int(time.time() - self.started_at),
+        })
+
+    async def economy(self, request):
+        # Same numbers as !economy (see economy_stats.py)
+        expected = 'Bearer ' + self.economy_token
+        given = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(given.encode(), expected.encode()):
+            return web.json_response({'error': 'unauthorized'}, status=401)
+        cog = self.bot.get_cog('AllCommands')
+        snapshot = getattr(cog, 'economy_snapshot', None)
+        if snapshot is None:
+            # The cog isn't loaded (yet)
+            return web.json_response({'error': 'economy stats unavailable'},
+                                     status=503)
+        return web.json_response(snapshot.summary())
+
+    async def metrics_text(self, request):
+        # Prometheus text exposition format
+        return web.Response(text=metrics.REGISTRY.render(),
+                            content_type='text/plain',
+                            charset='utf-8')